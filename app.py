@@ -1,12 +1,112 @@
 
-from flask import Flask, request, jsonify, render_template
-from rule_engine import create_rule as create_rule_ast, evaluate_rule, combine_rules as combine_rules_logic, reconstruct_ast
-
-
-
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from rule_dataset import Dataset
+from rule_api import RuleAPI, unknown_rule as unknown_rule_error
+from rule_cache import RuleCache
+from rule_metrics import Metrics
+from rule_priority import MODES, PriorityRuleSet
+from rule_reload import RuleSetHolder
+from rule_shared import SharedRuleSet
+from rule_store import RuleStore
+from rule_trace import Tracer
+from rule_wire import WIRE_MIMETYPE
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Parsed and compiled rules, shared by all endpoints; RULE_MEMO_SIZE > 0 memoizes every rule's results
+rule_cache = RuleCache(maxsize=int(os.environ.get('RULE_CACHE_SIZE', 1024)),
+                       memo_size=int(os.environ.get('RULE_MEMO_SIZE', 0)),
+                       memo_ttl=float(os.environ['RULE_MEMO_TTL']) if os.environ.get('RULE_MEMO_TTL') else None)
+
+# Persistent rule registry; stored rules are loaded into the cache on first use
+rule_store = RuleStore(os.environ.get('RULE_STORE_PATH', 'rules.db'))
+
+# Named rules evaluated together, updated in place without pausing evaluations; with RULE_SHARED_PATH set,
+# worker processes share one memory-mapped copy and pick up each other's updates
+rule_set = SharedRuleSet(os.environ['RULE_SHARED_PATH']) if os.environ.get('RULE_SHARED_PATH') else RuleSetHolder()
+
+# Prioritized rule sets built for /api/evaluate_priority, reused while the same rules and priorities come back
+priority_sets = OrderedDict()  # ((rule_id, priority), ...) -> (CachedRule entries, PriorityRuleSet)
+priority_sets_lock = threading.Lock()
+PRIORITY_SETS = int(os.environ.get('RULE_PRIORITY_SETS', 128))
+
+# Named datasets that rules are counted against through cached per-condition bitmaps
+datasets = {}
+DATASET_BITMAPS = int(os.environ.get('RULE_DATASET_BITMAPS', 1024))
+DATASET_BYTES = int(os.environ['RULE_DATASET_BYTES']) if os.environ.get('RULE_DATASET_BYTES') else None
+
+# Prometheus metrics, recorded from the first /metrics scrape on (or from the start with RULE_METRICS=1)
+metrics = Metrics(enabled=os.environ.get('RULE_METRICS') == '1')
+
+# Evaluation traces: RULE_TRACE_SAMPLE=N traces one in N evaluations, RULE_TRACE_RULES=id,... traces those always
+tracer = Tracer(sample_every=int(os.environ.get('RULE_TRACE_SAMPLE', 0)),
+                rule_ids=[rule_id for rule_id in os.environ.get('RULE_TRACE_RULES', '').split(',') if rule_id],
+                capacity=int(os.environ.get('RULE_TRACE_BUFFER', 1000)))
+
+# The create/combine/evaluate handlers, shared with the async server (asgi.py)
+api = RuleAPI(rule_cache, rule_store, metrics, tracer)
+
+@app.before_request
+def start_request_timer():
+    g.metrics_start = metrics.start()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, response.status_code, start)
+    return response
+
+def respond(response):
+    """Turn a (status, body, headers) response from rule_api into a Flask response."""
+    status, body, headers = response
+    if isinstance(body, bytes):
+        return Response(body, status=status, headers=headers)
+    return jsonify(body), status, headers
+
+def unknown_rule(rule_id):
+    """Return the 404 response for a rule ID that is neither cached nor stored."""
+    return respond(unknown_rule_error(rule_id))
+
+def wants_wire():
+    """True if the client prefers binary AST frames (rule_wire) over JSON."""
+    return request.accept_mimetypes.best_match(['application/json', WIRE_MIMETYPE]) == WIRE_MIMETYPE
+
+def priority_rule_set(rules):
+    """Return a PriorityRuleSet of (CachedRule, priority) pairs, reusing the one built for the same list.
+
+    The set evaluates each rule with its cached compiled function, so
+    building it doesn't compile anything; it is rebuilt if any of the
+    cached rules was replaced (e.g. a stored rule was saved again).
+    """
+    key = tuple((rule.rule_id, priority) for rule, priority in rules)
+    entries = tuple(rule for rule, _ in rules)
+    with priority_sets_lock:
+        cached = priority_sets.get(key)
+        if cached is not None and all(a is b for a, b in zip(cached[0], entries)):
+            priority_sets.move_to_end(key)
+            return cached[1]
+
+    rule_set = PriorityRuleSet(compile=False)
+    for rule, priority in rules:
+        # Looked up on each call, so switching memoization on or off for the rule takes effect
+        rule_set.add(rule.rule_id, rule.ast, priority, lambda data, rule=rule: rule.evaluate(data))
+    with priority_sets_lock:
+        priority_sets[key] = (entries, rule_set)
+        while len(priority_sets) > PRIORITY_SETS:
+            priority_sets.popitem(last=False)
+    return rule_set
+
 # Home page route to render an index HTML template
 @app.route('/')
 def index():
@@ -15,94 +115,364 @@ def index():
 # Route to create a rule from a rule string and return its AST
 @app.route('/api/create_rule', methods=['POST'])
 def create_rule_endpoint():
-    try:
-        # Extract the rule string from the request body
-        rule_string = request.json.get('rule_string', '')
-
-        if not rule_string:
-            return jsonify({'error': 'Rule string cannot be empty.'}), 400
-
-        # Create the AST from the rule string
-        ast = create_rule_ast(rule_string)
-        print(f"Generated AST: {ast}")  # Debugging output
-
-        if ast is None:
-            return jsonify({"error": "Failed to create AST from rule. Please check the rule syntax."}), 400
-
-        # Return the AST as a dictionary for JSON serialization
-        return jsonify({'ast': ast.to_dict()}), 200
-    except Exception as e:
-        print(f"Error in create_rule_endpoint: {e}")  # Log the error for debugging
-        return jsonify({'error': str(e)}), 400
+    return respond(api.handle('create_rule', request.get_json(silent=True), wants_wire()))
 
 # Route to combine multiple rules and return the combined AST
 @app.route('/api/combine_rules', methods=['POST'])
 def combine_rules_endpoint():
+    return respond(api.handle('combine_rules', request.get_json(silent=True), wants_wire()))
+
+# Route to find the highest-priority rules that match a record
+@app.route('/api/evaluate_priority', methods=['POST'])
+def evaluate_priority_endpoint():
+    """Evaluate prioritized rules against data and return the matches, highest priority first.
+
+    Body: {"rules": [{"rule_string" or "rule_id": ..., "priority": n}, ...],
+    "data": {...}, "mode": "first" | "top_k" | "all", "k": n}.
+    """
     try:
-        data = request.get_json()
-        print("Received data for combining rules:", data)  # Log the incoming data
+        body = request.get_json()
+        entries = body.get('rules')
+        data = body.get('data')
+        mode = body.get('mode', 'first')
+        k = body.get('k', 1)
 
-        # Extract rules from the incoming data
-        rule_strings = data.get('rules', [])
-        if not isinstance(rule_strings, list) or not rule_strings:
+        if not isinstance(entries, list) or not entries:
             return jsonify({'error': 'No valid rules provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'data must be a JSON object.'}), 400
+        if mode not in MODES:
+            return jsonify({'error': f"mode must be one of {', '.join(MODES)}."}), 400
 
-        # Parse each rule and ensure the AST is created successfully
         rules = []
-        for rule in rule_strings:
-            if isinstance(rule, str) and rule.strip():  # Ensure rule is a non-empty string
-                ast = create_rule_ast(rule)
-                if ast is None:
-                    print(f"Failed to parse rule: {rule}")  # Debugging output
-                    return jsonify({"error": f"Failed to parse rule: {rule}"}), 400
-                rules.append(ast)
+        start = metrics.start()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                return jsonify({'error': 'Each rule needs a rule_string or rule_id and a priority.'}), 400
+            if entry.get('rule_string'):
+                rule = rule_cache.get_or_create(entry['rule_string'])
+            elif entry.get('rule_id'):
+                rule = api.lookup_rule(entry['rule_id'])
+                if rule is None:
+                    return unknown_rule(entry['rule_id'])
             else:
-                return jsonify({"error": "All rules must be non-empty strings."}), 400
+                return jsonify({'error': 'Each rule needs a rule_string or rule_id and a priority.'}), 400
+            priority = entry.get('priority', 0)
+            if isinstance(priority, bool) or not isinstance(priority, (int, float)) or math.isnan(priority):
+                return jsonify({'error': 'Priority must be a number.'}), 400
+            rules.append((rule, priority))
+        rules = priority_rule_set(rules)
+        metrics.observe('parse', start)
+
+        errors = {}
+        start = metrics.start()
+        matches = rules.evaluate(data, mode, k, errors)
+        metrics.observe('evaluate', start)
+        return jsonify({'matches': [{'rule_id': rule_id, 'priority': rules.priority(rule_id)} for rule_id in matches],
+                        'errors': errors}), 200
+    except Exception as e:
+        logger.info("Error evaluating prioritized rules: %s", e)
+        metrics.observe_error('evaluate_priority', e)
+        return jsonify({'error': str(e)}), 400
 
-        print("Parsed ASTs:", [ast.to_dict() for ast in rules])  # Log the ASTs
+# Route to evaluate a rule (AST) against provided data
+@app.route('/api/evaluate_rule', methods=['POST'])
+def evaluate_rule_endpoint():
+    # A binary body is an AST frame followed by the data as JSON
+    body = request.get_data() if request.mimetype == WIRE_MIMETYPE else request.get_json(silent=True)
+    return respond(api.handle('evaluate_rule', body))
+
+# Route to evaluate one rule against a stream of newline-delimited JSON records
+@app.route('/api/evaluate_stream', methods=['POST'])
+def evaluate_stream_endpoint():
+    """Evaluate NDJSON records and stream NDJSON results back, one line per record.
+
+    The rule is given as ?rule_id=... or by a first line holding
+    {"rule_id": ...}, {"ast": ...} or {"rule_string": ...}. Records are read
+    and answered incrementally, and a record that fails (bad JSON, missing
+    field) gets an {"line": n, "error": ...} line instead of failing the batch.
+    """
+    try:
+        lines = iter(request.stream)
+        first_line = 1
+        rule_id = request.args.get('rule_id')
+        if not rule_id:
+            first_line = 2
+            header = json.loads(next(lines, b'') or 'null')
+            if not isinstance(header, dict):
+                return jsonify({"error": "First line must name the rule (rule_id, ast or rule_string)."}), 400
+            rule_id = header.get('rule_id')
+
+        if rule_id:
+            rule = api.lookup_rule(rule_id)
+            if rule is None:
+                return unknown_rule(rule_id)
+        elif header.get('ast'):
+            rule = rule_cache.get_or_add_ast(header['ast'])
+        elif header.get('rule_string'):
+            rule = rule_cache.get_or_create(header['rule_string'])
+        else:
+            return jsonify({"error": "First line must name the rule (rule_id, ast or rule_string)."}), 400
+    except Exception as e:
+        logger.info("Error starting evaluation stream: %s", e)
+        metrics.observe_error('evaluate_stream', e)
+        return jsonify({"error": str(e)}), 400
 
-        # Check if there are valid rules to combine
-        if not rules:
-            return jsonify({'error': 'No valid rules to combine'}), 400
+    evaluate = metrics.counting(rule.rule_id, tracer.tracing(rule.rule_id, rule.ast, rule.evaluate))
+    return Response(stream_with_context(stream_results(evaluate, lines, first_line)), mimetype='application/x-ndjson')
+
+def stream_results(evaluate, lines, first_line=1, batch_size=512):
+    """Yield NDJSON result lines for NDJSON record lines, batch_size lines per chunk."""
+    results = {True: '{"result": true}\n', False: '{"result": false}\n'}
+    batch = []
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            batch.append(results[bool(evaluate(json.loads(line)))])
+        except Exception as e:
+            batch.append(json.dumps({"line": number, "error": str(e)}) + '\n')
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+# Route to store a new version of a named rule
+@app.route('/api/rules', methods=['POST'])
+def save_rule_endpoint():
+    try:
+        rule_id = request.json.get('rule_id')
+        rule_string = request.json.get('rule_string')
 
-        # Combine the rules using a logical operator (AND/OR, etc.)
-        combined_ast = combine_rules_logic(rules)
+        if not rule_id or not rule_string:
+            return jsonify({"error": "rule_id and rule_string must be provided."}), 400
 
-        # Check if combined AST is None
-        if combined_ast is None:
-            return jsonify({'error': 'Failed to combine rules.'}), 500
+        version = rule_store.save(rule_id, rule_string)
+        rule_cache.discard(rule_id)  # Evaluate the new version from now on
 
-        # Return the combined AST as a dictionary for JSON serialization
-        return jsonify({"combined_ast": combined_ast.to_dict()}), 200
+        return jsonify({"rule_id": rule_id, "version": version}), 200
     except Exception as e:
-        print(f"Error combining rules: {str(e)}")  # Debugging output
-        return jsonify({"error": str(e)}), 500
+        logger.info("Error saving rule: %s", e)
+        metrics.observe_error('save_rule', e)
+        return jsonify({"error": str(e)}), 400
 
-# Route to evaluate a rule (AST) against provided data
-@app.route('/api/evaluate_rule', methods=['POST'])
-def evaluate_rule_endpoint():
+# Route to store many named rules in one transaction
+@app.route('/api/rules/import', methods=['POST'])
+def import_rules_endpoint():
+    try:
+        rules = request.json.get('rules')
+
+        if not isinstance(rules, list) or not rules:
+            return jsonify({"error": "No valid rules provided"}), 400
+        if not all(isinstance(rule, dict) and rule.get('rule_id') and rule.get('rule_string') for rule in rules):
+            return jsonify({"error": "Each rule needs a rule_id and a rule_string."}), 400
+
+        versions = rule_store.import_rules((rule['rule_id'], rule['rule_string']) for rule in rules)
+        for rule_id in versions:
+            rule_cache.discard(rule_id)
+
+        return jsonify({"versions": versions}), 200
+    except Exception as e:
+        logger.info("Error importing rules: %s", e)
+        metrics.observe_error('import_rules', e)
+        return jsonify({"error": str(e)}), 400
+
+# Route to show the live rule set's version and rule IDs
+@app.route('/api/rule_set', methods=['GET'])
+def rule_set_endpoint():
+    current = rule_set.current
+    return jsonify({"version": current.version, "rule_ids": list(current.sources)}), 200
+
+# Route to change the live rule set: {"rules": {...}} replaces it, add/replace/remove apply a diff
+@app.route('/api/rule_set', methods=['POST'])
+def update_rule_set_endpoint():
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object."}), 400
+
+        if 'rules' in data:
+            if not isinstance(data['rules'], dict):
+                return jsonify({"error": "rules must map rule IDs to rule strings or ASTs."}), 400
+            version = rule_set.load(data['rules'])
+        else:
+            if not isinstance(data.get('add', {}), dict) or not isinstance(data.get('replace', {}), dict) \
+                    or not isinstance(data.get('remove', []), list):
+                return jsonify({"error": "add and replace must be objects and remove a list."}), 400
+            version = rule_set.update(data.get('add'), data.get('replace'), data.get('remove'))
+
+        return jsonify({"version": version, "rules": len(rule_set.current)}), 200
+    except Exception as e:
+        logger.info("Error updating rule set: %s", e)
+        metrics.observe_error('update_rule_set', e)
+        return jsonify({"error": str(e)}), 400
+
+# Route to evaluate a record against every rule of the live rule set
+@app.route('/api/rule_set/evaluate', methods=['POST'])
+def evaluate_rule_set_endpoint():
     try:
-        # Extract the AST and data from the request body
-        ast_data = request.json.get('ast')
         data = request.json.get('data')
+        if not isinstance(data, dict):
+            return jsonify({"error": "data must be a JSON object."}), 400
+
+        current = rule_set.current  # Finish on this version even if a new one is published meanwhile
+        errors = {}
+        start = metrics.start()
+        matches = current.evaluate(data, errors)
+        metrics.observe('evaluate', start)
+        return jsonify({"version": current.version, "matches": matches, "errors": errors}), 200
+    except Exception as e:
+        logger.info("Error evaluating rule set: %s", e)
+        metrics.observe_error('evaluate_rule_set', e)
+        return jsonify({"error": str(e)}), 400
 
-        if not ast_data or not data:
-            return jsonify({"error": "AST and data must be provided."}), 400
-        
-        # Reconstruct the AST from the provided dictionary
-        ast = reconstruct_ast(ast_data)
+# Route to turn result memoization on (or off, with maxsize 0) for one rule
+@app.route('/api/rules/memo', methods=['POST'])
+def memoize_rule_endpoint():
+    try:
+        rule_id = request.json.get('rule_id')
+        maxsize = request.json.get('maxsize', 10000)
+        ttl = request.json.get('ttl')
+
+        if not rule_id:
+            return jsonify({"error": "rule_id must be provided."}), 400
+        if not isinstance(maxsize, int) or maxsize < 0:
+            return jsonify({"error": "maxsize must be a non-negative integer."}), 400
+        if ttl is not None and (not isinstance(ttl, (int, float)) or ttl <= 0):
+            return jsonify({"error": "ttl must be a positive number of seconds."}), 400
+
+        rule_cache.memoize(rule_id, maxsize, ttl)
+        return jsonify({"rule_id": rule_id, "maxsize": maxsize, "ttl": ttl}), 200
+    except Exception as e:
+        logger.info("Error configuring memoization: %s", e)
+        metrics.observe_error('memoize_rule', e)
+        return jsonify({"error": str(e)}), 400
 
-        # Evaluate the rule against the input data
-        result = evaluate_rule(ast, data)
+# Route to report per-rule memoization hit rates
+@app.route('/api/memo_stats', methods=['GET'])
+def memo_stats_endpoint():
+    return jsonify(rule_cache.memo_stats()), 200
+
+# Route to read buffered evaluation traces, newest first (?rule_id=...&limit=...)
+@app.route('/api/traces', methods=['GET'])
+def traces_endpoint():
+    limit = request.args.get('limit', type=int)
+    traces = tracer.traces(request.args.get('rule_id'), limit)
+    return jsonify({"sample_every": tracer.sample_every, "rule_ids": sorted(tracer.rule_ids), "traces": traces}), 200
+
+# Route to change trace sampling: {"sample_every": N (0 = off), "rule_ids": [...]}
+@app.route('/api/traces/config', methods=['POST'])
+def trace_config_endpoint():
+    try:
+        rule_ids = request.json.get('rule_ids')
+        if rule_ids is not None and not isinstance(rule_ids, list):
+            return jsonify({"error": "rule_ids must be a list."}), 400
+        tracer.configure(request.json.get('sample_every'), rule_ids)
+        return jsonify({"sample_every": tracer.sample_every, "rule_ids": sorted(tracer.rule_ids)}), 200
+    except Exception as e:
+        logger.info("Error configuring tracing: %s", e)
+        metrics.observe_error('trace_config', e)
+        return jsonify({"error": str(e)}), 400
+
+# Route to add rows to a dataset, creating it on first use: {"rows": [{...}, ...]}
+@app.route('/api/datasets/<name>/rows', methods=['POST'])
+def append_rows_endpoint(name):
+    try:
+        rows = request.json.get('rows')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return jsonify({"error": "rows must be a list of JSON objects."}), 400
+
+        dataset = datasets.get(name)
+        if dataset is None:
+            dataset = datasets.setdefault(name, Dataset(maxsize=DATASET_BITMAPS, max_bytes=DATASET_BYTES))
+        row_ids = dataset.append(rows)
+        return jsonify({"first_row_id": row_ids.start, "rows": len(dataset)}), 200
+    except Exception as e:
+        logger.info("Error adding rows to dataset %s: %s", name, e)
+        metrics.observe_error('append_rows', e)
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify({"result": result}), 200
+# Route to replace rows of a dataset: {"rows": {"<row ID>": {...}, ...}}
+@app.route('/api/datasets/<name>/rows', methods=['PUT'])
+def update_rows_endpoint(name):
+    try:
+        dataset = datasets.get(name)
+        if dataset is None:
+            return jsonify({"error": f"Unknown dataset '{name}'."}), 404
+        rows = request.json.get('rows')
+        if not isinstance(rows, dict) or not all(row_id.isdigit() for row_id in rows):
+            return jsonify({"error": "rows must map row IDs to JSON objects."}), 400
+
+        dataset.update({int(row_id): row for row_id, row in rows.items()})
+        return jsonify({"updated": len(rows), "rows": len(dataset)}), 200
     except Exception as e:
-        print(f"Error evaluating rule: {str(e)}")  # Debugging output
+        logger.info("Error updating rows of dataset %s: %s", name, e)
+        metrics.observe_error('update_rows', e)
         return jsonify({"error": str(e)}), 400
 
+# Route to count (or list, with "row_ids": true) the rows of a dataset that a rule matches
+@app.route('/api/datasets/<name>/query', methods=['POST'])
+def query_dataset_endpoint(name):
+    """Body: {"rule_string" or "rule_id": ..., "row_ids": false}.
+
+    Returns the match count and the number of rows the rule can't be
+    evaluated on; with row_ids, the matching row IDs and an error message
+    per failing row as well.
+    """
+    try:
+        dataset = datasets.get(name)
+        if dataset is None:
+            return jsonify({"error": f"Unknown dataset '{name}'."}), 404
+        body = request.get_json()
+        if body.get('rule_string'):
+            rule = rule_cache.get_or_create(body['rule_string'])
+        elif body.get('rule_id'):
+            rule = api.lookup_rule(body['rule_id'])
+            if rule is None:
+                return unknown_rule(body['rule_id'])
+        else:
+            return jsonify({"error": "rule_string or rule_id must be provided."}), 400
+
+        errors = {}
+        start = metrics.start()
+        if body.get('row_ids'):
+            row_ids = dataset.row_ids(rule.ast, errors)
+            response = {"count": len(row_ids), "row_ids": row_ids, "errors": errors}
+        else:
+            response = {"count": dataset.count(rule.ast, errors)}
+        metrics.observe('query', start)
+        response.update(rule_id=rule.rule_id, error_count=len(errors))
+        return jsonify(response), 200
+    except Exception as e:
+        logger.info("Error querying dataset %s: %s", name, e)
+        metrics.observe_error('query_dataset', e)
+        return jsonify({"error": str(e)}), 400
+
+# Route to report a dataset's bitmap cache hit rate and query latencies
+@app.route('/api/datasets/<name>/stats', methods=['GET'])
+def dataset_stats_endpoint(name):
+    dataset = datasets.get(name)
+    if dataset is None:
+        return jsonify({"error": f"Unknown dataset '{name}'."}), 404
+    return jsonify(dataset.stats()), 200
+
+# Route to report rule cache hit/miss/eviction counters
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats_endpoint():
+    return jsonify(rule_cache.stats()), 200
+
+# Route to expose metrics in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    metrics.enabled = True  # Start recording once something is scraping
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Start the Flask application
 if __name__ == '__main__':
-    app.run(debug=True)
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
 
 
 
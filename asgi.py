@@ -0,0 +1,212 @@
+"""Async serving mode: an ASGI app that runs rule work in a process pool.
+
+Requests are handled on an event loop; parsing and evaluation are sent to a
+pool of worker processes, each with its own rule cache and with stored
+rules preloaded. Requests are answered by the same handlers as app.py
+(rule_api), so responses match the Flask app's, including "optimize" and
+binary AST frames (rule_wire). Serve it with any ASGI server, e.g.
+
+    uvicorn asgi:app
+
+Configuration (environment variables):
+    RULE_WORKERS       worker processes (default: CPU count)
+    RULE_MAX_PENDING   requests queued or running before new ones get a 503
+                       (default: 64 per worker)
+    RULE_MAX_BODY      largest request body accepted, in bytes; larger ones
+                       get a 413 (default 10 MiB)
+    RULE_STORE_PATH    rule store to preload in every worker (default rules.db)
+    RULE_CACHE_SIZE    rules cached per worker (default 1024)
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from rule_api import RuleAPI
+from rule_cache import RuleCache
+from rule_store import RuleStore
+from rule_wire import WIRE_MIMETYPE, decode_wire
+
+# Per-process state, set up in each worker by _init_worker
+_api = None
+
+def _init_worker(store_path, cache_size):
+    """Open the rule store and compile stored rules into this worker's cache.
+
+    The store keeps no record of which rules are used, so if it holds more
+    than cache_size rules, an arbitrary cache_size of them (the first the
+    store returns) are preloaded; the rest are loaded on first use.
+    """
+    global _api
+    cache = RuleCache(maxsize=cache_size)
+    store = RuleStore(store_path)
+    stored = store.load_all()
+    for rule_id in list(stored)[:cache_size]:
+        cache.add(stored[rule_id], rule_id=rule_id)
+    _api = RuleAPI(cache, store)
+
+def _handle(name, *args):
+    """Answer a request in this worker with the rule_api handler called name."""
+    return _api.handle(name, *args)
+
+def _wants_wire(headers):
+    """True if the Accept header rates binary AST frames above JSON, as app.wants_wire does."""
+    quality = {}
+    for item in headers.get('accept', '').split(','):
+        media, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[media.strip()] = q
+
+    def rate(mimetype):
+        return quality.get(mimetype, quality.get(mimetype.split('/')[0] + '/*', quality.get('*/*', 0.0)))
+    return rate(WIRE_MIMETYPE) > rate('application/json')
+
+class RuleServer:
+    """ASGI application serving the rule API from a process pool."""
+
+    def __init__(self, workers=None, max_pending=None, store_path=None, cache_size=None, max_body=None):
+        self.workers = workers or int(os.environ.get('RULE_WORKERS', 0)) or os.cpu_count() or 1
+        self.max_pending = max_pending or int(os.environ.get('RULE_MAX_PENDING', 0)) or 64 * self.workers
+        self.max_body = max_body or int(os.environ.get('RULE_MAX_BODY', 0)) or 10 * 1024 * 1024
+        self.store_path = store_path or os.environ.get('RULE_STORE_PATH', 'rules.db')
+        self.cache_size = cache_size or int(os.environ.get('RULE_CACHE_SIZE', 1024))
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+        # Serialized ASTs of rules created through this server, so a worker that
+        # hasn't seen a rule ID yet can be sent the AST.
+        self._asts = OrderedDict()
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.store_path, self.cache_size))
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            status, body, headers = await self._handle(scope, receive)
+            headers = {name.lower(): value for name, value in headers.items()}
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+                headers['content-type'] = 'application/json'
+            headers['content-length'] = str(len(body))
+            if status == 503:
+                headers['retry-after'] = '1'
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in headers.items()]})
+            await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, scope, receive):
+        route = (scope['method'], scope['path'])
+        if route not in ROUTES:
+            return 404, {'error': 'Not found.'}, {}
+
+        # Backpressure: refuse work, before reading any of it, instead of queueing without bound.
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {'error': 'Server busy, try again later.'}, {}
+        self.pending += 1
+        try:
+            chunks = []
+            size = 0
+            while True:
+                message = await receive()
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > self.max_body:
+                    return 413, {'error': f"Request body is larger than {self.max_body} bytes."}, {}
+                chunks.append(chunk)
+                if not message.get('more_body'):
+                    break
+            body = b''.join(chunks)
+
+            headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                       for name, value in scope.get('headers', [])}
+            if headers.get('content-type', '').partition(';')[0].strip() == WIRE_MIMETYPE:
+                request = body
+            else:
+                try:
+                    request = json.loads(body or b'{}')
+                except ValueError as e:
+                    return 400, {'error': f"Invalid JSON: {e}"}, {}
+            return await getattr(self, ROUTES[route])(request, headers)
+        finally:
+            self.pending -= 1
+
+    async def _submit(self, name, *args):
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, _handle, name, *args)
+
+    def _remember(self, body, headers, key):
+        """Keep the AST of a rule a worker returned, under its rule ID."""
+        if isinstance(body, bytes):
+            rule_id = headers.get('X-Rule-Id')
+            ast = decode_wire(body)[0].to_dict() if rule_id else None
+        else:
+            rule_id = body.get('rule_id')
+            ast = body.get(key)
+        if rule_id:
+            self._asts[rule_id] = ast
+            self._asts.move_to_end(rule_id)
+            while len(self._asts) > self.cache_size:
+                self._asts.popitem(last=False)
+
+    async def create_rule(self, request, headers):
+        status, body, response_headers = await self._submit('create_rule', request, _wants_wire(headers))
+        self._remember(body, response_headers, 'ast')
+        return status, body, response_headers
+
+    async def combine_rules(self, request, headers):
+        status, body, response_headers = await self._submit('combine_rules', request, _wants_wire(headers))
+        self._remember(body, response_headers, 'combined_ast')
+        return status, body, response_headers
+
+    async def evaluate_rule(self, request, headers):
+        response = await self._submit('evaluate_rule', request)
+        rule_id = request.get('rule_id') if isinstance(request, dict) else None
+        if response[0] == 404 and isinstance(rule_id, str) and rule_id in self._asts:
+            # The rule was created through another worker; send its AST along.
+            response = await self._submit('evaluate_rule', {'ast': self._asts[rule_id], 'data': request.get('data')})
+        return response
+
+    async def stats(self, request, headers):
+        return 200, {'workers': self.workers, 'max_pending': self.max_pending,
+                     'pending': self.pending, 'rejected': self.rejected}, {}
+
+ROUTES = {
+    ('POST', '/api/create_rule'): 'create_rule',
+    ('POST', '/api/combine_rules'): 'combine_rules',
+    ('POST', '/api/evaluate_rule'): 'evaluate_rule',
+    ('GET', '/api/server_stats'): 'stats',
+}
+
+app = RuleServer()
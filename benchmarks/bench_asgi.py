@@ -0,0 +1,69 @@
+"""Measure asgi.RuleServer throughput as the worker pool grows.
+
+Calls the ASGI app in-process (no HTTP server), keeping `concurrency`
+requests in flight. Each request parses a distinct 40-clause rule, so the
+work is CPU-bound and should scale with worker processes up to the core count.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_asgi [requests]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from asgi import RuleServer
+
+def make_rule(i):
+    return " AND ".join(f"(age > {i + k} OR department = 'D{k}')" for k in range(40))
+
+async def call(app, path, payload):
+    body = json.dumps(payload).encode('utf-8')
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': 'POST', 'path': path}, receive, send)
+    return sent[0]['status']
+
+async def run(workers, requests, store_path, concurrency=64):
+    app = RuleServer(workers=workers, max_pending=concurrency, store_path=store_path)
+    app.start()
+    # Warm the pool so process start-up isn't measured.
+    await asyncio.gather(*(call(app, '/api/create_rule', {'rule_string': 'age > 1'}) for _ in range(workers)))
+
+    queue = list(range(requests))
+    statuses = []
+
+    async def client():
+        while queue:
+            statuses.append(await call(app, '/api/create_rule', {'rule_string': make_rule(queue.pop())}))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    app.stop()
+    assert statuses.count(200) == requests
+    return requests / elapsed
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, 'rules.db')
+        baseline = None
+        for workers in counts:
+            throughput = asyncio.run(run(workers, requests, store_path))
+            baseline = baseline or throughput
+            print(f"{workers:3} workers: {throughput:8.0f} requests/s  ({throughput / baseline:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark bytecode programs against Node trees: memory per rule and evaluation speed.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bytecode [rule_count]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench_rule_set import make_records, make_rules
+from rule_bytecode import ConstantPool, compile_bytecode
+from rule_engine import compile_rule, create_rule, evaluate_rule
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    texts = dict(make_rules(count))
+    records = make_records(20)
+
+    tracemalloc.start()
+    asts = {rule_id: create_rule(text) for rule_id, text in texts.items()}
+    node_memory = tracemalloc.get_traced_memory()[0]
+    pool = ConstantPool()
+    programs = {rule_id: compile_bytecode(ast, pool) for rule_id, ast in asts.items()}
+    del asts
+    program_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    asts = {rule_id: create_rule(text) for rule_id, text in texts.items()}
+    for rule_id, ast in asts.items():
+        assert programs[rule_id].to_ast().to_dict() == ast.to_dict()
+    print(f"{count} rules, {len(pool)} pooled constants")
+    print(f"memory: Node trees {node_memory / count:.0f} bytes/rule, "
+          f"bytecode {program_memory / count:.0f} bytes/rule ({node_memory / program_memory:.1f}x smaller)")
+
+    compiled = {rule_id: compile_rule(ast) for rule_id, ast in asts.items()}
+    expected = None
+    for label, evaluate in (("evaluate_rule", lambda rule_id, record: evaluate_rule(asts[rule_id], record)),
+                            ("bytecode", lambda rule_id, record: programs[rule_id](record)),
+                            ("compile_rule", lambda rule_id, record: compiled[rule_id](record))):
+        start = time.perf_counter()
+        results = [[rule_id for rule_id in texts if evaluate(rule_id, record)] for record in records]
+        elapsed = (time.perf_counter() - start) / (len(records) * count)
+        expected = expected or results
+        assert results == expected
+        print(f"{label:<14} {elapsed * 1e6:6.2f} us/evaluation")
+
+if __name__ == '__main__':
+    main()
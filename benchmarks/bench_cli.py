@@ -0,0 +1,43 @@
+"""Measure rule_cli throughput on a generated JSONL file as the number of worker processes grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cli [records]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generators import make_records, make_rule
+from rule_cli import run
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rule = make_rule(clauses=16, depth=2, fields=8)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'records.jsonl')
+        with open(path, 'w') as f:
+            # Repeat a block of generated records rather than generating them all.
+            block = ''.join(json.dumps(record) + '\n' for record in make_records(10000, fields=8))
+            for _ in range(count // 10000):
+                f.write(block)
+        size = os.path.getsize(path)
+
+        cores = os.cpu_count() or 1
+        worker_counts = sorted({1, 2, cores} | {n for n in (4, 8, 16) if n < cores})
+        print(f"{size / 2**20:.0f} MiB, {cores} CPU(s)")
+        baseline = None
+        for workers in worker_counts:
+            with open(os.devnull, 'wb') as output:
+                start = time.perf_counter()
+                totals = run(path, ('text', rule), output, workers=workers)
+                elapsed = time.perf_counter() - start
+            rate = totals['records'] / elapsed
+            baseline = baseline or rate
+            print(f"{workers:3} worker(s): {rate:10.0f} records/s ({size / elapsed / 2**20:6.1f} MiB/s, "
+                  f"{rate / baseline:4.1f}x)")
+
+if __name__ == '__main__':
+    main()
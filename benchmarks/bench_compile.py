@@ -0,0 +1,56 @@
+"""Benchmark compiled rules against the tree-walking evaluate_rule.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compile
+"""
+import contextlib
+import io
+import random
+import timeit
+
+from rule_engine import create_rule, combine_rules, compile_rule, evaluate_rule
+
+RULES = [
+    "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000 OR experience > 5)",
+    "(age > 30 AND department = 'Sales')",
+    "(age < 25 AND department = 'Marketing')",
+    "(salary > 50000 OR experience > 5)",
+]
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+    departments = ['Sales', 'Marketing', 'Engineering', 'Finance']
+    return [
+        {
+            'age': rng.randint(18, 65),
+            'department': rng.choice(departments),
+            'salary': rng.randint(20000, 120000),
+            'experience': rng.randint(0, 30),
+        }
+        for _ in range(count)
+    ]
+
+def run(label, ast, records, repeat=5):
+    compiled = compile_rule(ast)
+    for record in records:
+        assert compiled(record) == evaluate_rule(ast, record)
+
+    walk = min(timeit.repeat(lambda: [evaluate_rule(ast, r) for r in records], number=1, repeat=repeat))
+    fast = min(timeit.repeat(lambda: [compiled(r) for r in records], number=1, repeat=repeat))
+    per_record = 1e6 / len(records)
+    print(f"{label:<28} evaluate_rule {walk * per_record:8.2f} us/record   "
+          f"compile_rule {fast * per_record:8.2f} us/record   speedup {walk / fast:5.1f}x")
+
+def main():
+    records = make_records(20000)
+    with contextlib.redirect_stdout(io.StringIO()):
+        asts = [create_rule(rule) for rule in RULES]
+        combined = combine_rules([create_rule(rule) for rule in RULES * 50])
+
+    run("sample rule", asts[0], records)
+    run("single AND clause", asts[1], records)
+    run("combined (200 rules)", combined, records[:2000])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark counting rule matches over a fixed dataset: compiled rules per row vs cached bitmaps (Dataset).
+
+The rules are many variations over the same few fields and values, so
+they share most of their conditions. Run from the repository root:
+
+    python -m benchmarks.bench_dataset [rows] [rules]
+"""
+import sys
+import time
+
+from benchmarks.generators import make_records, make_rules
+from rule_dataset import Dataset
+from rule_engine import compile_rule, create_rule
+
+def count_rows(rule, records):
+    count = 0
+    for record in records:
+        if rule(record):
+            count += 1
+    return count
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    options = dict(fields=6, cardinality=10)
+    records = make_records(count, **options)
+    rules = [create_rule(text) for text in make_rules(rule_count, clauses=8, depth=2, **options)]
+
+    scan = 0.0
+    expected = []
+    for ast in rules:
+        result, seconds = timed(count_rows, compile_rule(ast), records)
+        expected.append(result)
+        scan += seconds
+
+    dataset = Dataset(records)
+    cold = warm = 0.0
+    for ast, matches in zip(rules, expected):
+        result, seconds = timed(dataset.count, ast)
+        assert result == matches
+        cold += seconds
+    stats = dataset.stats()
+    for ast in rules:
+        warm += timed(dataset.count, ast)[1]
+
+    print(f"{count} rows, {rule_count} rules sharing {stats['bitmaps']} conditions, per query:")
+    print(f"  compiled rule per row     {scan / rule_count * 1e3:8.2f} ms")
+    print(f"  Dataset, first pass       {cold / rule_count * 1e3:8.2f} ms  (hit rate {stats['hit_rate']:.0%})")
+    print(f"  Dataset, cached bitmaps   {warm / rule_count * 1e3:8.2f} ms  ({dataset.stats()['bytes'] / 1024:.0f} KiB of bitmaps)")
+
+    updates = {row_id: dict(records[row_id], field0='v0') for row_id in range(0, count, count // 100)}
+    _, seconds = timed(dataset.update, updates)
+    _, requery = timed(dataset.count, rules[0])
+    print(f"  after updating {len(updates)} rows: update {seconds * 1e3:.2f} ms, next query {requery * 1e3:.2f} ms "
+          f"({dataset.stats()['chunks_invalidated']} bitmap chunks made stale)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compare RuleIndex.match with a full RuleSet scan as the rule count grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_index
+"""
+import contextlib
+import io
+import random
+import time
+
+from rule_engine import create_rule
+from rule_index import RuleIndex
+from rule_set import RuleSet
+
+TEAMS = [f"team-{i}" for i in range(2000)]
+
+def make_rules(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        if i % 10 == 0:
+            # Some rules only have numeric conditions.
+            text = f"salary > {rng.randint(100, 200) * 1000} AND experience > {rng.randint(0, 30)}"
+        else:
+            text = f"team = '{rng.choice(TEAMS)}' AND (age > {rng.randint(18, 60)} OR experience > {rng.randint(0, 20)})"
+        yield f"rule-{i}", text
+
+def make_records(count, seed=1):
+    rng = random.Random(seed)
+    return [{'team': rng.choice(TEAMS), 'age': rng.randint(18, 65),
+             'salary': rng.randint(20000, 200000), 'experience': rng.randint(0, 30)}
+            for _ in range(count)]
+
+def main():
+    records = make_records(200)
+    for count in (1000, 4000, 16000):
+        with contextlib.redirect_stdout(io.StringIO()):
+            asts = {rule_id: create_rule(text) for rule_id, text in make_rules(count)}
+        rule_set = RuleSet(asts)
+        index = RuleIndex(asts)
+
+        start = time.perf_counter()
+        expected = [rule_set.evaluate(record) for record in records]
+        scan = (time.perf_counter() - start) / len(records)
+
+        start = time.perf_counter()
+        actual = [index.match(record) for record in records]
+        indexed = (time.perf_counter() - start) / len(records)
+
+        assert actual == expected
+        candidates = sum(len(index.candidates(record)) for record in records) / len(records)
+        print(f"{count:6} rules: full scan {scan * 1e6:9.1f} us   index {indexed * 1e6:8.1f} us   "
+              f"avg candidates {candidates:7.1f}")
+
+if __name__ == '__main__':
+    main()
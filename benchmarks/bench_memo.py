@@ -0,0 +1,51 @@
+"""Benchmark memoized rule results (MemoizedRule) against the plain compiled rule.
+
+Records repeat on the fields the rule reads but all differ in an extra
+`request_id` field. Run from the repository root:
+
+    python -m benchmarks.bench_memo [records]
+"""
+import sys
+import time
+
+from benchmarks.generators import make_records, make_rule
+from rule_engine import compile_rule, create_rule
+from rule_memo import MemoizedRule
+
+def per_record(function, records):
+    start = time.perf_counter()
+    for record in records:
+        function(record)
+    return (time.perf_counter() - start) / len(records)
+
+def full_scan_rule(clauses, fields=4):
+    """A rule whose every condition is evaluated (an AND of conditions that hold), so nothing short-circuits."""
+    return ' AND '.join(f"field{i % fields} != 'x'" if i % fields < fields // 2 else f"field{i % fields} < {1000 + i}"
+                        for i in range(clauses))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f"{count} records, per record:")
+    rules = [(f"{clauses} clauses, short-circuiting", lambda cardinality, clauses=clauses: make_rule(
+        clauses=clauses, depth=3, fields=4, cardinality=cardinality)) for clauses in (8, 256)]
+    rules += [(f"{clauses} clauses, all evaluated", lambda cardinality, clauses=clauses: full_scan_rule(clauses))
+              for clauses in (16, 128)]
+    for name, rule in rules:
+        for cardinality in (3, 10, 30):
+            ast = create_rule(rule(cardinality))
+            records = make_records(count, fields=4, cardinality=cardinality)
+            for request_id, record in enumerate(records):
+                record['request_id'] = request_id
+
+            compiled = compile_rule(ast)
+            memo = MemoizedRule(ast, maxsize=10000)
+            plain = per_record(compiled, records)
+            memoized = per_record(memo, records)
+            stats = memo.stats()
+            assert all(memo(record) == compiled(record) for record in records[:1000])
+            print(f"  {name:<30} {cardinality:2d} values/field: compiled {plain * 1e6:6.2f} us, "
+                  f"memoized {memoized * 1e6:6.2f} us ({plain / memoized:4.1f}x), "
+                  f"hit rate {stats['hit_rate']:6.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Time combined rules before and after optimize_rule.
+
+Equivalence of optimized rules is checked by tests/test_optimizer.py;
+here the results are only compared on the timed records. Run from the
+repository root:
+
+    python -m benchmarks.bench_optimizer
+"""
+import timeit
+
+from benchmarks.generators import make_records, make_rules
+from rule_engine import combine_rules, compile_rule, create_rule
+from rule_memo import referenced_fields
+from rule_optimizer import constant_value, optimize_rule
+
+def outcome(evaluate, ast, record):
+    try:
+        return evaluate(ast, record), None
+    except ValueError as e:
+        return None, str(e)
+
+def operands(ast):
+    return sum(1 for node in _nodes(ast) if node.node_type == 'operand')
+
+def _nodes(ast):
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node:
+            yield node
+            stack.extend((node.left, node.right))
+
+def timing():
+    """Time combined rules with overlapping conditions (few fields, few values), before and after optimizing."""
+    options = dict(fields=2, cardinality=8)
+    records = make_records(2000, **options)
+    print("combined rules (8 rules of 8 conditions over 2 fields), per record:")
+    for operator in ('AND', 'OR'):
+        for seed in range(3):
+            ast = combine_rules([create_rule(text) for text in make_rules(8, clauses=8, depth=1, seed=seed * 8, **options)],
+                                operator)
+            optimize = min(timeit.repeat(lambda: optimize_rule(ast), number=10, repeat=3)) / 10
+            optimized = optimize_rule(ast)
+            assert set(referenced_fields(optimized)) <= set(referenced_fields(ast))
+            before, after = compile_rule(ast), compile_rule(optimized)
+            assert [outcome(lambda _, r: before(r), None, r) for r in records] == \
+                [outcome(lambda _, r: after(r), None, r) for r in records]
+            slow = min(timeit.repeat(lambda: [before(r) for r in records], number=5, repeat=5)) / 5 / len(records)
+            fast = min(timeit.repeat(lambda: [after(r) for r in records], number=5, repeat=5)) / 5 / len(records)
+            print(f"  {operator} #{seed}: {operands(ast):2d} -> {operands(optimized):2d} conditions, "
+                  f"constant {constant_value(optimized)!s:<5}  {slow * 1e6:5.2f} -> {fast * 1e6:5.2f} us "
+                  f"({slow / fast:.1f}x), optimize_rule {optimize * 1e3:.2f} ms")
+
+if __name__ == '__main__':
+    timing()
@@ -0,0 +1,59 @@
+"""Benchmark create_rule's scanner and parser against the original tokenize_rule/parse_tokens.
+
+The original parser printed three debug lines per token; it is timed both
+with that tracing (output discarded) and without it.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parse
+"""
+import contextlib
+import io
+import random
+import timeit
+
+from rule_engine import create_rule, parse_tokens, tokenize_rule
+
+FIELDS = ['age', 'department', 'salary', 'experience']
+
+def make_rule(clauses, seed=0):
+    # Groups of two or three conditions joined by AND, groups joined by OR.
+    rng = random.Random(seed)
+    conditions = []
+    for _ in range(clauses):
+        field = rng.choice(FIELDS)
+        if field == 'department':
+            conditions.append(f"department = '{rng.choice(['Sales', 'Marketing', 'Finance'])}'")
+        else:
+            conditions.append(f"{field} {rng.choice(['>', '<', '='])} {rng.randint(0, 100000)}")
+    groups = []
+    while conditions:
+        size = rng.randint(2, 3)
+        groups.append('(' + ' AND '.join(conditions[:size]) + ')')
+        conditions = conditions[size:]
+    return ' OR '.join(groups)
+
+def legacy(rule, trace=None):
+    return parse_tokens(tokenize_rule(rule), trace)
+
+def main():
+    for clauses in (10, 100, 300, 1000):
+        rule = make_rule(clauses)
+        assert repr(create_rule(rule)) == repr(legacy(rule))
+        number = max(1, 2000 // clauses)
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                traced = min(timeit.repeat(lambda: legacy(rule, print), number=number, repeat=3)) / number
+        except RecursionError:
+            traced = None  # printing the output stack recurses through the unbalanced tree
+        untraced = min(timeit.repeat(lambda: legacy(rule), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: create_rule(rule), number=number, repeat=3)) / number
+        traced_text = f"{traced * 1e3:9.2f} ms" if traced else "    fails   "
+        print(f"{clauses:5} clauses ({len(rule):6} chars)   "
+              f"legacy with prints {traced_text}   legacy {untraced * 1e3:7.2f} ms   "
+              f"create_rule {new * 1e3:7.2f} ms ({clauses / new:7.0f} clauses/s, "
+              f"{untraced / new:4.1f}x faster than legacy)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark RuleSetHolder updates: diff vs full rebuild, and evaluation latency while a reload runs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reload [rule_count] [changed]
+"""
+import sys
+import threading
+import time
+
+from benchmarks.generators import make_records, make_rules
+from rule_engine import create_rule
+from rule_reload import RuleSetHolder
+from rule_set import RuleSet
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def evaluation_latencies(holder, records, stop):
+    """Evaluate records in a loop until stop is set; return the latency of each evaluation."""
+    latencies = []
+    seen = set()
+    while not stop.is_set():
+        for record in records:
+            start = time.perf_counter()
+            current = holder.current
+            current.evaluate(record)
+            latencies.append(time.perf_counter() - start)
+            seen.add(current.version)
+    return latencies, seen
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    changed = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rules = {f"rule-{i}": text for i, text in enumerate(make_rules(count, clauses=8, depth=2))}
+    replacements = {f"rule-{i}": text for i, text in enumerate(make_rules(changed, seed=count, clauses=8, depth=2))}
+    records = make_records(50)
+
+    start = time.perf_counter()
+    holder = RuleSetHolder(rules)
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    holder.update(replace=replacements)
+    diff = time.perf_counter() - start
+
+    expected = RuleSet({rule_id: create_rule(text) for rule_id, text in holder.current.sources.items()})
+    assert all(holder.evaluate(record) == expected.evaluate(record) for record in records)
+
+    # Evaluation latency with no reload, then while full reloads run in the background
+    idle_stop = threading.Event()
+    threading.Timer(1.0, idle_stop.set).start()
+    idle, _ = evaluation_latencies(holder, records, idle_stop)
+
+    busy_stop = threading.Event()
+    reloads = []
+
+    def reload_loop():
+        generation = 0
+        while not busy_stop.is_set():
+            generation += 1
+            reloads.append(holder.load({rule_id: f"{text} AND field0 != {generation}"
+                                        for rule_id, text in rules.items()}))
+
+    reloader = threading.Thread(target=reload_loop)
+    reloader.start()
+    threading.Timer(3.0, busy_stop.set).start()
+    busy, versions = evaluation_latencies(holder, records, busy_stop)
+    reloader.join()
+
+    print(f"{count} rules: full build {full * 1e3:.0f} ms, replacing {changed} rules {diff * 1e3:.1f} ms "
+          f"({full / diff:.0f}x faster)")
+    print(f"evaluate latency idle:           p50 {percentile(idle, 0.5) * 1e6:.0f} us, "
+          f"p99 {percentile(idle, 0.99) * 1e6:.0f} us, max {max(idle) * 1e3:.1f} ms")
+    print(f"evaluate latency during reloads: p50 {percentile(busy, 0.5) * 1e6:.0f} us, "
+          f"p99 {percentile(busy, 0.99) * 1e6:.0f} us, max {max(busy) * 1e3:.1f} ms "
+          f"({len(reloads)} full reloads, {len(versions)} versions served)")
+
+if __name__ == '__main__':
+    main()
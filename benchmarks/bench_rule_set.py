@@ -0,0 +1,63 @@
+"""Benchmark a RuleSet against calling evaluate_rule on every rule.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rule_set [rule_count]
+"""
+import contextlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+
+from rule_engine import create_rule, evaluate_rule
+from rule_set import RuleSet
+
+DEPARTMENTS = ['Sales', 'Marketing', 'Engineering', 'Finance', 'HR']
+
+def make_rules(count, seed=0):
+    # Thresholds come from a small pool, so many rules share conditions.
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (f"rule-{i}",
+               f"(age > {rng.randrange(20, 60, 5)} AND department = '{rng.choice(DEPARTMENTS)}') "
+               f"OR (salary > {rng.randrange(20, 120, 10) * 1000} AND experience > {rng.randrange(0, 20, 2)})")
+
+def make_records(count, seed=1):
+    rng = random.Random(seed)
+    return [{'age': rng.randint(18, 65), 'department': rng.choice(DEPARTMENTS),
+             'salary': rng.randint(20000, 120000), 'experience': rng.randint(0, 30)}
+            for _ in range(count)]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    records = make_records(20)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asts = {rule_id: create_rule(text) for rule_id, text in make_rules(count)}
+    plain_memory = tracemalloc.get_traced_memory()[0]
+    rule_set = RuleSet(asts)
+    del asts
+    set_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asts = {rule_id: create_rule(text) for rule_id, text in make_rules(count)}
+    print(f"{count} rules, {rule_set.predicate_count} distinct predicates")
+    print(f"memory: parsed ASTs {plain_memory / 2**20:.1f} MiB, RuleSet (incl. compiled code) {set_memory / 2**20:.1f} MiB")
+
+    start = time.perf_counter()
+    expected = [[rule_id for rule_id, ast in asts.items() if evaluate_rule(ast, record)] for record in records]
+    walk = (time.perf_counter() - start) / len(records)
+
+    start = time.perf_counter()
+    actual = [rule_set.evaluate(record) for record in records]
+    shared = (time.perf_counter() - start) / len(records)
+
+    assert actual == expected
+    print(f"per record: evaluate_rule x {count} {walk * 1000:.1f} ms, RuleSet.evaluate {shared * 1000:.1f} ms "
+          f"({walk / shared:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark schema-compiled rules against evaluate_rule and compile_rule.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_schema [records]
+"""
+import sys
+import time
+
+from benchmarks.generators import field_types, make_records, make_rules
+from rule_engine import compile_rule, evaluate_rule
+from rule_schema import Schema
+
+OPTIONS = dict(fields=8, cardinality=20)
+
+def per_record(function, records, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(records)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    schema = Schema({field: 'string' if is_string else 'int' for field, is_string in field_types(OPTIONS['fields'])})
+    texts = make_rules(20, clauses=16, depth=3, **OPTIONS)
+    asts = [schema.create_rule(text) for text in texts]
+    records = make_records(count, **OPTIONS)
+    # The same records as they would arrive from CSV or a form: every value a string
+    raw = [{field: str(value) for field, value in record.items()} for record in records]
+
+    compiled = [compile_rule(ast) for ast in asts]
+    typed = [schema.compile(ast) for ast in asts]
+    coerced = [schema.coerce(record) for record in raw]
+    assert coerced == records
+    assert [[rule(record) for rule in typed] for record in coerced] == \
+        [[evaluate_rule(ast, record) for ast in asts] for record in records]
+
+    timings = {
+        'evaluate_rule': per_record(lambda rs: [evaluate_rule(ast, r) for r in rs for ast in asts], records),
+        'compile_rule': per_record(lambda rs: [rule(r) for r in rs for rule in compiled], records),
+        'schema.compile': per_record(lambda rs: [rule(r) for r in rs for rule in typed], records),
+        'coerce + schema.compile': per_record(
+            lambda rs: [rule(c) for r in rs for c in (schema.coerce(r),) for rule in typed], raw),
+    }
+    print(f"{len(asts)} rules of 16 conditions over {count} records ({OPTIONS['fields']} fields), per record:")
+    for name, seconds in timings.items():
+        print(f"  {name:<26} {seconds * 1e6:8.1f} us  ({timings['evaluate_rule'] / seconds:.1f}x evaluate_rule)")
+
+if __name__ == '__main__':
+    main()
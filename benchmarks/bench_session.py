@@ -0,0 +1,66 @@
+"""Benchmark incremental re-evaluation (RuleSession) against re-running every rule on each change.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session [entities] [updates]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.generators import field_types, make_records, make_rules
+from rule_engine import create_rule, evaluate_rule
+from rule_session import RuleSession
+
+FIELDS = 16
+CARDINALITY = 20
+
+def main():
+    entity_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    update_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    options = dict(fields=FIELDS, cardinality=CARDINALITY)
+    rules = {f"rule-{i}": create_rule(text) for i, text in enumerate(make_rules(200, clauses=12, depth=2, **options))}
+    records = make_records(entity_count, **options)
+
+    # A stream of single-field changes to random entities
+    rng = random.Random(2)
+    schema = field_types(FIELDS)
+    updates = []
+    for _ in range(update_count):
+        field, is_string = rng.choice(schema)
+        value = f"v{rng.randrange(CARDINALITY)}" if is_string else rng.randrange(CARDINALITY)
+        updates.append((rng.randrange(entity_count), {field: value}))
+
+    tracemalloc.start()
+    session = RuleSession(rules, max_entities=entity_count)
+    before = tracemalloc.get_traced_memory()[0]
+    for entity_id, record in enumerate(records):
+        session.update(entity_id, record)
+    per_entity = (tracemalloc.get_traced_memory()[0] - before) / entity_count
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    flips = [session.update(entity_id, change) for entity_id, change in updates]
+    incremental = (time.perf_counter() - start) / update_count
+
+    # Baseline: apply the change and re-run evaluate_rule for every rule
+    current = [dict(record) for record in records]
+    last = [{rule_id: evaluate_rule(ast, record) for rule_id, ast in rules.items()} for record in current]
+    start = time.perf_counter()
+    expected = []
+    for entity_id, change in updates:
+        current[entity_id].update(change)
+        results = {rule_id: evaluate_rule(ast, current[entity_id]) for rule_id, ast in rules.items()}
+        expected.append({rule_id: result for rule_id, result in results.items() if result != last[entity_id][rule_id]})
+        last[entity_id] = results
+    full = (time.perf_counter() - start) / update_count
+
+    assert flips == expected
+    print(f"{len(rules)} rules, {entity_count} entities, {update_count} single-field updates")
+    print(f"memory per tracked entity: {per_entity / 1024:.1f} KiB")
+    print(f"per update: evaluate_rule on every rule {full * 1e6:.0f} us, RuleSession.update {incremental * 1e6:.0f} us "
+          f"({full / incremental:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark a memory-mapped SharedRuleSet against a per-process RuleSetHolder.
+
+For each way of getting the rules into a worker process: the time it
+takes, the Python heap it allocates (the mapped layout itself is shared
+page cache, not counted) and the evaluation time per record. Run from the
+repository root:
+
+    python -m benchmarks.bench_shared [rule_count]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generators import make_records, make_rules
+from rule_reload import RuleSetHolder
+from rule_shared import SharedRuleSet
+
+def measured(build):
+    """Return (result, seconds, bytes allocated) for build()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+def per_record(rule_set, records, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for record in records:
+            rule_set.evaluate(record)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(records)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rules = {f"rule-{i}": text for i, text in enumerate(make_rules(count, clauses=8, depth=2))}
+    records = make_records(50)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rules')
+        publisher = SharedRuleSet(path)
+        start = time.perf_counter()
+        publisher.load(rules)
+        publish = time.perf_counter() - start
+        size = os.path.getsize(f"{path}.{publisher.version}")
+
+        holder, parse, parsed_bytes = measured(lambda: RuleSetHolder(rules))
+        shared, attach, attached_bytes = measured(lambda: SharedRuleSet(path).current)
+        assert all(shared.evaluate(record) == holder.evaluate(record) for record in records)
+
+        print(f"{count} rules; publishing the layout takes {publish * 1e3:.0f} ms and {size / 1024:.0f} KiB on disk")
+        print(f"per worker process:  {'startup':>10} {'heap':>10} {'evaluate':>12}")
+        for name, seconds, allocated, rule_set in (("parse (RuleSetHolder)", parse, parsed_bytes, holder),
+                                                   ("attach (SharedRuleSet)", attach, attached_bytes, shared)):
+            print(f"  {name:<23} {seconds * 1e3:6.0f} ms {allocated / 2 ** 20:7.1f} MiB "
+                  f"{per_record(rule_set, records) * 1e3:8.2f} ms/record")
+
+        # A worker notices a new generation on its next read of `current`
+        worker = SharedRuleSet(path)
+        publisher.update(replace={'rule-0': "field0 = 'v1'"})
+        start = time.perf_counter()
+        version = worker.current.version
+        print(f"picking up generation {version} after an update: {(time.perf_counter() - start) * 1e3:.1f} ms")
+        worker.close()
+        publisher.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measure bulk import and cold start of the SQLite rule store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_store [rule_count]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from rule_store import RuleStore
+
+def make_rules(count, seed=0):
+    rng = random.Random(seed)
+    departments = ['Sales', 'Marketing', 'Engineering', 'Finance', 'HR']
+    for i in range(count):
+        yield (f"rule-{i}",
+               f"(age > {rng.randint(18, 60)} AND department = '{rng.choice(departments)}') "
+               f"OR (salary > {rng.randint(20, 120) * 1000} AND experience > {rng.randint(0, 20)})")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rules.db')
+
+        store = RuleStore(path)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.import_rules(make_rules(count))
+        print(f"import {count} rules (one transaction): {time.perf_counter() - start:.2f}s")
+        store.close()
+
+        start = time.perf_counter()
+        store = RuleStore(path)
+        rules = store.load_all(lazy=True)
+        print(f"cold start, lazy load of {len(rules)} rules: {time.perf_counter() - start:.3f}s")
+        store.close()
+
+        start = time.perf_counter()
+        store = RuleStore(path)
+        rules = store.load_all(lazy=False)
+        print(f"cold start, eager load of {len(rules)} rules: {time.perf_counter() - start:.3f}s")
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark the cost of evaluation tracing: disabled, sampled and always on.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_trace
+"""
+import os
+import tempfile
+import timeit
+
+from benchmarks.generators import make_records, make_rule
+from rule_engine import compile_rule, create_rule
+from rule_trace import Tracer
+
+def per_call(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+def library(ast, records):
+    evaluate = compile_rule(ast)
+
+    def run(tracer):
+        return lambda: [tracer.evaluate('rule', ast, evaluate, record) for record in records]
+
+    direct = per_call(lambda: [evaluate(record) for record in records], 200) / len(records)
+    print(f"library, per evaluation: compiled rule called directly {direct * 1e6:.3f} us")
+    for label, tracer in (("tracer disabled", Tracer()), ("sampled 1 in 1000", Tracer(sample_every=1000)),
+                          ("sampled 1 in 100", Tracer(sample_every=100)), ("always traced", Tracer(rule_ids=['rule']))):
+        seconds = per_call(run(tracer), 20 if tracer.rule_ids else 200) / len(records)
+        print(f"  {label:<20} {seconds * 1e6:8.3f} us ({(seconds - direct) * 1e6:+.3f} us)")
+
+def http(rule, records):
+    os.environ.setdefault('RULE_STORE_PATH', os.path.join(tempfile.mkdtemp(), 'rules.db'))
+    from app import app, tracer
+    client = app.test_client()
+    rule_id = client.post('/api/create_rule', json={'rule_string': rule}).get_json()['rule_id']
+
+    def evaluate():
+        for record in records[:20]:
+            client.post('/api/evaluate_rule', json={'rule_id': rule_id, 'data': record})
+
+    print("HTTP /api/evaluate_rule, per request:")
+    for label, sample_every in (("tracer disabled", 0), ("sampled 1 in 100", 100), ("always traced", 1)):
+        tracer.configure(sample_every=sample_every)
+        seconds = per_call(evaluate, 10) / 20
+        print(f"  {label:<20} {seconds * 1e6:8.1f} us")
+    tracer.configure(sample_every=0)
+
+def main():
+    rule = make_rule(clauses=32, depth=3)
+    ast = create_rule(rule)
+    records = make_records(200)
+    library(ast, records)
+    http(rule, records)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark the binary AST wire format against the JSON (to_dict/reconstruct_ast) path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_wire
+"""
+import contextlib
+import io
+import json
+import timeit
+
+from benchmarks.bench_parse import make_rule
+from rule_engine import create_rule, combine_rules, reconstruct_ast
+from rule_wire import decode_wire, encode_wire
+
+def run(label, ast, number):
+    payload = json.dumps(ast.to_dict()).encode('utf-8')
+    frame = encode_wire(ast)
+    assert decode_wire(frame)[0].to_dict() == reconstruct_ast(json.loads(payload)).to_dict()
+
+    def best(function):
+        return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+    json_encode = best(lambda: json.dumps(ast.to_dict()).encode('utf-8'))
+    json_decode = best(lambda: reconstruct_ast(json.loads(payload)))
+    wire_encode = best(lambda: encode_wire(ast))
+    wire_decode = best(lambda: decode_wire(frame))
+    print(f"{label:<22} size JSON {len(payload):9} B  wire {len(frame):8} B ({len(payload) / len(frame):4.1f}x)   "
+          f"encode {json_encode:9.1f} / {wire_encode:9.1f} us   decode {json_decode:9.1f} / {wire_decode:9.1f} us")
+
+def main():
+    print("(times are JSON / wire)")
+    run("sample rule", create_rule(
+        "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) "
+        "AND (salary > 50000 OR experience > 5)"), 2000)
+    run("300 clauses", create_rule(make_rule(300)), 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        combined = combine_rules([create_rule(make_rule(100, seed)) for seed in range(50)])
+    run("50 x 100-clause rules", combined, 3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Seeded generators of synthetic rules and records for the benchmarks.
+
+Fields are named field0, field1, ...; the first `string_ratio` share of them
+hold strings and the rest integers. `cardinality` is the number of distinct
+values per field, so it controls how selective conditions are.
+"""
+import random
+
+STRING_OPERATORS = ['=', '!=']
+INT_OPERATORS = ['>', '<', '=', '!=']
+
+def field_types(fields=4, string_ratio=0.5):
+    """Return [(field name, is_string)] for the generated schema."""
+    strings = round(fields * string_ratio)
+    return [(f"field{i}", i < strings) for i in range(fields)]
+
+def make_condition(rng, fields=4, string_ratio=0.5, cardinality=10):
+    field, is_string = rng.choice(field_types(fields, string_ratio))
+    if is_string:
+        return f"{field} {rng.choice(STRING_OPERATORS)} 'v{rng.randrange(cardinality)}'"
+    return f"{field} {rng.choice(INT_OPERATORS)} {rng.randrange(cardinality)}"
+
+def make_rule(clauses=8, depth=2, fields=4, string_ratio=0.5, cardinality=10, seed=0):
+    """Return a rule string with `clauses` conditions nested up to `depth` levels of parentheses.
+
+    Each level splits its conditions into two or three groups joined by one
+    operator, alternating between AND and OR from level to level.
+    """
+    rng = random.Random(seed)
+
+    def build(count, level, op):
+        if count == 1:
+            return make_condition(rng, fields, string_ratio, cardinality)
+        if level == depth:
+            return f" {op} ".join(make_condition(rng, fields, string_ratio, cardinality) for _ in range(count))
+        groups = min(count, rng.randint(2, 3))
+        sizes = [count // groups + (i < count % groups) for i in range(groups)]
+        inner = 'OR' if op == 'AND' else 'AND'
+        parts = [build(size, level + 1, inner) for size in sizes]
+        return f" {op} ".join(f"({part})" if size > 1 else part for part, size in zip(parts, sizes))
+
+    return build(clauses, 0, rng.choice(['AND', 'OR']))
+
+def make_rules(count, seed=0, **options):
+    """Return `count` rule strings built by make_rule with consecutive seeds."""
+    return [make_rule(seed=seed + i, **options) for i in range(count)]
+
+def make_records(count, fields=4, string_ratio=0.5, cardinality=10, seed=1):
+    """Return `count` records holding a value for every generated field."""
+    rng = random.Random(seed)
+    schema = field_types(fields, string_ratio)
+    return [
+        {field: f"v{rng.randrange(cardinality)}" if is_string else rng.randrange(cardinality)
+         for field, is_string in schema}
+        for _ in range(count)
+    ]
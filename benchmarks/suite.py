@@ -0,0 +1,176 @@
+"""Benchmark suite for the parse, combine, evaluate, serialization and HTTP paths.
+
+Every input comes from the seeded generators in benchmarks/generators.py,
+so runs on the same machine are comparable. Run from the repository root:
+
+    python -m benchmarks.suite run [--output results.json] [--quick] [--only PREFIX]
+    python -m benchmarks.suite compare baseline.json results.json [--threshold 0.10]
+
+`run` prints one line per benchmark and saves the results as JSON. `compare`
+lists every benchmark whose time per operation grew by more than the
+threshold (10% by default) and exits with status 1 if there are any.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from benchmarks.generators import make_records, make_rule, make_rules
+from rule_engine import (combine_rules, compile_rule, create_rule, evaluate_rule, parse_tokens,
+                         reconstruct_ast, tokenize_rule)
+
+# name -> options for make_rule / make_records
+SCENARIOS = {
+    'small': dict(clauses=4, depth=1),
+    'medium': dict(clauses=32, depth=3),
+    'large': dict(clauses=256, depth=4),
+    'strings': dict(clauses=32, depth=3, string_ratio=1.0),
+    'ints': dict(clauses=32, depth=3, string_ratio=0.0),
+    'high_cardinality': dict(clauses=32, depth=3, fields=16, cardinality=10000),
+}
+
+RECORD_OPTIONS = ('fields', 'string_ratio', 'cardinality')
+
+def measure(function, operations=1, repeat=5, min_time=0.2):
+    """Return the best time per operation, in seconds, for function performing `operations` operations."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number / operations
+
+def engine_benchmarks(name, options):
+    """Yield (benchmark name, function, operations per call) for one scenario."""
+    record_options = {key: value for key, value in options.items() if key in RECORD_OPTIONS}
+    rule = make_rule(**options)
+    tokens = tokenize_rule(rule)
+    ast = create_rule(rule)
+    ast_dict = ast.to_dict()
+    records = make_records(200, **record_options)
+    compiled = compile_rule(ast)
+    asts = [create_rule(text) for text in make_rules(50, **options)]
+
+    yield f"{name}/tokenize_rule", lambda: tokenize_rule(rule), 1
+    yield f"{name}/parse_tokens", lambda: parse_tokens(tokens), 1
+    yield f"{name}/create_rule", lambda: create_rule(rule), 1
+    yield f"{name}/combine_rules_50", lambda: combine_rules(asts), 1
+    yield f"{name}/evaluate_rule", lambda: [evaluate_rule(ast, record) for record in records], len(records)
+    yield f"{name}/compiled_rule", lambda: [compiled(record) for record in records], len(records)
+    yield f"{name}/to_dict", ast.to_dict, 1
+    yield f"{name}/reconstruct_ast", lambda: reconstruct_ast(ast_dict), 1
+
+def http_benchmarks():
+    """Yield (benchmark name, function, operations per call) for the app.py endpoints."""
+    # app.py opens its rule store on import; keep it out of the working tree.
+    os.environ.setdefault('RULE_STORE_PATH', os.path.join(tempfile.mkdtemp(), 'rules.db'))
+    from app import app
+    client = app.test_client()
+
+    rule = make_rule(clauses=32, depth=3)
+    rules = make_rules(10, clauses=8, depth=2)
+    records = make_records(20)
+    created = client.post('/api/create_rule', json={'rule_string': rule}).get_json()
+    ast_dict, rule_id = created['ast'], created['rule_id']
+    fresh = iter(range(10 ** 9))
+
+    def post(path, payload):
+        response = client.post(path, json=payload)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    yield "http/create_rule_cached", lambda: post('/api/create_rule', {'rule_string': rule}), 1
+    yield "http/create_rule_uncached", lambda: post(
+        '/api/create_rule', {'rule_string': f"{rule} AND field1 != {next(fresh)}"}), 1
+    yield "http/combine_rules_10", lambda: post('/api/combine_rules', {'rules': rules}), 1
+    yield "http/evaluate_rule_by_id", lambda: [
+        post('/api/evaluate_rule', {'rule_id': rule_id, 'data': record}) for record in records], len(records)
+    yield "http/evaluate_rule_by_ast", lambda: [
+        post('/api/evaluate_rule', {'ast': ast_dict, 'data': record}) for record in records], len(records)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    benchmarks = []
+    for name, options in SCENARIOS.items():
+        benchmarks.extend(engine_benchmarks(name, options))
+    benchmarks.extend(http_benchmarks())
+
+    results = {}
+    for name, function, operations in benchmarks:
+        if args.only and not name.startswith(args.only):
+            continue
+        seconds = measure(function, operations, repeat=3 if args.quick else 5, min_time=0.05 if args.quick else 0.2)
+        results[name] = {'seconds': seconds}
+        print(f"{name:<40} {seconds * 1e6:12.2f} us/op")
+
+    output = {
+        'meta': {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} results to {args.output}")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before = baseline[name]['seconds']
+        after = current[name]['seconds']
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<40} {before * 1e6:12.2f} -> {after * 1e6:12.2f} us/op  {change:+7.1%}{flag}")
+    skipped = len(baseline.keys() ^ current.keys())
+    if skipped:
+        print(f"{skipped} benchmark(s) in only one of the files were not compared")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+        return 1
+    print(f"No regressions over {args.threshold:.0%}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks and save the results")
+    run_parser.add_argument('--output', default='bench_results.json')
+    run_parser.add_argument('--quick', action='store_true', help="fewer, shorter repeats")
+    run_parser.add_argument('--only', help="only run benchmarks whose name starts with this prefix")
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="relative slowdown to flag (default 0.10)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+        return 0
+    return compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
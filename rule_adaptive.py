@@ -0,0 +1,206 @@
+import math
+import threading
+import time
+
+from rule_engine import _COMPILE_GLOBALS, _balanced_tree, _compile_node, compile_rule, operator_children
+
+class AdaptiveRule:
+    """A compiled rule that reorders AND/OR children by observed cost and selectivity.
+
+    Every `sample_every`-th evaluation is timed child by child, recording how
+    long each child of an AND/OR chain takes and how often it decides the
+    chain (False for AND, True for OR). Every `reorder_every` evaluations the
+    children of each chain are sorted so the cheapest, most decisive ones run
+    first, and the reordered tree is recompiled. Other evaluations run at
+    compile_rule speed.
+
+    Results never change: AND/OR are commutative, and the only way evaluation
+    order could show is through missing-field errors, so records that lack a
+    field the rule uses are evaluated in the original order.
+    """
+
+    def __init__(self, ast, sample_every=128, reorder_every=16384):
+        if not ast:
+            raise ValueError("AST cannot be empty.")
+        self.ast = ast
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.evaluations = 0
+        self.reorders = 0
+        self._exact = compile_rule(ast)
+        self._root = _build(ast)
+        self._fields = tuple(sorted(_fields(ast)))
+        self._fast = self._compile(ast)
+        self._countdown = sample_every
+        self._next_reorder = reorder_every
+        self._lock = threading.Lock()
+
+    def evaluate(self, data):
+        """Evaluate the rule against data, with evaluate_rule semantics."""
+        self._countdown -= 1
+        if self._countdown:
+            return self._fast(data)
+        return self._evaluate_sampled(data)
+
+    __call__ = evaluate
+
+    def _evaluate_sampled(self, data):
+        self._countdown = self.sample_every
+        self.evaluations += self.sample_every
+        if self._root is None or not data or any(data.get(field) is None for field in self._fields):
+            return self._exact(data)
+
+        result = self._root.evaluate_sampled(data)
+        if self.evaluations >= self._next_reorder:
+            self._next_reorder = self.evaluations + self.reorder_every
+            self.reorder()
+        return result
+
+    def reorder(self):
+        """Reorder every chain by the statistics gathered so far and recompile."""
+        if self._root is None:
+            return
+        with self._lock:
+            self._root.reorder()
+            self._fast = self._compile(self._root.to_node())
+            self.reorders += 1
+
+    def _compile(self, ast):
+        """Compile ast (in its current order) behind a check that every field is present.
+
+        Records missing a field go to the original-order function, so they
+        raise (or not) exactly as evaluate_rule would.
+        """
+        namespace = dict(_COMPILE_GLOBALS, _exact=self._exact)
+        for position, field in enumerate(self._fields):
+            namespace[f"_field{position}"] = field
+        present = ' or '.join(f"_get(_field{position}) is None" for position in range(len(self._fields)))
+        source = "def _adaptive_rule(data):\n" \
+                 "    if not data:\n" \
+                 "        raise ValueError(\"AST or data cannot be empty.\")\n" \
+                 "    _get = data.get\n" \
+                 f"    if {present or 'False'}:\n" \
+                 "        return _exact(data)\n" \
+                 f"    return {_compile_node(ast, namespace)}\n"
+        exec(compile(source, '<adaptive rule>', 'exec'), namespace)
+        return namespace['_adaptive_rule']
+
+    def current_ast(self):
+        """Return the AST in its current evaluation order."""
+        return self._root.to_node() if self._root is not None else self.ast
+
+    def stats(self):
+        """Return the per-child statistics of every chain, in current order."""
+        return self._root.describe() if self._root is not None else []
+
+def _fields(ast):
+    fields = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node.node_type == 'operand':
+            fields.add(node.value['field'])
+        else:
+            stack.append(node.left)
+            stack.append(node.right)
+    return fields
+
+def _build(ast):
+    """Mirror ast as _Chain/_Leaf objects, or return None if it can't safely be reordered."""
+    if not ast:
+        return None
+    if ast.node_type == 'operator' and ast.value in ('AND', 'OR'):
+        children = [_build(child) for child in operator_children(ast)]
+        if any(child is None for child in children):
+            return None  # An empty child raises wherever it sits; keep its position
+        return _Chain(ast.value, children)
+    return _Leaf(ast)
+
+class _Stats:
+    """Sampled statistics for one child of a chain."""
+
+    def __init__(self):
+        self.calls = 0
+        self.decisive = 0
+        self.seconds = 0.0
+
+    def record(self, decisive, seconds):
+        self.calls += 1
+        self.decisive += decisive
+        self.seconds += seconds
+
+    def expected_cost(self):
+        """Average time spent per decision; lower runs first."""
+        if not self.calls:
+            return math.inf
+        if not self.decisive:
+            return math.inf
+        return self.seconds / self.decisive
+
+    def decay(self):
+        # Halve the history so the ordering follows changes in the data.
+        self.calls //= 2
+        self.decisive //= 2
+        self.seconds /= 2
+
+class _Leaf:
+    def __init__(self, node):
+        self.node = node
+        self.check = compile_rule(node)
+        self.stats = _Stats()
+
+    def evaluate_sampled(self, data):
+        return self.check(data)
+
+    def reorder(self):
+        pass
+
+    def to_node(self):
+        return self.node
+
+    def describe(self):
+        return []
+
+class _Chain:
+    def __init__(self, op, children):
+        self.op = op
+        self.children = children
+        self.stats = _Stats()
+
+    def evaluate_sampled(self, data):
+        # AND is decided by the first False child, OR by the first True one.
+        decides = self.op == 'OR'
+        for child in self.children:
+            start = time.perf_counter()
+            result = child.evaluate_sampled(data)
+            child.stats.record(result == decides, time.perf_counter() - start)
+            if result == decides:
+                return decides
+        return not decides
+
+    def reorder(self):
+        for child in self.children:
+            child.reorder()
+        # sorted() is stable, so children without statistics keep their order.
+        self.children = sorted(self.children, key=lambda child: child.stats.expected_cost())
+        for child in self.children:
+            child.stats.decay()
+
+    def to_node(self):
+        return _balanced_tree(self.op, [child.to_node() for child in self.children])
+
+    def describe(self):
+        return [{
+            'operator': self.op,
+            'children': [
+                {
+                    'ast': child.to_node().to_dict(),
+                    'calls': child.stats.calls,
+                    'decisive': child.stats.decisive,
+                    'seconds': child.stats.seconds,
+                }
+                for child in self.children
+            ],
+        }] + [chain for child in self.children for chain in child.describe()]
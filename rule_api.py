@@ -0,0 +1,184 @@
+"""Request handling shared by the Flask app (app.py) and the async server (asgi.py).
+
+Each handler takes a parsed request body and returns (status, body,
+headers): body is a dict to send as JSON, or the bytes of a binary AST
+frame (rule_wire) when the client asked for one.
+"""
+import json
+import logging
+
+from rule_engine import combine_rules
+from rule_metrics import Metrics
+from rule_trace import Tracer
+from rule_wire import WIRE_MIMETYPE, encode_wire
+
+logger = logging.getLogger(__name__)
+
+def unknown_rule(rule_id):
+    """Return the 404 response for a rule ID that is neither cached nor stored.
+
+    Rule IDs from /api/create_rule and /api/combine_rules are content
+    hashes kept only in the LRU cache, so they stop resolving once evicted;
+    the client then has to send the rule itself again.
+    """
+    return 404, {"error": f"Unknown rule ID '{rule_id}'. IDs returned by /api/create_rule and "
+                          "/api/combine_rules are only valid while the rule is cached; resubmit the rule "
+                          "(rule_string or ast), which caches it under the same ID again.",
+                 "resubmit": True}, {}
+
+def _request_object(request):
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object.")
+    return request
+
+class RuleAPI:
+    """The create_rule, combine_rules and evaluate_rule endpoints over a RuleCache.
+
+    Rule IDs that aren't cached are loaded from store (a RuleStore), if
+    given. Without metrics or tracer, disabled ones are used.
+    """
+
+    def __init__(self, cache, store=None, metrics=None, tracer=None):
+        self.cache = cache
+        self.store = store
+        self.metrics = metrics or Metrics()
+        self.tracer = tracer or Tracer()
+
+    def handle(self, name, *args):
+        """Call the handler called name, turning an exception it raises into an error response.
+
+        ValueError and TypeError mean the request itself was bad (400);
+        anything else is a failure on the server's side (500).
+        """
+        try:
+            return getattr(self, name)(*args)
+        except (ValueError, TypeError) as e:
+            logger.info("Error in %s: %s", name, e)
+            self.metrics.observe_error(name, e)
+            return 400, {'error': str(e)}, {}
+        except Exception as e:
+            logger.warning("Error in %s: %s", name, e)
+            self.metrics.observe_error(name, e)
+            return 500, {'error': str(e)}, {}
+
+    def lookup_rule(self, rule_id):
+        """Return the cached rule for rule_id, loading it from the rule store if needed."""
+        rule = self.cache.get(rule_id)
+        if rule is None and self.store is not None:
+            ast = self.store.get(rule_id)
+            if ast is not None:
+                rule = self.cache.add(ast, rule_id=rule_id)
+        return rule
+
+    def optimize(self, rule, optimize):
+        """With optimize, return (cached optimized rule, constant); otherwise (rule, None).
+
+        constant is True or False if the rule has that value for every record
+        that has the fields it reads, else None. The optimized rule is kept on
+        the cache entry, so each rule is optimized once.
+        """
+        if not optimize:
+            return rule, None
+        start = self.metrics.start()
+        rule, constant = self.cache.optimize(rule)
+        self.metrics.observe('optimize', start)
+        if constant is not None:
+            logger.info("Rule %s is always %s", rule.rule_id, constant)
+        return rule, constant
+
+    def create_rule(self, request, wire=False):
+        """Parse request['rule_string'] (or reuse the cached rule) and return its AST and rule ID."""
+        request = _request_object(request)
+        rule_string = request.get('rule_string', '')
+        if not isinstance(rule_string, str) or not rule_string:
+            return 400, {'error': 'Rule string cannot be empty.'}, {}
+
+        start = self.metrics.start()
+        rule = self.cache.get_or_create(rule_string)
+        self.metrics.observe('parse', start)
+        logger.debug("Generated AST: %s", rule.ast)
+
+        # "optimize": true returns the optimized AST and reports a rule that can never (or always) match
+        rule, constant = self.optimize(rule, request.get('optimize'))
+        return self._rule_response('ast', rule, constant, wire)
+
+    def combine_rules(self, request, wire=False):
+        """Combine the rule strings in request['rules'] with request['operator'] (AND by default)."""
+        request = _request_object(request)
+        logger.debug("Received data for combining rules: %s", request)
+        rule_strings = request.get('rules', [])
+        if not isinstance(rule_strings, list) or not rule_strings:
+            return 400, {'error': 'No valid rules provided'}, {}
+
+        operator = request.get('operator', 'AND')
+        if operator not in ('AND', 'OR'):
+            return 400, {'error': 'Operator must be AND or OR.'}, {}
+
+        # Parse each rule and ensure the AST is created successfully
+        rules = []
+        start = self.metrics.start()
+        for rule in rule_strings:
+            if not (isinstance(rule, str) and rule.strip()):
+                return 400, {"error": "All rules must be non-empty strings."}, {}
+            rules.append(self.cache.get_or_create(rule).ast)
+        self.metrics.observe('parse', start)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Parsed ASTs: %s", [ast.to_dict() for ast in rules])
+
+        start = self.metrics.start()
+        combined_ast = combine_rules(rules, operator)
+        self.metrics.observe('combine', start)
+        if combined_ast is None:
+            return 500, {'error': 'Failed to combine rules.'}, {}
+
+        # Cache the combined rule so it can be evaluated by ID
+        combined = self.cache.add(combined_ast)
+        combined, constant = self.optimize(combined, request.get('optimize'))
+        return self._rule_response('combined_ast', combined, constant, wire)
+
+    def evaluate_rule(self, request):
+        """Evaluate a rule (request['rule_id'] or request['ast']) against request['data'].
+
+        request may also be the raw body of a binary request (bytes): an AST
+        frame followed by the data as JSON.
+        """
+        if isinstance(request, bytes):
+            rule, end = self.cache.get_or_add_wire(request)
+            data = json.loads(request[end:] or b'null')
+        else:
+            request = _request_object(request)
+            rule_id = request.get('rule_id')
+            ast_data = request.get('ast')
+            data = request.get('data')
+            if not (rule_id or ast_data) or not data:
+                return 400, {"error": "AST (or rule_id) and data must be provided."}, {}
+            if rule_id:
+                rule = self.lookup_rule(rule_id)
+                if rule is None:
+                    return unknown_rule(rule_id)
+            elif not isinstance(ast_data, dict):
+                return 400, {"error": "AST must be a JSON object."}, {}
+            else:
+                # Reuse the compiled rule if this AST has been seen before
+                rule = self.cache.get_or_add_ast(ast_data)
+        if not data:
+            return 400, {"error": "AST (or rule_id) and data must be provided."}, {}
+
+        start = self.metrics.start()
+        result = self.tracer.evaluate(rule.rule_id, rule.ast, rule.evaluate, data)
+        self.metrics.observe('evaluate', start)
+        self.metrics.observe_result(rule.rule_id, result)
+        return 200, {"result": result}, {}
+
+    def _rule_response(self, key, rule, constant, wire):
+        """Return a rule's AST as JSON under key, or with wire as a binary frame.
+
+        A frame carries the rule ID in the X-Rule-Id header, and the
+        constant (if any) in X-Rule-Constant.
+        """
+        if wire:
+            headers = {'Content-Type': WIRE_MIMETYPE, 'X-Rule-Id': rule.rule_id}
+            if constant is not None:
+                headers['X-Rule-Constant'] = 'true' if constant else 'false'
+            return 200, encode_wire(rule.ast), headers
+        return 200, {key: rule.ast_dict, 'rule_id': rule.rule_id, 'constant': constant}, {}
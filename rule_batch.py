@@ -0,0 +1,148 @@
+import operator
+
+import numpy as np
+
+from rule_engine import _between_type, operator_children
+
+def evaluate_batch(ast, columns, return_missing=False):
+    """Evaluate an AST against columnar data and return a boolean mask.
+
+    `columns` is a dict of equal-length NumPy arrays keyed by field name, or
+    a structured array. Row i of the result equals evaluate_rule(ast, row_i),
+    where row_i is the dict of the i-th values:
+
+    - a value is missing (None in evaluate_rule terms) when it is None in an
+      object column, masked in a numpy.ma column, or the column is absent;
+    - integer and bool columns compare like ints, float columns like
+      floats, unicode columns like strings, and object columns are checked
+      value by value;
+    - AND/OR only evaluate their right side on the rows the left side
+      left undecided, so a subtree is skipped once no rows need it.
+
+    Rows that would make evaluate_rule raise a missing-field error raise a
+    ValueError here too, unless return_missing is True, in which case
+    (mask, missing) is returned and those rows are False in mask.
+    """
+    if not ast:
+        raise ValueError("AST or data cannot be empty.")
+
+    columns = _as_columns(columns)
+    if not columns:
+        raise ValueError("AST or data cannot be empty.")
+
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) != 1:
+        raise ValueError("All columns must have the same length.")
+
+    active = np.ones(lengths.pop(), dtype=bool)
+    errors = []
+    result, missing = _evaluate(ast, columns, active, errors)
+
+    if return_missing:
+        return result, missing
+    if errors:
+        raise ValueError(f"Missing field '{errors[0]}' in provided data.")
+    return result
+
+def _as_columns(columns):
+    """Normalize a structured array or mapping into a dict of arrays."""
+    if isinstance(columns, np.ndarray):
+        if columns.dtype.names is None:
+            raise ValueError("Expected a structured array or a dict of columns.")
+        return {name: columns[name] for name in columns.dtype.names}
+    # Plain lists become object columns so mixed values keep their types.
+    return {field: column if isinstance(column, np.ndarray) else np.array(column, dtype=object)
+            for field, column in columns.items()}
+
+def _evaluate(ast, columns, active, errors):
+    """Return (result, missing) masks for the rows selected by active."""
+    false = np.zeros_like(active)
+
+    if not active.any():
+        return false, false
+
+    if not ast:
+        raise ValueError("AST or data cannot be empty.")
+
+    if ast.node_type == 'operand':
+        return _evaluate_operand(ast.value, columns, active, errors)
+
+    if ast.node_type != 'operator' or ast.value not in ('AND', 'OR'):
+        return (active.copy() if ast.node_type == 'constant' and ast.value is True else false), false
+
+    missing = false
+    if ast.value == 'AND':
+        # Each child only sees the rows that are still True so far.
+        for child in operator_children(ast):
+            active, child_missing = _evaluate(child, columns, active, errors)
+            missing = missing | child_missing
+        return active, missing
+
+    # OR: each child only sees the rows no earlier child has decided.
+    result = false
+    for child in operator_children(ast):
+        child_result, child_missing = _evaluate(child, columns, active, errors)
+        result = result | child_result
+        missing = missing | child_missing
+        active = active & ~child_result & ~child_missing
+    return result, missing
+
+def _evaluate_operand(value, columns, active, errors):
+    """Vectorized version of a single evaluate_rule comparison."""
+    field = value['field']
+    op = value['operator']
+    val = value['value']
+
+    column = columns.get(field)
+    if column is None:
+        errors.append(field)
+        return np.zeros_like(active), active.copy()
+
+    null = np.ma.getmaskarray(column) if np.ma.isMaskedArray(column) else np.zeros_like(active)
+    data = np.ma.getdata(column)
+
+    if data.dtype.kind == 'O':
+        null = null | np.fromiter((item is None for item in data), dtype=bool, count=len(data))
+    missing = active & null
+    if missing.any():
+        errors.append(field)
+    rows = active & ~null
+
+    if isinstance(val, str) and op in ('=', '!='):
+        expected, compare, kinds = str, _COMPARE[op], 'U'
+    elif isinstance(val, int) and op in _COMPARE:
+        expected, compare, kinds = int, _COMPARE[op], 'biu'
+    elif isinstance(val, float) and op in _COMPARE:
+        expected, compare, kinds = (int, float), _COMPARE[op], 'biuf'
+    elif op in ('in', 'not in') and isinstance(val, (list, tuple)):
+        expected, compare, kinds = str, _in if op == 'in' else _not_in, 'U'
+        val = [item for item in val if isinstance(item, str)]
+    elif op == 'between' and _between_type(val):
+        expected, compare = _between_type(val), _between
+        kinds = 'biu' if expected is int else 'biuf'
+    else:
+        return np.zeros_like(active), missing
+
+    if data.dtype.kind == 'O':
+        result = np.zeros_like(active)
+        index = np.flatnonzero(rows)
+        result[index] = np.fromiter(
+            (isinstance(item, expected) and compare(item, val) for item in data[index]),
+            dtype=bool, count=len(index))
+        return result, missing
+
+    if data.dtype.kind not in kinds:
+        return np.zeros_like(active), missing
+
+    return rows & compare(data, val), missing
+
+def _in(values, members):
+    return np.isin(values, members)
+
+def _not_in(values, members):
+    return np.isin(values, members, invert=True)
+
+def _between(values, bounds):
+    return (values > bounds[0]) & (values < bounds[1])
+
+_COMPARE = {'=': operator.eq, '!=': operator.ne, '>': operator.gt, '<': operator.lt}
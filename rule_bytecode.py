@@ -0,0 +1,189 @@
+from array import array
+
+from rule_engine import Node, evaluate_rule
+
+# Every instruction is three ints: opcode, a, b.
+#   Comparisons: a = constant index of the field, b = constant index of the value.
+#   Jumps: b = code offset to continue at (a is unused).
+#   NODE: a = constant index of a Node evaluated with evaluate_rule (anything
+#   the specialised opcodes don't cover).
+#   PREDICATE: a = index of an (opcode, field, value) comparison in a list
+#   shared by many programs, whose results are remembered per record (see
+#   run_bytecode). compile_bytecode doesn't emit it.
+STR_EQ, STR_NE, INT_EQ, INT_NE, INT_GT, INT_LT, JUMP_IF_FALSE, JUMP_IF_TRUE, NODE, PREDICATE = range(10)
+
+_STR_OPS = {'=': STR_EQ, '!=': STR_NE}
+_INT_OPS = {'=': INT_EQ, '!=': INT_NE, '>': INT_GT, '<': INT_LT}
+_OP_NAMES = {STR_EQ: '=', STR_NE: '!=', INT_EQ: '=', INT_NE: '!=', INT_GT: '>', INT_LT: '<'}
+_JUMPS = {'AND': JUMP_IF_FALSE, 'OR': JUMP_IF_TRUE}
+
+class ConstantPool:
+    """Interned fields and values shared by many programs.
+
+    Equal constants of the same type get one slot, so a field name used by
+    thousands of rules is stored once.
+    """
+
+    def __init__(self):
+        self.constants = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.constants)
+
+    def intern(self, value):
+        """Return the index of value, adding it if it's new."""
+        try:
+            key = (type(value), value)
+            index = self._index.get(key)
+        except TypeError:
+            key = index = None  # Unhashable: always gets its own slot
+        if index is None:
+            index = len(self.constants)
+            self.constants.append(value)
+            if key is not None:
+                self._index[key] = index
+        return index
+
+class RuleProgram:
+    """A rule compiled to flat bytecode, evaluated by a small stack machine."""
+
+    __slots__ = ('code', 'pool')
+
+    def __init__(self, code, pool):
+        self.code = code
+        self.pool = pool
+
+    def evaluate(self, data):
+        """Evaluate the program against data, with evaluate_rule semantics."""
+        return run_bytecode(self.code, self.pool.constants, data)
+
+    __call__ = evaluate
+
+    def to_ast(self):
+        return decode_bytecode(self.code, self.pool.constants)
+
+def compile_bytecode(ast, pool=None):
+    """Compile an AST to a RuleProgram, interning its constants in pool (a new one by default).
+
+    An AND/OR node is laid out as its left side, a jump past its right side
+    (taken when the left side already decides the result), then its right
+    side; comparisons become one instruction each.
+    """
+    if not ast:
+        raise ValueError("AST cannot be empty.")
+    if pool is None:
+        pool = ConstantPool()
+
+    code = array('i')
+    stack = [('visit', ast)]
+    jumps = []  # offsets of jumps waiting for their target
+    while stack:
+        action, node = stack.pop()
+        if action == 'patch':
+            code[jumps.pop() + 2] = len(code)
+        elif action == 'jump':
+            jumps.append(len(code))
+            code.extend((_JUMPS[node], 0, 0))
+        elif node.node_type == 'operator' and node.value in _JUMPS and node.left and node.right:
+            stack.append(('patch', None))
+            stack.append(('visit', node.right))
+            stack.append(('jump', node.value))
+            stack.append(('visit', node.left))
+        else:
+            code.extend(_encode_leaf(node, pool))
+    return RuleProgram(code, pool)
+
+def _encode_leaf(node, pool):
+    value = node.value
+    if node.node_type == 'operand' and isinstance(value, dict) and value.keys() == {'field', 'operator', 'value'}:
+        op, val = value['operator'], value['value']
+        if isinstance(val, str):
+            opcode = _STR_OPS.get(op)
+        elif isinstance(val, int):
+            opcode = _INT_OPS.get(op)
+        else:
+            opcode = None
+        if opcode is not None:
+            return opcode, pool.intern(value['field']), pool.intern(val)
+    return NODE, pool.intern(node), 0
+
+def run_bytecode(code, constants, data, start=0, end=None, predicates=None, memo=None):
+    """Run a program's code against data. The only stack entry is the last result.
+
+    start and end pick one program out of a longer code sequence (any
+    sequence of ints, e.g. a memoryview); its jump targets are relative to
+    start. PREDICATE instructions look their comparison up in predicates
+    and keep its result in the dict memo (predicate index -> result), so
+    programs run against the same record with the same memo share it.
+    """
+    if not data:
+        raise ValueError("AST or data cannot be empty.")
+
+    get = data.get
+    if end is None:
+        end = len(code)
+    pc = start
+    result = False
+    while pc < end:
+        opcode = code[pc]
+        if opcode == JUMP_IF_FALSE:
+            if not result:
+                pc = start + code[pc + 2]
+                continue
+        elif opcode == JUMP_IF_TRUE:
+            if result:
+                pc = start + code[pc + 2]
+                continue
+        elif opcode == NODE:
+            result = evaluate_rule(constants[code[pc + 1]], data)
+        else:
+            index = None
+            if opcode == PREDICATE:
+                index = code[pc + 1]
+                result = memo.get(index)
+                if result is not None:
+                    pc += 3
+                    continue
+                opcode, field, expected = predicates[index]
+            else:
+                field, expected = constants[code[pc + 1]], constants[code[pc + 2]]
+            value = get(field)
+            if value is None:
+                raise ValueError(f"Missing field '{field}' in provided data.")
+            if opcode <= STR_NE:
+                result = isinstance(value, str) and (value == expected) == (opcode == STR_EQ)
+            elif not isinstance(value, int):
+                result = False
+            elif opcode == INT_EQ:
+                result = value == expected
+            elif opcode == INT_NE:
+                result = value != expected
+            elif opcode == INT_GT:
+                result = value > expected
+            else:
+                result = value < expected
+            if index is not None:
+                memo[index] = result
+        pc += 3
+    return result
+
+def decode_bytecode(code, constants):
+    """Rebuild the Node tree a program was compiled from."""
+    pending = []  # (operator, left side, offset where its right side ends)
+    current = None
+    pc = 0
+    while pc < len(code):
+        opcode, a, b = code[pc], code[pc + 1], code[pc + 2]
+        pc += 3
+        if opcode == JUMP_IF_FALSE or opcode == JUMP_IF_TRUE:
+            pending.append(('AND' if opcode == JUMP_IF_FALSE else 'OR', current, b))
+            continue
+        if opcode == NODE:
+            current = constants[a]
+        else:
+            current = Node('operand', value={'field': constants[a], 'operator': _OP_NAMES[opcode], 'value': constants[b]})
+        while pending and pending[-1][2] == pc:
+            op, left, _ = pending.pop()
+            current = Node('operator', value=op, left=left, right=current)
+    return current
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from rule_engine import create_rule, compile_rule, reconstruct_ast
+from rule_memo import MemoizedRule
+from rule_optimizer import constant_value, optimize_rule
+from rule_wire import decode_wire
+
+def normalize_rule_text(rule_string):
+    """Collapse whitespace outside quoted values so equivalent spellings share a key."""
+    return re.sub(r"('[^']*'|\"[^\"]*\")|\s+", lambda m: m.group(1) or ' ', rule_string).strip()
+
+def ast_hash(ast_data):
+    """Return a stable content hash for a serialized AST (as produced by Node.to_dict)."""
+    canonical = json.dumps(ast_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+class CachedRule:
+    """A parsed rule with its compiled evaluator and stable ID.
+
+    With memo set to (maxsize, ttl), evaluate remembers results by the
+    values of the fields the rule reads (see MemoizedRule). optimized holds
+    (optimized AST, its rule ID, constant value) once RuleCache.optimize
+    has been asked for it.
+    """
+
+    def __init__(self, rule_id, ast, ast_dict, memo=None):
+        self.rule_id = rule_id
+        self.ast = ast
+        self.ast_dict = ast_dict
+        self.memo = MemoizedRule(ast, *memo) if memo else None
+        self.evaluate = self.memo if self.memo is not None else compile_rule(ast)
+        self.aliases = set()
+        self.optimized = None
+
+class RuleCache:
+    """Bounded LRU cache of parsed rules, keyed by rule ID, rule text and AST hash.
+
+    A rule's ID is the content hash of its AST, so the same rule gets the same
+    ID whether it arrives as text or as a serialized AST, and across restarts.
+    An ID only resolves while its rule is cached; once evicted, the rule has
+    to be submitted again (only rules in the RuleStore are reloaded by ID).
+
+    Result memoization is off unless memo_size is set (for every rule) or a
+    rule is switched on with memoize(). Memoized results live on the cached
+    entry, so they go when the rule is discarded or evicted.
+    """
+
+    def __init__(self, maxsize=1024, memo_size=0, memo_ttl=None):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1.")
+        self.maxsize = maxsize
+        self.memo = (memo_size, memo_ttl) if memo_size else None
+        self._memo_rules = {}  # rule_id -> (maxsize, ttl), or None to turn it off for that rule
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rules = OrderedDict()  # rule_id -> CachedRule, least recently used first
+        self._aliases = {}  # ('text', normalized text), ('ast', raw AST hash) or ('wire', frame hash) -> rule_id
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def get(self, rule_id):
+        """Return the cached rule for rule_id, or None if it is not cached."""
+        with self._lock:
+            entry = self._rules.get(rule_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._rules.move_to_end(rule_id)
+            self.hits += 1
+            return entry
+
+    def get_or_create(self, rule_string):
+        """Return the cached rule for rule_string, parsing it on a miss."""
+        alias = ('text', normalize_rule_text(rule_string))
+        entry = self._lookup_alias(alias)
+        if entry is None:
+            entry = self.add(create_rule(rule_string))
+            self._add_alias(alias, entry)
+        return entry
+
+    def get_or_add_ast(self, ast_data):
+        """Return the cached rule for a serialized AST, rebuilding it on a miss."""
+        alias = ('ast', ast_hash(ast_data))
+        entry = self._lookup_alias(alias)
+        if entry is None:
+            entry = self.add(reconstruct_ast(ast_data))
+            self._add_alias(alias, entry)
+        return entry
+
+    def get_or_add_wire(self, data, offset=0):
+        """Return (cached rule, end offset) for the binary AST frame at data[offset:].
+
+        The frame is always decoded to find where it ends; compiling is
+        skipped if the same frame has been seen before.
+        """
+        ast, end = decode_wire(data, offset)
+        alias = ('wire', hashlib.sha256(data[offset:end]).hexdigest()[:32])
+        entry = self._lookup_alias(alias)
+        if entry is None:
+            entry = self.add(ast)
+            self._add_alias(alias, entry)
+        return entry, end
+
+    def _lookup_alias(self, alias):
+        with self._lock:
+            rule_id = self._aliases.get(alias)
+            if rule_id is None:
+                self.misses += 1
+                return None
+            self._rules.move_to_end(rule_id)
+            self.hits += 1
+            return self._rules[rule_id]
+
+    def _add_alias(self, alias, entry):
+        with self._lock:
+            # The entry may already have been evicted by a concurrent insert.
+            if entry.rule_id in self._rules:
+                entry.aliases.add(alias)
+                self._aliases[alias] = entry.rule_id
+
+    def add(self, ast, rule_id=None):
+        """Cache an AST and return its entry. The rule ID defaults to its content hash."""
+        if ast is None:
+            raise ValueError("AST cannot be empty.")
+        ast_dict = None
+        if rule_id is None:
+            ast_dict = ast.to_dict()
+            rule_id = ast_hash(ast_dict)
+
+        with self._lock:
+            entry = self._rules.get(rule_id)
+            if entry is not None:
+                self._rules.move_to_end(rule_id)
+                return entry
+
+        if ast_dict is None:
+            ast_dict = ast.to_dict()
+
+        entry = CachedRule(rule_id, ast, ast_dict, self._memo_rules.get(rule_id, self.memo))
+        with self._lock:
+            existing = self._rules.get(rule_id)
+            if existing is not None:
+                return existing
+            self._rules[rule_id] = entry
+            while len(self._rules) > self.maxsize:
+                _, evicted = self._rules.popitem(last=False)
+                for alias in evicted.aliases:
+                    self._aliases.pop(alias, None)
+                self.evictions += 1
+        return entry
+
+    def optimize(self, entry):
+        """Return (cached rule for entry's optimized AST, constant value), optimizing only on first use.
+
+        constant is True or False if the rule has that value for every record
+        that has the fields it reads, else None.
+        """
+        if entry.optimized is None:
+            optimized = optimize_rule(entry.ast)
+            entry.optimized = (optimized, ast_hash(optimized.to_dict()), constant_value(optimized))
+        ast, rule_id, constant = entry.optimized
+        return self.add(ast, rule_id=rule_id), constant
+
+    def memoize(self, rule_id, maxsize=10000, ttl=None):
+        """Remember results of rule_id (now and whenever it is loaded again); maxsize=0 turns it off."""
+        memo = (maxsize, ttl) if maxsize else None
+        with self._lock:
+            self._memo_rules[rule_id] = memo
+            entry = self._rules.get(rule_id)
+        if entry is not None:
+            entry.memo = MemoizedRule(entry.ast, *memo) if memo else None
+            entry.evaluate = entry.memo if entry.memo is not None else compile_rule(entry.ast)
+
+    def memo_stats(self):
+        """Return {rule_id: MemoizedRule stats} for the cached rules that memoize results."""
+        with self._lock:
+            entries = list(self._rules.values())
+        return {entry.rule_id: entry.memo.stats() for entry in entries if entry.memo is not None}
+
+    def discard(self, rule_id):
+        """Drop a rule (and its aliases) from the cache, e.g. after it changed."""
+        with self._lock:
+            entry = self._rules.pop(rule_id, None)
+            if entry is not None:
+                for alias in entry.aliases:
+                    self._aliases.pop(alias, None)
+
+    def clear(self):
+        """Drop every cached rule. Counters are kept."""
+        with self._lock:
+            self._rules.clear()
+            self._aliases.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._rules),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,248 @@
+"""Evaluate a rule over a large CSV or JSONL file, offline and in parallel.
+
+    python rule_cli.py (--rule TEXT | --rule-file PATH | --ast PATH) INPUT [options]
+
+The input is memory-mapped and cut into chunks of whole lines; worker
+processes each build the rule once and evaluate chunks read straight from
+the mapping, so files larger than RAM are fine. Output is written in input
+order:
+
+    --mode results   one line per record: {"result": true}, {"result": false}
+                     or {"error": "..."} (the default)
+    --mode filter    the input rows that match, unchanged (CSV keeps its header)
+
+Every record must be on one line: CSV fields with embedded newlines are not
+supported. CSV cells that look like integers are compared as integers and
+empty cells count as missing fields. With --schema (a JSON file of field
+types, see rule_schema.py) the rule is checked against the schema and every
+record is converted to the declared types instead. A summary goes to stderr.
+"""
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from rule_engine import compile_rule, create_rule, reconstruct_ast
+from rule_schema import Schema
+from rule_wire import decode_wire
+
+RESULT_LINES = {True: b'{"result": true}\n', False: b'{"result": false}\n'}
+
+# Per-process state, set up by _init_worker
+_evaluate = None
+_coerce = None
+_map = None
+_header = None
+
+def load_rule(spec, schema=None):
+    """Build the AST from ('text', rule string), ('json', serialized AST) or ('wire', frame bytes)."""
+    kind, value = spec
+    if kind == 'text':
+        return create_rule(value, schema=schema)
+    if kind == 'json':
+        ast = reconstruct_ast(value)
+    else:
+        ast = decode_wire(value)[0]
+    return schema.validate(ast) if schema is not None else ast
+
+def read_rule_spec(args):
+    if args.rule is not None:
+        return ('text', args.rule)
+    if args.rule_file is not None:
+        with open(args.rule_file, encoding='utf-8') as f:
+            return ('text', f.read().strip())
+    with open(args.ast, 'rb') as f:
+        data = f.read()
+    if data.lstrip()[:1] == b'{':
+        return ('json', json.loads(data))
+    return ('wire', data)
+
+def _init_worker(path, rule_spec, header, schema=None):
+    """Build the rule once and map the input file for this process."""
+    global _evaluate, _coerce, _map, _header
+    if schema is None:
+        _evaluate = compile_rule(load_rule(rule_spec))
+        _coerce = None
+    else:
+        schema = Schema.from_dict(schema)
+        _evaluate = schema.compile(load_rule(rule_spec, schema))
+        _coerce = schema.coerce
+    with open(path, 'rb') as f:
+        _map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _header = header
+
+def _csv_value(cell):
+    if not cell:
+        return None
+    try:
+        return int(cell)
+    except ValueError:
+        return cell
+
+def _csv_cell(cell):
+    return cell or None
+
+def _records(lines, header, convert=_csv_value):
+    """Yield (raw line, record or the exception that stopped it being parsed) for each non-blank line."""
+    if header is None:
+        for line in lines:
+            if line.strip():
+                try:
+                    yield line, json.loads(line)
+                except ValueError as e:
+                    yield line, ValueError(f"Invalid JSON: {e}")
+        return
+    for line in lines:
+        if line.strip():
+            try:
+                cells = next(csv.reader(io.StringIO(line.decode('utf-8'))))
+                yield line, {field: value for field, value in zip(header, map(convert, cells))
+                             if value is not None}
+            except (ValueError, csv.Error, StopIteration) as e:
+                yield line, e
+
+def _lines(data, start, end):
+    """Yield the lines of data[start:end] with their newlines, copying each line out of the mapping once."""
+    find = data.find
+    while start < end:
+        stop = find(b'\n', start, end)
+        stop = end if stop == -1 else stop + 1
+        yield data[start:stop]
+        start = stop
+
+def process_chunk(start, end, mode):
+    """Evaluate the lines in bytes [start, end) of the mapped file. Returns (output, records, matches, errors)."""
+    lines = _lines(_map, start, end)
+    out = []
+    records = matches = errors = 0
+    for line, record in _records(lines, _header, _csv_value if _coerce is None else _csv_cell):
+        records += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError("Record must be a JSON object.")
+            if _coerce is not None:
+                record = _coerce(record)
+            result = bool(_evaluate(record))
+        except ValueError as e:
+            errors += 1
+            if mode == 'results':
+                out.append(json.dumps({'error': str(e)}).encode('utf-8') + b'\n')
+            continue
+        matches += result
+        if mode == 'results':
+            out.append(RESULT_LINES[result])
+        elif result:
+            out.append(line if line.endswith(b'\n') else line + b'\n')
+    return b''.join(out), records, matches, errors
+
+def chunk_ranges(data, start, chunk_size):
+    """Yield (start, end) byte ranges of about chunk_size, each ending after a newline (or at EOF)."""
+    size = len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+def run(path, rule_spec, output, mode='results', input_format=None, workers=None, chunk_size=4 << 20,
+        schema=None):
+    """Evaluate the rule over the file at path, writing to the binary stream output. Returns summary counts.
+
+    schema is an optional field -> type dict, as accepted by Schema.from_dict.
+    """
+    load_rule(rule_spec, Schema.from_dict(schema) if schema is not None else None)  # Fail early, before starting workers
+    if input_format is None:
+        input_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    workers = workers or os.cpu_count() or 1
+
+    totals = {'records': 0, 'matches': 0, 'errors': 0}
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return totals
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header = None
+        start = 0
+        if input_format == 'csv':
+            start = data.find(b'\n') + 1 or len(data)
+            header = next(csv.reader([data[:start].decode('utf-8-sig')]), [])
+            if mode == 'filter':
+                output.write(data[:start] if data[:start].endswith(b'\n') else data[:start] + b'\n')
+
+        chunks = chunk_ranges(data, start, chunk_size)
+        if workers == 1:
+            _init_worker(path, rule_spec, header, schema)
+            for chunk_start, chunk_end in chunks:
+                _write(process_chunk(chunk_start, chunk_end, mode), output, totals)
+            return totals
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(path, rule_spec, header, schema)) as pool:
+            # Keep a bounded window of chunks in flight and write them back in order.
+            pending = deque()
+            for chunk_start, chunk_end in chunks:
+                pending.append(pool.submit(process_chunk, chunk_start, chunk_end, mode))
+                if len(pending) >= 2 * workers:
+                    _write(pending.popleft().result(), output, totals)
+            while pending:
+                _write(pending.popleft().result(), output, totals)
+        return totals
+    finally:
+        data.close()
+
+def _write(result, output, totals):
+    chunk_output, records, matches, errors = result
+    output.write(chunk_output)
+    totals['records'] += records
+    totals['matches'] += matches
+    totals['errors'] += errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a rule over a CSV or JSONL file.")
+    rule = parser.add_mutually_exclusive_group(required=True)
+    rule.add_argument('--rule', help="rule text")
+    rule.add_argument('--rule-file', help="file holding the rule text")
+    rule.add_argument('--ast', help="serialized AST: JSON (as returned by the API) or a binary frame")
+    parser.add_argument('input', help="CSV or JSONL file")
+    parser.add_argument('--schema', help="JSON file declaring field types, to validate the rule and coerce records")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="input format (default: from the file extension)")
+    parser.add_argument('--mode', choices=['results', 'filter'], default='results')
+    parser.add_argument('--output', '-o', help="output file (default: stdout)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=4 << 20, help="bytes per chunk (default 4 MiB)")
+    args = parser.parse_args(argv)
+
+    try:
+        rule_spec = read_rule_spec(args)
+        schema = None
+        if args.schema:
+            with open(args.schema, encoding='utf-8') as f:
+                schema = json.load(f)
+        started = time.perf_counter()
+        if args.output:
+            with open(args.output, 'wb') as output:
+                totals = run(args.input, rule_spec, output, args.mode, args.format, args.workers, args.chunk_size,
+                             schema)
+        else:
+            totals = run(args.input, rule_spec, sys.stdout.buffer, args.mode, args.format, args.workers,
+                         args.chunk_size, schema)
+            sys.stdout.buffer.flush()
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - started
+    print(f"{totals['records']} records, {totals['matches']} matched, {totals['errors']} errors "
+          f"in {elapsed:.2f}s ({totals['records'] / elapsed if elapsed else 0:.0f} records/s)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
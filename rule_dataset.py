@@ -0,0 +1,327 @@
+import threading
+from array import array
+import time
+from collections import OrderedDict
+
+from rule_engine import Node, compile_rule, evaluate_rule, operator_children
+from rule_set import predicate_key
+
+class _Bitmap:
+    """One condition's results over a Dataset, as a pair of bitmaps per chunk of rows.
+
+    Bit i of true[c] is set if row c * chunk_rows + i satisfies the
+    condition, and of missing[c] if the row has no value for its field (so
+    evaluate_rule would raise there). A sparse chunk is held as an array of
+    the offsets of its set bits instead (see _compact). A chunk is None
+    until it is built and again once a change to its rows makes it stale.
+    """
+
+    __slots__ = ('key', 'field', 'check', 'true', 'missing', 'size')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.field = value['field']
+        self.check = compile_rule(Node('operand', value))
+        self.true = []
+        self.missing = []
+        self.size = 0  # bytes held by the built chunks
+
+class Dataset:
+    """A fixed population of rows that whole rules are counted against, through cached per-condition bitmaps.
+
+    Each distinct condition (field, operator, value) is evaluated once over
+    the rows and kept as bitmaps, one per `chunk_rows` rows. A chunk where
+    enough rows match is a Python int, up to chunk_rows / 8 bytes; one
+    where few do (under one row in 16) is the sorted array of their
+    offsets, 2 bytes per matching row, turned back into an int when a
+    query reaches it. AND/OR are then answered with bitwise
+    operations, chunk by chunk; as in evaluate_rule, the right side of an
+    AND/OR is only looked at for the rows the left side leaves undecided,
+    so a chunk of a condition is not even built if no row reaches it. Rows
+    where evaluate_rule would raise (a missing field, an empty row) never
+    match and are reported as errors.
+
+    The bitmaps are kept in an LRU cache of at most `maxsize` conditions
+    and, with `max_bytes`, that many bytes. Appending or updating rows only
+    makes the chunks holding them stale, and only for conditions on the
+    fields that changed; they are rebuilt on their next use.
+    Queries and changes take one lock, so they run one at a time.
+    """
+
+    def __init__(self, rows=(), maxsize=1024, max_bytes=None, chunk_rows=4096, clock=time.perf_counter):
+        if maxsize < 1:
+            raise ValueError("Bitmap cache size must be at least 1.")
+        if chunk_rows < 1:
+            raise ValueError("Chunk size must be at least 1.")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.chunk_rows = chunk_rows
+        self._offsets = 'H' if chunk_rows <= 1 << 16 else 'I'  # array type of a sparse chunk's offsets
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows = []
+        self._empty = []  # per chunk, a bitmap of the rows that are empty dicts
+        self._bitmaps = OrderedDict()  # predicate_key -> _Bitmap, least recently used first
+        self._bytes = 0
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.chunks_built = 0
+        self.chunks_invalidated = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.append(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, row_id):
+        return self._rows[self._check_row_id(row_id)]
+
+    def append(self, rows):
+        """Add rows (dicts) at the end. Returns the range of their row IDs."""
+        rows = list(rows)
+        for row in rows:
+            if not isinstance(row, dict):
+                raise ValueError("Rows must be dicts.")
+        with self._lock:
+            first = len(self._rows)
+            if not rows:
+                return range(first, first)
+            # The last chunk gains rows, so every bitmap's copy of it is stale; new chunks start unbuilt.
+            if first % self.chunk_rows:
+                self._invalidate(first // self.chunk_rows, None)
+            self._rows.extend(rows)
+            for row_id, row in enumerate(rows, first):
+                self._set_empty(row_id, not row)
+            return range(first, len(self._rows))
+
+    def update(self, rows):
+        """Replace rows: a dict of row ID -> new row. Only conditions on the fields that changed are affected."""
+        rows = dict(rows)
+        for row_id, row in rows.items():
+            self._check_row_id(row_id)
+            if not isinstance(row, dict):
+                raise ValueError("Rows must be dicts.")
+        with self._lock:
+            stale = {}  # chunk -> fields changed in it
+            for row_id, row in rows.items():
+                old = self._rows[row_id]
+                changed = [field for field in old.keys() | row.keys()
+                           if type(old.get(field)) is not type(row.get(field)) or old.get(field) != row.get(field)]
+                self._rows[row_id] = row
+                self._set_empty(row_id, not row)
+                if changed:
+                    stale.setdefault(row_id // self.chunk_rows, set()).update(changed)
+            for chunk, fields in stale.items():
+                self._invalidate(chunk, fields)
+
+    def count(self, ast, errors=None):
+        """Return how many rows ast matches (evaluate_rule returns True for).
+
+        If errors is a dict, it receives row ID -> error message for the rows
+        where evaluate_rule would raise.
+        """
+        return sum(true.bit_count() for true in self._query(ast, errors))
+
+    def row_ids(self, ast, errors=None):
+        """Return the IDs of the rows ast matches, in order; errors as in count()."""
+        matches = []
+        for chunk, true in enumerate(self._query(ast, errors)):
+            if true:
+                base = chunk * self.chunk_rows
+                matches.extend(base + i for i, bit in enumerate(bin(true)[:1:-1]) if bit == '1')
+        return matches
+
+    def clear(self):
+        """Drop every cached bitmap. Counters are kept."""
+        with self._lock:
+            self._bitmaps.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the cache's size, hit rate, eviction and rebuild counters, and query latencies."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'rows': len(self._rows),
+                'bitmaps': len(self._bitmaps),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'chunks_built': self.chunks_built,
+                'chunks_invalidated': self.chunks_invalidated,
+                'queries': self.queries,
+                'avg_query_ms': self.total_seconds / self.queries * 1000 if self.queries else 0.0,
+                'max_query_ms': self.max_seconds * 1000,
+            }
+
+    def _check_row_id(self, row_id):
+        if isinstance(row_id, bool) or not isinstance(row_id, int) or not 0 <= row_id < len(self._rows):
+            raise ValueError(f"Unknown row ID {row_id!r}.")
+        return row_id
+
+    def _set_empty(self, row_id, empty):
+        chunk, bit = divmod(row_id, self.chunk_rows)
+        if chunk == len(self._empty):
+            self._empty.append(0)
+        if empty:
+            self._empty[chunk] |= 1 << bit
+        else:
+            self._empty[chunk] &= ~(1 << bit)
+
+    def _invalidate(self, chunk, fields):
+        """Mark chunk stale in the bitmaps of conditions on fields (None: all of them)."""
+        for bitmap in self._bitmaps.values():
+            if (fields is None or bitmap.field in fields) and chunk < len(bitmap.true) \
+                    and bitmap.true[chunk] is not None:
+                size = _nbytes(bitmap.true[chunk]) + _nbytes(bitmap.missing[chunk])
+                self._bytes -= size
+                bitmap.size -= size
+                bitmap.true[chunk] = bitmap.missing[chunk] = None
+                self.chunks_invalidated += 1
+
+    def _query(self, ast, errors):
+        """Return the per-chunk bitmaps of the rows ast matches, filling errors if given."""
+        if not ast:
+            raise ValueError("AST or data cannot be empty.")
+        start = self._clock()
+        with self._lock:
+            plan = self._plan(ast)
+            chunks = len(self._empty)
+            matches = []
+            failed = []
+            for chunk in range(chunks):
+                empty = self._empty[chunk]
+                rows = (1 << min(self.chunk_rows, len(self._rows) - chunk * self.chunk_rows)) - 1
+                true, error = self._evaluate(plan, chunk, rows & ~empty)
+                matches.append(true)
+                failed.append(error | empty)
+            self._evict()
+            if errors is not None:
+                # Rare, so the message is simply the one evaluate_rule gives for the row.
+                for chunk, error in enumerate(failed):
+                    base = chunk * self.chunk_rows
+                    for i, bit in enumerate(bin(error)[:1:-1]):
+                        if bit == '1':
+                            try:
+                                evaluate_rule(ast, self._rows[base + i])
+                            except ValueError as e:
+                                errors[base + i] = str(e)
+            elapsed = self._clock() - start
+            self.queries += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        return matches
+
+    def _plan(self, ast):
+        """Turn ast into nested tuples: ('AND'/'OR', children), ('bitmap', _Bitmap) or ('constant', bool),
+        looking up (or creating) the bitmap of every condition once."""
+        if not ast:
+            return ('empty', None)
+        if ast.node_type == 'operand':
+            key = predicate_key(ast.value)
+            bitmap = self._bitmaps.get(key)
+            if bitmap is None:
+                self.misses += 1
+                bitmap = self._bitmaps[key] = _Bitmap(key, ast.value)
+            else:
+                self.hits += 1
+                self._bitmaps.move_to_end(key)
+            return ('bitmap', bitmap)
+        if ast.node_type == 'operator' and ast.value in ('AND', 'OR'):
+            return (ast.value, [self._plan(child) for child in operator_children(ast)])
+        return ('constant', ast.node_type == 'constant' and ast.value is True)
+
+    def _evaluate(self, plan, chunk, rows):
+        """Return (true, error) bitmaps of plan over the rows of chunk set in rows."""
+        kind, value = plan
+        if kind == 'bitmap':
+            if chunk >= len(value.true) or value.true[chunk] is None:
+                self._build(value, chunk)
+            return _expand(value.true[chunk]) & rows, _expand(value.missing[chunk]) & rows
+        if kind == 'AND':
+            # Each child only sees the rows still True so far.
+            error = 0
+            for child in value:
+                if not rows:
+                    break
+                rows, child_error = self._evaluate(child, chunk, rows)
+                error |= child_error
+            return rows, error
+        if kind == 'OR':
+            # Each child only sees the rows no earlier child has decided.
+            true = error = 0
+            for child in value:
+                if not rows:
+                    break
+                child_true, child_error = self._evaluate(child, chunk, rows)
+                true |= child_true
+                error |= child_error
+                rows &= ~(child_true | child_error)
+            return true, error
+        if kind == 'empty':
+            return 0, rows
+        return (rows if value else 0), 0
+
+    def _build(self, bitmap, chunk):
+        """Evaluate bitmap's condition over the rows of chunk."""
+        start = chunk * self.chunk_rows
+        rows = self._rows[start:start + self.chunk_rows]
+        field, check = bitmap.field, bitmap.check
+        rows.reverse()  # Row i ends up as bit i of the binary string
+        missing = int(''.join(['1' if row.get(field) is None else '0' for row in rows]), 2)
+        if missing:
+            true = ''.join(['0' if row.get(field) is None else '1' if check(row) else '0' for row in rows])
+        else:
+            true = ''.join(['1' if check(row) else '0' for row in rows])
+        while len(bitmap.true) <= chunk:
+            bitmap.true.append(None)
+            bitmap.missing.append(None)
+        bitmap.true[chunk] = _compact(int(true, 2), self._offsets)
+        bitmap.missing[chunk] = _compact(missing, self._offsets)
+        size = _nbytes(bitmap.true[chunk]) + _nbytes(bitmap.missing[chunk])
+        bitmap.size += size
+        if bitmap.key in self._bitmaps:
+            self._bytes += size
+        self.chunks_built += 1
+
+    def _evict(self):
+        """Drop the least recently used bitmaps beyond the size limits."""
+        while len(self._bitmaps) > self.maxsize or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._bitmaps) > 1):
+            _, bitmap = self._bitmaps.popitem(last=False)
+            self._bytes -= bitmap.size
+            self.evictions += 1
+
+def _compact(bits, typecode):
+    """Return bits, or an array of the offsets of its set bits if that is smaller."""
+    count = bits.bit_count()
+    if not count or count * array(typecode).itemsize >= (bits.bit_length() + 7) // 8:
+        return bits
+    offsets = array(typecode)
+    text = bin(bits)[:1:-1]
+    offset = text.find('1')
+    while offset >= 0:
+        offsets.append(offset)
+        offset = text.find('1', offset + 1)
+    return offsets
+
+def _expand(bits):
+    """Return a chunk as an int, whether it is held as one or as an array of offsets."""
+    if type(bits) is int:
+        return bits
+    buffer = bytearray(bits[-1] // 8 + 1)
+    for offset in bits:
+        buffer[offset >> 3] |= 1 << (offset & 7)
+    return int.from_bytes(buffer, 'little')
+
+def _nbytes(bits):
+    if type(bits) is int:
+        return (bits.bit_length() + 7) // 8
+    return len(bits) * bits.itemsize
@@ -1,6 +1,9 @@
 
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 class Node:
     def __init__(self, node_type, value=None, left=None, right=None):
         self.node_type = node_type
@@ -15,38 +18,177 @@ class Node:
 
     def to_dict(self):
         """Convert the Node to a dictionary format for easier serialization."""
-        return {
-            'node_type': self.node_type,
-            'value': self.value,
-            'left': self.left.to_dict() if self.left else None,
-            'right': self.right.to_dict() if self.right else None
-        }
-
-def create_rule(rule_string):
-    """Create an AST from the rule string."""
+        # Filled in place with an explicit stack so deep trees can't hit the recursion limit
+        result = {}
+        stack = [(self, result)]
+        while stack:
+            node, out = stack.pop()
+            out['node_type'] = node.node_type
+            out['value'] = node.value
+            out['left'] = {} if node.left else None
+            out['right'] = {} if node.right else None
+            if node.left:
+                stack.append((node.left, out['left']))
+            if node.right:
+                stack.append((node.right, out['right']))
+        return result
+
+class RuleSyntaxError(ValueError):
+    """A rule string that can't be parsed; position is the character offset of the problem."""
+
+    def __init__(self, message, position):
+        super().__init__(f"{message} at position {position}.")
+        self.position = position
+
+# One alternative per token kind, tried at the current position. An operand
+# is a single token: field, comparison operator and quoted string or number.
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<field>\w+)\s*(?P<op>[<>=!]+)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<num>\d+(?:\.\d+)?))
+      | (?P<keyword>AND|OR)(?!\w)
+      | (?P<paren>[()])
+    )""", re.VERBOSE)
+
+_PRECEDENCE = {'OR': 1, 'AND': 2}
+
+def create_rule(rule_string, trace=None, schema=None):
+    """Create an AST from the rule string.
+
+    Pass a callable as trace (e.g. print) to have each parsing step reported,
+    and a Schema (rule_schema.py) to have the rule checked against it.
+    """
     if not rule_string:
         raise ValueError("Rule string cannot be empty.")
 
-    tokens = tokenize_rule(rule_string)
+    tokens = scan_rule(rule_string)
 
     if not tokens:
         raise ValueError("No valid tokens found in the rule string.")
 
-    ast = parse_tokens(tokens)
+    ast = _RuleParser(tokens, len(rule_string), trace).parse()
+    if schema is not None:
+        ast = schema.validate(ast)
+    return ast
 
-    if ast is None:
-        raise ValueError("Failed to create an AST from the tokens.")
+def _number(text):
+    return float(text) if '.' in text else int(text)
+
+def scan_rule(rule_string):
+    """Split the rule string into (kind, value, position) tokens in a single pass.
+
+    kind is 'operand' (value is the operand dict), 'AND', 'OR', '(' or ')'.
+    """
+    tokens = []
+    match = _TOKEN.match
+    position = 0
+    end = len(rule_string)
+    while position < end:
+        m = match(rule_string, position)
+        if m is None:
+            start = len(rule_string) - len(rule_string[position:].lstrip())
+            if start == end:
+                break
+            text = rule_string[start:].split(None, 1)[0]
+            raise RuleSyntaxError(f"Invalid token '{text}'", start)
+        kind = m.lastgroup
+        if kind == 'keyword':
+            tokens.append((m.group('keyword'), None, m.start('keyword')))
+        elif kind == 'paren':
+            tokens.append((m.group('paren'), None, m.start('paren')))
+        else:
+            dq, sq, num = m.group('dq', 'sq', 'num')
+            val = dq if dq is not None else sq if sq is not None else _number(num)
+            tokens.append(('operand', {'field': m.group('field'), 'operator': m.group('op'), 'value': val},
+                           m.start('field')))
+        position = m.end()
+    return tokens
 
-    return ast
+class _RuleParser:
+    """Precedence-climbing parser over the tokens from scan_rule.
+
+    Runs of the same operator are collected as (operator, children) and
+    built as balanced trees, giving the same trees as balance_rule without
+    building the unbalanced one first.
+    """
+
+    def __init__(self, tokens, length, trace=None):
+        self.tokens = tokens
+        self.length = length
+        self.trace = trace
+        self.index = 0
+
+    def parse(self):
+        try:
+            ast = self.build(self.expression(1))
+        except RecursionError:
+            raise RuleSyntaxError("Parentheses nested too deeply", self.tokens[0][2]) from None
+        if self.index < len(self.tokens):
+            kind, _, position = self.tokens[self.index]
+            if kind == ')':
+                raise RuleSyntaxError("Unmatched ')'", position)
+            raise RuleSyntaxError("Expected AND or OR", position)
+        return ast
+
+    def expression(self, min_precedence):
+        """Parse operators binding at least as tightly as min_precedence; returns (operator, children)."""
+        chain_op, children = self.primary()
+        tokens = self.tokens
+        while self.index < len(tokens):
+            op = tokens[self.index][0]
+            precedence = _PRECEDENCE.get(op)
+            if precedence is None or precedence < min_precedence:
+                break
+            self.index += 1
+            # Both operators are left-associative: the right side only takes
+            # operators that bind tighter.
+            right_op, right = self.expression(precedence + 1)
+            if op != chain_op:
+                children = [self.build((chain_op, children))]
+                chain_op = op
+            if right_op == op:
+                children.extend(right)
+            else:
+                children.append(self.build((right_op, right)))
+        return chain_op, children
+
+    def primary(self):
+        if self.index == len(self.tokens):
+            raise RuleSyntaxError("Unexpected end of rule", self.length)
+        kind, value, position = self.tokens[self.index]
+        self.index += 1
+        if self.trace:
+            self.trace(f"Token {kind} at position {position}: {value}" if value else f"Token {kind} at position {position}")
+        if kind == 'operand':
+            return None, [Node('operand', value=value)]
+        if kind == '(':
+            chain = self.expression(1)
+            if self.index == len(self.tokens) or self.tokens[self.index][0] != ')':
+                raise RuleSyntaxError("Missing ')' for '('", position)
+            self.index += 1
+            return chain
+        raise RuleSyntaxError(f"Expected a condition or '(' but found '{kind}'", position)
+
+    def build(self, chain):
+        op, children = chain
+        if op is None:
+            return children[0]
+        ast = _balanced_tree(op, children)
+        if self.trace:
+            self.trace(f"Built {op} of {len(children)} conditions")
+        return ast
 
 def tokenize_rule(rule_string):
-    """Tokenize the rule string into logical components."""
-    token_pattern = r"(\s+AND\s+|\s+OR\s+|\(|\)|\w+\s*[<>=!]+\s*\"[^\"]*\"|\w+\s*[<>=!]+\s*'[^']*'|\w+\s*[<>=!]+\s*\d+)"
+    """Tokenize the rule string into logical components.
+
+    This and parse_tokens are the original regex-based parser, kept for
+    callers that work with string tokens; create_rule uses scan_rule.
+    """
+    token_pattern = r"(\s+AND\s+|\s+OR\s+|\(|\)|\w+\s*[<>=!]+\s*\"[^\"]*\"|\w+\s*[<>=!]+\s*'[^']*'|\w+\s*[<>=!]+\s*\d+(?:\.\d+)?)"
     tokens = re.split(token_pattern, rule_string)
     tokens = [token.strip() for token in tokens if token.strip()]
     return tokens
 
-def parse_tokens(tokens):
+def parse_tokens(tokens, trace=None):
     """Recursively parses tokens into an AST."""
     output = []
     operators = []
@@ -87,7 +229,7 @@ def parse_tokens(tokens):
             operators.append(token)
 
         else:
-            match = re.match(r"(\w+)\s*([<>=!]+)\s*(\"[^\"]*\"|'[^']*'|\d+)", token)
+            match = re.match(r"(\w+)\s*([<>=!]+)\s*(\"[^\"]*\"|'[^']*'|\d+(?:\.\d+)?)", token)
             if match:
                 field, op, val = match.groups()
                 if val.startswith("\"") and val.endswith("\""):
@@ -95,87 +237,281 @@ def parse_tokens(tokens):
                 elif val.startswith("'") and val.endswith("'"):
                     val = val.strip("'")  # Remove single quotes
                 else:
-                    val = int(val)  # Convert to int if it's a number
+                    val = _number(val)  # Convert to int (or float) if it's a number
                 output.append(Node('operand', value={'field': field, 'operator': op, 'value': val}))
             else:
                 raise ValueError(f"Invalid token: {token}")
 
-        # Debug prints
-        print(f"Current token: {token}")
-        print(f"Operators stack: {operators}")
-        print(f"Output stack: {output}")
+        if trace:
+            trace(f"Current token: {token}")
+            trace(f"Operators stack: {operators}")
+            trace(f"Output stack: {output}")
 
         i += 1
 
     while operators:
         apply_operator()
 
-    return output[0] if output else None
+    return balance_rule(output[0]) if output else None
 
 def evaluate_rule(ast, data):
     """Evaluate an AST against provided data."""
     if not ast or not data:
         raise ValueError("AST or data cannot be empty.")
 
-    if ast.node_type == 'operand':
-        field = ast.value['field']
-        op = ast.value['operator']
-        val = ast.value['value']
-        field_value = data.get(field)
-
-        if field_value is None:
-            raise ValueError(f"Missing field '{field}' in provided data.")
-
-        if isinstance(field_value, str) and isinstance(val, str):
-            if op == '=':
-                return field_value == val
-            elif op == '!=':
-                return field_value != val
-        elif isinstance(field_value, int) and isinstance(val, int):
-            if op == '>':
-                return field_value > val
-            elif op == '<':
-                return field_value < val
-            elif op == '=':
-                return field_value == val
-            elif op == '!=':
-                return field_value != val
-    elif ast.node_type == 'operator':
-        if ast.value == 'AND':
-            return evaluate_rule(ast.left, data) and evaluate_rule(ast.right, data)
-        elif ast.value == 'OR':
-            return evaluate_rule(ast.left, data) or evaluate_rule(ast.right, data)
+    # Walk the tree with an explicit stack instead of recursion. Going down the
+    # left side of an AND/OR node pushes (operator, right child); once the left
+    # side has a result, the right child is only visited if it can still
+    # change the outcome, and its result then stands for the whole node.
+    pending = []
+    node = ast
+    while True:
+        while node and node.node_type == 'operator' and node.value in ('AND', 'OR'):
+            pending.append((node.value, node.right))
+            node = node.left
+
+        if not node:
+            raise ValueError("AST or data cannot be empty.")
+        if node.node_type == 'operand':
+            result = _evaluate_operand(node.value, data)
+        else:
+            result = node.node_type == 'constant' and node.value is True
+
+        while pending:
+            op, right = pending.pop()
+            if (op == 'AND') == bool(result):
+                node = right
+                break
+        else:
+            return result
+
+def _evaluate_operand(value, data):
+    """Evaluate a single comparison against provided data."""
+    field = value['field']
+    op = value['operator']
+    val = value['value']
+    field_value = data.get(field)
+
+    if field_value is None:
+        raise ValueError(f"Missing field '{field}' in provided data.")
+
+    if isinstance(field_value, str) and isinstance(val, str):
+        if op == '=':
+            return field_value == val
+        elif op == '!=':
+            return field_value != val
+    elif isinstance(field_value, int) and isinstance(val, int):
+        if op == '>':
+            return field_value > val
+        elif op == '<':
+            return field_value < val
+        elif op == '=':
+            return field_value == val
+        elif op == '!=':
+            return field_value != val
+    elif isinstance(val, float) and isinstance(field_value, (int, float)):
+        if op == '>':
+            return field_value > val
+        elif op == '<':
+            return field_value < val
+        elif op == '=':
+            return field_value == val
+        elif op == '!=':
+            return field_value != val
+    elif op in ('in', 'not in') and isinstance(field_value, str) and isinstance(val, (list, tuple)):
+        return (field_value in val) == (op == 'in')
+    elif op == 'between' and isinstance(field_value, _between_type(val) or ()):
+        return val[0] < field_value < val[1]
 
     return False
 
-def combine_rules(rules):
-    """Combine multiple ASTs into a single AST using AND operator."""
+def _between_type(val):
+    """Return the types a 'between' operand accepts: int for two int bounds, int or float if either is a float."""
+    if not isinstance(val, (list, tuple)) or len(val) != 2:
+        return None
+    if all(isinstance(bound, int) for bound in val):
+        return int
+    if all(isinstance(bound, (int, float)) for bound in val):
+        return (int, float)
+    return None
+
+def operator_children(ast):
+    """Return the subtrees joined by a chain of ast's AND/OR operator, left to right.
+
+    `a AND b AND c` gives [a, b, c] whether it was parsed left- or
+    right-deep, so callers can treat the chain as one n-ary node.
+    """
+    children = []
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node and node.node_type == 'operator' and node.value == ast.value:
+            stack.append(node.right)
+            stack.append(node.left)
+        else:
+            children.append(node)
+    return children
+
+def compile_rule(ast, compile_operand=None):
+    """Compile an AST into a function that evaluates it against a data dict.
+
+    The tree is turned into Python source once, so each call does a single
+    dict lookup and comparison per operand instead of re-walking the Node
+    objects. Results, AND/OR short-circuiting and missing-field errors are
+    the same as evaluate_rule. compile_operand replaces the per-operand
+    expression, as in _compile_node.
+    """
+    if not ast:
+        raise ValueError("AST cannot be empty.")
+
+    namespace = dict(_COMPILE_GLOBALS)
+    source = "def _compiled_rule(data):\n" \
+             "    if not data:\n" \
+             "        raise ValueError(\"AST or data cannot be empty.\")\n" \
+             "    _get = data.get\n" \
+             f"    return {_compile_node(ast, namespace, compile_operand)}\n"
+    exec(compile(source, '<rule>', 'exec'), namespace)
+    return namespace['_compiled_rule']
+
+def _missing_field(field):
+    raise ValueError(f"Missing field '{field}' in provided data.")
+
+def _empty_ast():
+    raise ValueError("AST or data cannot be empty.")
+
+# Helpers referenced by the generated source
+_COMPILE_GLOBALS = {'_missing': _missing_field, '_empty': _empty_ast, '_str': str, '_int': int,
+                    '_number': (int, float)}
+
+def _compile_node(ast, namespace, compile_operand=None):
+    """Return a Python expression evaluating the subtree rooted at ast.
+
+    compile_operand(value, namespace) produces the expression for each
+    operand; it defaults to an inline comparison against `_get`.
+    """
+    if not ast:
+        return "_empty()"
+
+    if ast.node_type == 'operand':
+        return (compile_operand or _compile_operand)(ast.value, namespace)
+
+    if ast.node_type == 'operator' and ast.value in ('AND', 'OR'):
+        # Chains of the same operator (e.g. the output of combine_rules)
+        # become one flat boolean expression rather than deeply nested source.
+        joiner = ' and ' if ast.value == 'AND' else ' or '
+        children = operator_children(ast)
+        return '(' + joiner.join(_compile_node(child, namespace, compile_operand) for child in children) + ')'
+
+    return "True" if ast.node_type == 'constant' and ast.value is True else "False"
+
+def _compile_operand(value, namespace):
+    """Return a Python expression for a single comparison."""
+    field = value['field']
+    op = value['operator']
+    val = value['value']
+
+    index = len(namespace)
+    field_name = f"_f{index}"
+    namespace[field_name] = field
+    missing = f"_missing({field_name}) if (_v := _get({field_name})) is None else "
+
+    if isinstance(val, str) and op in ('=', '!='):
+        value_name = f"_c{index}"
+        namespace[value_name] = val
+        compare = '==' if op == '=' else '!='
+        return f"({missing}(isinstance(_v, _str) and _v {compare} {value_name}))"
+
+    if isinstance(val, int) and op in ('=', '!=', '>', '<'):
+        value_name = f"_c{index}"
+        namespace[value_name] = val
+        compare = '==' if op == '=' else op
+        return f"({missing}(isinstance(_v, _int) and _v {compare} {value_name}))"
+
+    if isinstance(val, float) and op in ('=', '!=', '>', '<'):
+        value_name = f"_c{index}"
+        namespace[value_name] = val
+        compare = '==' if op == '=' else op
+        return f"({missing}(isinstance(_v, _number) and _v {compare} {value_name}))"
+
+    if op in ('in', 'not in') and isinstance(val, (list, tuple)):
+        value_name = f"_c{index}"
+        namespace[value_name] = frozenset(item for item in val if isinstance(item, str))
+        return f"({missing}(isinstance(_v, _str) and _v {op} {value_name}))"
+
+    if op == 'between' and _between_type(val):
+        low_name, high_name, type_name = f"_c{index}", f"_d{index}", f"_t{index}"
+        namespace[low_name], namespace[high_name] = val
+        namespace[type_name] = _between_type(val)
+        return f"({missing}(isinstance(_v, {type_name}) and {low_name} < _v < {high_name}))"
+
+    return f"({missing}False)"
+
+def combine_rules(rules, operator='AND'):
+    """Combine multiple ASTs into a single AST using the AND (or OR) operator."""
     if not rules:
         raise ValueError("No rules provided to combine.")
-    
-    combined_rule = None
+    if operator not in ('AND', 'OR'):
+        raise ValueError(f"Unsupported operator: {operator}")
+
     for rule in rules:
-        print(f"Processing rule: {rule}")  # Debugging line
-        if rule is not None:
-            if combined_rule is None:
-                combined_rule = rule
-            else:
-                combined_rule = Node('operator', 'AND', combined_rule, rule)
-        else:
+        if rule is None:
             raise ValueError("Encountered a None rule while combining.")
 
-    print(f"Combined rule: {combined_rule}")  # Debugging line
+    combined_rule = _balanced_tree(operator, list(rules))
+
+    logger.debug("Combined %d rules with %s: %s", len(rules), operator, combined_rule)
     return combined_rule
 
+def _balanced_tree(operator, nodes):
+    """Join nodes, in order, with operator as a balanced binary tree.
+
+    Evaluation order and short-circuiting are the same as a left-deep chain,
+    but the depth is log2(len(nodes)) instead of len(nodes).
+    """
+    while len(nodes) > 1:
+        paired = [Node('operator', operator, nodes[i], nodes[i + 1]) for i in range(0, len(nodes) - 1, 2)]
+        if len(nodes) % 2:
+            paired.append(nodes[-1])
+        nodes = paired
+    return nodes[0]
+
+def balance_rule(ast):
+    """Rebuild every chain of the same AND/OR operator in ast as a balanced tree."""
+    if not ast:
+        return ast
+
+    # Post-order walk over chains: a chain is rebuilt once all its children are.
+    balanced = {}
+    stack = [(ast, None)]
+    while stack:
+        node, children = stack.pop()
+        if not node or node.node_type != 'operator' or node.value not in ('AND', 'OR'):
+            balanced[id(node)] = node
+        elif children is None:
+            children = operator_children(node)
+            stack.append((node, children))
+            stack.extend((child, None) for child in children)
+        else:
+            balanced[id(node)] = _balanced_tree(node.value, [balanced[id(child)] for child in children])
+    return balanced[id(ast)]
+
 def reconstruct_ast(ast_data):
     """Reconstruct the AST from serialized data."""
     if not ast_data:
         return None
 
-    node_type = ast_data.get('node_type')
-    value = ast_data.get('value')
-    left = reconstruct_ast(ast_data.get('left'))
-    right = reconstruct_ast(ast_data.get('right'))
-
-    return Node(node_type, value=value, left=left, right=right)
-
+    # Built top-down with an explicit stack so deep trees can't hit the recursion limit
+    root = Node(ast_data.get('node_type'), value=ast_data.get('value'))
+    stack = [(ast_data, root)]
+    while stack:
+        data, node = stack.pop()
+        left = data.get('left')
+        right = data.get('right')
+        if left:
+            node.left = Node(left.get('node_type'), value=left.get('value'))
+            stack.append((left, node.left))
+        if right:
+            node.right = Node(right.get('node_type'), value=right.get('value'))
+            stack.append((right, node.right))
+
+    return root
@@ -0,0 +1,178 @@
+from bisect import bisect_left, bisect_right
+
+from rule_engine import operator_children
+from rule_set import RuleSet, predicate_key
+
+def required_operands(ast):
+    """Return {predicate key: operand value} for operands that must be True for ast to be True.
+
+    Every operand under an AND is required; under an OR only the operands
+    required by all of its branches are.
+    """
+    if ast is None:
+        return {}
+    if ast.node_type == 'operand':
+        return {predicate_key(ast.value): ast.value}
+    if ast.node_type != 'operator' or ast.value not in ('AND', 'OR'):
+        return {}
+
+    branches = [required_operands(child) for child in operator_children(ast)]
+    if ast.value == 'AND':
+        required = {}
+        for branch in branches:
+            required.update(branch)
+        return required
+    required = branches[0]
+    for branch in branches[1:]:
+        required = {key: value for key, value in required.items() if key in branch}
+    return required
+
+def _value_key(value):
+    """Bucket key for an equality lookup, mirroring evaluate_rule's type checks."""
+    if isinstance(value, str):
+        return (str, value)
+    if isinstance(value, int):
+        return (int, value)
+    return None
+
+class RuleIndex:
+    """Index over a rule set that finds candidate rules for a record without scanning them all.
+
+    Each rule is filed under one "anchor" operand that must be True for the
+    rule to match: `=`/`!=` anchors go in per-field hash maps, numeric `>`/`<`
+    anchors in per-field sorted threshold lists. For a record, only rules whose
+    anchor holds (plus rules with no usable anchor) are evaluated in full.
+
+    With evaluate=False the index only files rules for candidates(): they
+    are not compiled into a RuleSet and match() is unavailable, for callers
+    that already have compiled rules of their own.
+    """
+
+    def __init__(self, rules=None, evaluate=True):
+        self.rule_set = RuleSet() if evaluate else None
+        self._order = {}  # rule_id -> insertion sequence, to return matches in order
+        self._sequence = 0
+        self._anchors = {}  # rule_id -> anchor operand value, or None
+        self._unanchored = set()
+        self._equals = {}  # field -> value key -> set of rule IDs
+        self._not_equals = {}  # field -> value key -> set of rule IDs
+        self._greater = {}  # field -> ([thresholds], [rule IDs]), sorted by threshold
+        self._less = {}  # field -> ([thresholds], [rule IDs]), sorted by threshold
+        for rule_id, ast in (rules.items() if isinstance(rules, dict) else rules or ()):
+            self.add(rule_id, ast)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._order
+
+    def add(self, rule_id, ast):
+        """Add (or replace) a rule and file it under its anchor."""
+        if rule_id in self._order:
+            self.remove(rule_id)
+        if self.rule_set is not None:
+            self.rule_set.add(rule_id, ast)
+        self._order[rule_id] = self._sequence
+        self._sequence += 1
+
+        anchor = self._choose_anchor(required_operands(ast))
+        self._anchors[rule_id] = anchor
+        if anchor is None:
+            self._unanchored.add(rule_id)
+            return
+
+        field, op, val = anchor['field'], anchor['operator'], anchor['value']
+        if op in ('=', '!='):
+            buckets = self._equals if op == '=' else self._not_equals
+            buckets.setdefault(field, {}).setdefault(_value_key(val), set()).add(rule_id)
+        else:
+            thresholds, rule_ids = (self._greater if op == '>' else self._less).setdefault(field, ([], []))
+            position = bisect_right(thresholds, val)
+            thresholds.insert(position, val)
+            rule_ids.insert(position, rule_id)
+
+    def remove(self, rule_id):
+        """Remove a rule from the index and its rule set."""
+        if self.rule_set is not None:
+            self.rule_set.remove(rule_id)
+        del self._order[rule_id]
+        anchor = self._anchors.pop(rule_id)
+        if anchor is None:
+            self._unanchored.discard(rule_id)
+            return
+
+        field, op, val = anchor['field'], anchor['operator'], anchor['value']
+        if op in ('=', '!='):
+            buckets = self._equals if op == '=' else self._not_equals
+            bucket = buckets[field][_value_key(val)]
+            bucket.discard(rule_id)
+            if not bucket:
+                del buckets[field][_value_key(val)]
+                if not buckets[field]:
+                    del buckets[field]
+        else:
+            thresholds, rule_ids = (self._greater if op == '>' else self._less)[field]
+            position = bisect_left(thresholds, val)
+            while rule_ids[position] != rule_id:
+                position += 1
+            del thresholds[position]
+            del rule_ids[position]
+
+    def candidates(self, data):
+        """Return the set of rule IDs that could match data."""
+        found = set(self._unanchored)
+        for field, buckets in self._equals.items():
+            key = _value_key(data.get(field))
+            if key is not None and key in buckets:
+                found.update(buckets[key])
+        for field, buckets in self._not_equals.items():
+            key = _value_key(data.get(field))
+            if key is not None:
+                for bucket_key, rule_ids in buckets.items():
+                    # Only same-typed values compare in evaluate_rule.
+                    if bucket_key[0] is key[0] and bucket_key != key:
+                        found.update(rule_ids)
+        for field, (thresholds, rule_ids) in self._greater.items():
+            value = data.get(field)
+            if isinstance(value, int):
+                found.update(rule_ids[:bisect_left(thresholds, value)])
+        for field, (thresholds, rule_ids) in self._less.items():
+            value = data.get(field)
+            if isinstance(value, int):
+                found.update(rule_ids[bisect_right(thresholds, value):])
+        return found
+
+    def match(self, data, errors=None):
+        """Return the IDs of the rules that match data, in insertion order.
+
+        The matches are those of RuleSet.evaluate over all rules, but only
+        candidate rules are evaluated. So errors only gets the candidates
+        that reach a field missing from data: a rule ruled out by the index
+        is not reported even if evaluating it would have raised.
+        """
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+        if self.rule_set is None:
+            raise ValueError("This index was built with evaluate=False; it only finds candidates.")
+        candidates = sorted(self.candidates(data), key=self._order.__getitem__)
+        return self.rule_set.evaluate(data, errors, rule_ids=candidates)
+
+    @staticmethod
+    def _choose_anchor(required):
+        """Pick the most selective indexable operand among the required ones."""
+        best = None
+        best_rank = None
+        for value in required.values():
+            op, val = value['operator'], value['value']
+            if op == '=' and isinstance(val, (str, int)):
+                rank = 0
+            elif op in ('>', '<') and isinstance(val, int):
+                rank = 1
+            elif op == '!=' and isinstance(val, (str, int)):
+                rank = 2
+            else:
+                continue
+            if best_rank is None or rank < best_rank:
+                best, best_rank = value, rank
+        return best
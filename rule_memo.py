@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+from rule_engine import compile_rule
+
+def referenced_fields(ast):
+    """Return the fields the operands of ast read, sorted."""
+    fields = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node.node_type == 'operand' and isinstance(node.value, dict):
+            fields.add(node.value.get('field'))
+        stack.append(node.left)
+        stack.append(node.right)
+    return sorted(fields, key=str)
+
+class MemoizedRule:
+    """A compiled rule that remembers its results by the values of the fields it reads.
+
+    The cache key is the record's projection onto the rule's fields (values
+    and their types, since 1, 1.0 and True compare differently), so records
+    that differ only in other fields share one entry. Missing-field errors
+    are remembered too. At most `maxsize` results are kept, least recently
+    used first out; with `ttl` (seconds), results older than that are
+    recomputed. Records with unhashable values in those fields are evaluated
+    without the cache. Hit counts may be slightly low under heavy concurrent
+    use, as hits are counted without a lock.
+    """
+
+    def __init__(self, ast, maxsize=10000, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("Memo size must be at least 1.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # key -> (expiry time or None, result, error message or None)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.uncacheable = 0
+        self.set_rule(ast)
+
+    def __len__(self):
+        return len(self._results)
+
+    def set_rule(self, ast):
+        """Switch to a new version of the rule, dropping every remembered result."""
+        fields = tuple(referenced_fields(ast))
+        # itemgetter gives a tuple for two or more fields only
+        project = itemgetter(*fields) if len(fields) > 1 else lambda data: tuple(map(data.__getitem__, fields))
+        rule = (fields, project, compile_rule(ast))
+        with self._lock:
+            self.ast = ast
+            self._rule = rule  # (fields, projection, compiled rule), swapped together
+            self._results.clear()
+
+    @property
+    def fields(self):
+        return self._rule[0]
+
+    def clear(self):
+        """Forget every remembered result. Counters are kept."""
+        with self._lock:
+            self._results.clear()
+
+    def __call__(self, data):
+        """Evaluate the rule against data, as compile_rule's function would."""
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+        rule = self._rule
+        fields, project, evaluate = rule
+        try:
+            values = project(data)
+        except KeyError:
+            values = tuple([data.get(field) for field in fields])
+        key = tuple(map(type, values)) + values
+        now = self._clock() if self.ttl is not None else None
+
+        # Hits don't take the lock: the dict operations are atomic, and a key
+        # evicted between get and move_to_end is simply not moved.
+        results = self._results
+        try:
+            entry = results.get(key)
+        except TypeError:
+            self.uncacheable += 1
+            return evaluate(data)
+        if entry is not None and (now is None or entry[0] > now):
+            try:
+                results.move_to_end(key)
+            except KeyError:
+                pass
+            self.hits += 1
+            if entry[2] is not None:
+                raise ValueError(entry[2])
+            return entry[1]
+
+        try:
+            result, error = evaluate(data), None
+        except ValueError as e:
+            result, error = None, str(e)
+        with self._lock:
+            self.misses += 1
+            if entry is not None:
+                self.expirations += 1
+            if rule is self._rule:  # Don't store a result of a rule that was replaced meanwhile
+                results[key] = (now + self.ttl if now is not None else None, result, error)
+                while len(results) > self.maxsize:
+                    results.popitem(last=False)
+                    self.evictions += 1
+        if error is not None:
+            raise ValueError(error)
+        return result
+
+    evaluate = __call__
+
+    def stats(self):
+        """Return hit/miss/eviction/expiration counters, the hit rate and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'fields': list(self.fields),
+                'size': len(self._results),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'uncacheable': self.uncacheable,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,141 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, in the Prometheus histogram layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Request, latency, per-rule result and error metrics, rendered in Prometheus text format.
+
+    Nothing is recorded while `enabled` is False, so an unscraped server only
+    pays for an attribute check per instrumentation point. The /metrics
+    endpoint turns recording on at the first scrape.
+
+    Per-rule counters are kept for at most `max_rules` rule IDs; results of
+    further rules are counted under rule_id="other".
+    """
+
+    def __init__(self, enabled=False, max_rules=1000):
+        self.enabled = enabled
+        self.max_rules = max_rules
+        self._lock = threading.Lock()
+        self._requests = {}  # (endpoint, status) -> count
+        self._request_latency = {}  # endpoint -> Histogram
+        self._operation_latency = {}  # 'parse' / 'combine' / 'optimize' / 'evaluate' / 'query' -> Histogram
+        self._results = {}  # rule_id -> [true count, false count]
+        self._errors = {}  # (endpoint, exception type) -> count
+
+    def start(self):
+        """Return a start time for observe(), or None while disabled."""
+        return time.perf_counter() if self.enabled else None
+
+    def observe(self, operation, start):
+        """Record the time since start (from start()) as one `operation`."""
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            histogram = self._operation_latency.get(operation)
+            if histogram is None:
+                histogram = self._operation_latency[operation] = Histogram()
+            histogram.observe(elapsed)
+
+    def observe_request(self, endpoint, status, start):
+        """Count a finished request and record its latency since start."""
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            key = (endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._request_latency.get(endpoint)
+            if histogram is None:
+                histogram = self._request_latency[endpoint] = Histogram()
+            histogram.observe(elapsed)
+
+    def observe_result(self, rule_id, result):
+        """Count one evaluation of rule_id."""
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self._results.get(rule_id)
+            if counts is None:
+                if len(self._results) >= self.max_rules and rule_id != 'other':
+                    rule_id = 'other'
+                counts = self._results.setdefault(rule_id, [0, 0])
+            counts[0 if result else 1] += 1
+
+    def counting(self, rule_id, evaluate):
+        """Wrap an evaluate function so its results are counted for rule_id (or return it as is while disabled)."""
+        if not self.enabled:
+            return evaluate
+
+        def counted(data):
+            result = evaluate(data)
+            self.observe_result(rule_id, result)
+            return result
+        return counted
+
+    def observe_error(self, endpoint, error):
+        """Count an exception raised while handling endpoint, by its type."""
+        if not self.enabled:
+            return
+        with self._lock:
+            key = (endpoint, type(error).__name__)
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            _counter(lines, 'rule_engine_requests_total', "HTTP requests by endpoint and status.",
+                     (({'endpoint': endpoint, 'status': status}, count)
+                      for (endpoint, status), count in sorted(self._requests.items())))
+            _histograms(lines, 'rule_engine_request_duration_seconds', "HTTP request latency by endpoint.",
+                        'endpoint', self._request_latency)
+            _histograms(lines, 'rule_engine_operation_duration_seconds',
+                        "Latency of parse, combine and evaluate operations.", 'operation', self._operation_latency)
+            _counter(lines, 'rule_engine_rule_evaluations_total', "Rule evaluations by rule ID and result.",
+                     (({'rule_id': rule_id, 'result': result}, counts[index])
+                      for rule_id, counts in sorted(self._results.items())
+                      for index, result in enumerate(('true', 'false'))))
+            _counter(lines, 'rule_engine_errors_total', "Errors by endpoint and exception type.",
+                     (({'endpoint': endpoint, 'type': error_type}, count)
+                      for (endpoint, error_type), count in sorted(self._errors.items())))
+        return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def _counter(lines, name, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+def _histograms(lines, name, help_text, label, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({label: key, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{_labels({label: key})} {histogram.sum}")
+        lines.append(f"{name}_count{_labels({label: key})} {histogram.count}")
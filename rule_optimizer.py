@@ -0,0 +1,390 @@
+import json
+import math
+
+from rule_engine import Node, _balanced_tree, _between_type, operator_children
+
+# The values a condition accepts (or that a field can still have at some
+# point of a chain) are described per kind of value, as a 4-tuple:
+#   strings: None (none), ('in', frozenset) or ('not in', frozenset)
+#   ints (bools included): None, or (low, high, excluded) with inclusive
+#       bounds (-inf/inf when unbounded) and excluded points inside them
+#   floats: None, or (interval, excluded, nan) with interval None or
+#       (low, low_closed, high, high_closed) over -inf..inf, and nan True
+#       if NaN is included
+#   other: True if values of any other type (lists, dicts...) are included
+# Parts are kept in one canonical form, so equal sets compare equal.
+_INF = math.inf
+_ALL_FLOATS = (-_INF, True, _INF, True)
+_ANY = (('not in', frozenset()), (-_INF, _INF, frozenset()), (_ALL_FLOATS, frozenset(), True), True)
+_NONE = (None, None, None, False)
+
+def _ints(low, high, excluded=frozenset()):
+    excluded = {x for x in excluded if low <= x <= high}
+    while low in excluded:
+        excluded.discard(low)
+        low += 1
+    while high in excluded:
+        excluded.discard(high)
+        high -= 1
+    if low > high:
+        return None
+    return (low, high, frozenset(excluded))
+
+def _floats(interval, excluded=frozenset(), nan=False):
+    if interval is not None:
+        low, low_closed, high, high_closed = interval
+        excluded = {x for x in excluded if low <= x <= high}
+        if low in excluded:
+            excluded.discard(low)
+            low_closed = False
+        if high in excluded:
+            excluded.discard(high)
+            high_closed = False
+        if low > high or (low == high and not (low_closed and high_closed)):
+            interval = None
+        else:
+            interval = (low, low_closed, high, high_closed)
+    if interval is None:
+        excluded = ()
+        if not nan:
+            return None
+    return (interval, frozenset(excluded), nan)
+
+def _strings(kind, values):
+    values = frozenset(values)
+    if kind == 'in' and not values:
+        return None
+    return (kind, values)
+
+def _clause(value):
+    """Return (field, set of accepted values) for an operand, or (None, None) if it isn't understood.
+
+    Mirrors _evaluate_operand: for a present field, the operand is True
+    exactly when the field's value is in the set.
+    """
+    if not isinstance(value, dict) or not {'field', 'operator', 'value'} <= value.keys():
+        return None, None
+    field, op, val = value['field'], value['operator'], value['value']
+    try:
+        hash(field)
+    except TypeError:
+        return None, None
+
+    if isinstance(val, str):
+        if op in ('=', '!='):
+            return field, (_strings('in' if op == '=' else 'not in', (val,)), None, None, False)
+    elif isinstance(val, int):
+        val = int(val)
+        if op == '>':
+            return field, (None, _ints(val + 1, _INF), None, False)
+        if op == '<':
+            return field, (None, _ints(-_INF, val - 1), None, False)
+        if op == '=':
+            return field, (None, _ints(val, val), None, False)
+        if op == '!=':
+            return field, (None, _ints(-_INF, _INF, {val}), None, False)
+    elif isinstance(val, float):
+        if not math.isfinite(val):
+            return None, None
+        if op == '>':
+            return field, (None, _ints(math.floor(val) + 1, _INF), _floats((val, False, _INF, True)), False)
+        if op == '<':
+            return field, (None, _ints(-_INF, math.ceil(val) - 1), _floats((-_INF, True, val, False)), False)
+        if op == '=':
+            ints = _ints(int(val), int(val)) if val.is_integer() else None
+            return field, (None, ints, _floats((val, True, val, True)), False)
+        if op == '!=':
+            ints = _ints(-_INF, _INF, {int(val)} if val.is_integer() else ())
+            return field, (None, ints, _floats(_ALL_FLOATS, {val}, True), False)
+    elif isinstance(val, (list, tuple)):
+        if op in ('in', 'not in'):
+            return field, (_strings(op, (item for item in val if isinstance(item, str))), None, None, False)
+        kind = _between_type(val)
+        if op == 'between' and kind is int:
+            low, high = int(val[0]), int(val[1])
+            return field, (None, _ints(low + 1, high - 1), None, False)
+        if op == 'between' and kind is not None:
+            low, high = val
+            if not (math.isfinite(low) and math.isfinite(high)):
+                return None, None
+            return field, (None, _ints(math.floor(low) + 1, math.ceil(high) - 1),
+                           _floats((low, False, high, False)), False)
+    return field, _NONE
+
+def _intersect(a, b):
+    strings = ints = floats = None
+    if a[0] is not None and b[0] is not None:
+        (kind_a, values_a), (kind_b, values_b) = a[0], b[0]
+        if kind_a == 'in' and kind_b == 'in':
+            strings = _strings('in', values_a & values_b)
+        elif kind_a == 'in':
+            strings = _strings('in', values_a - values_b)
+        elif kind_b == 'in':
+            strings = _strings('in', values_b - values_a)
+        else:
+            strings = _strings('not in', values_a | values_b)
+    if a[1] is not None and b[1] is not None:
+        ints = _ints(max(a[1][0], b[1][0]), min(a[1][1], b[1][1]), a[1][2] | b[1][2])
+    if a[2] is not None and b[2] is not None:
+        interval = None
+        if a[2][0] is not None and b[2][0] is not None:
+            (low_a, low_closed_a, high_a, high_closed_a), (low_b, low_closed_b, high_b, high_closed_b) = a[2][0], b[2][0]
+            low = max(low_a, low_b)
+            low_closed = (low_a != low or low_closed_a) and (low_b != low or low_closed_b)
+            high = min(high_a, high_b)
+            high_closed = (high_a != high or high_closed_a) and (high_b != high or high_closed_b)
+            interval = (low, low_closed, high, high_closed)
+        floats = _floats(interval, a[2][1] | b[2][1], a[2][2] and b[2][2])
+    return (strings, ints, floats, a[3] and b[3])
+
+def _union(a, b):
+    """Return the union of two sets, or None if it can't be written in this form (e.g. two disjoint ranges)."""
+    if a[0] is None or b[0] is None:
+        strings = a[0] or b[0]
+    else:
+        (kind_a, values_a), (kind_b, values_b) = a[0], b[0]
+        if kind_a == 'in' and kind_b == 'in':
+            strings = _strings('in', values_a | values_b)
+        elif kind_a == 'in':
+            strings = _strings('not in', values_b - values_a)
+        elif kind_b == 'in':
+            strings = _strings('not in', values_a - values_b)
+        else:
+            strings = _strings('not in', values_a & values_b)
+
+    if a[1] is None or b[1] is None:
+        ints = a[1] or b[1]
+    else:
+        first, second = sorted((a[1], b[1]), key=lambda part: part[0])
+        holes = {x for x in first[2] if not _has_int(second, x)} | {x for x in second[2] if not _has_int(first, x)}
+        if second[0] == first[1] + 2:
+            holes.add(first[1] + 1)
+        elif second[0] > first[1] + 2:
+            return None
+        ints = _ints(first[0], max(first[1], second[1]), holes)
+
+    if a[2] is None or b[2] is None:
+        floats = a[2] or b[2]
+    elif a[2][0] is None or b[2][0] is None:
+        floats = _floats(a[2][0] or b[2][0], a[2][1] | b[2][1], a[2][2] or b[2][2])
+    else:
+        first, second = sorted((a[2], b[2]), key=lambda part: (part[0][0], not part[0][1]))
+        (low, low_closed, high_1, high_closed_1), (_, low_closed_2, high_2, high_closed_2) = first[0], second[0]
+        holes = {x for x in first[1] if not _has_float(second, x)} | {x for x in second[1] if not _has_float(first, x)}
+        gap = second[0][0]
+        if gap > high_1:
+            return None
+        if gap == high_1 and not (high_closed_1 or low_closed_2):
+            holes.add(gap)
+        if high_2 > high_1:
+            high, high_closed = high_2, high_closed_2
+        elif high_1 > high_2:
+            high, high_closed = high_1, high_closed_1
+        else:
+            high, high_closed = high_1, high_closed_1 or high_closed_2
+        floats = _floats((low, low_closed, high, high_closed), holes, first[2] or second[2])
+    return (strings, ints, floats, a[3] or b[3])
+
+def _has_int(part, x):
+    return part[0] <= x <= part[1] and x not in part[2]
+
+def _has_float(part, x):
+    if part[0] is None or x in part[1]:
+        return False
+    low, low_closed, high, high_closed = part[0]
+    return (low < x or (low_closed and low == x)) and (x < high or (high_closed and x == high))
+
+def _complement(a):
+    """Return the values not in a, or a superset of them where they can't be written in this form."""
+    if a[0] is None:
+        strings = ('not in', frozenset())
+    else:
+        strings = _strings('not in' if a[0][0] == 'in' else 'in', a[0][1])
+
+    ints = (-_INF, _INF, frozenset())
+    if a[1] is None:
+        pass
+    elif a[1][2]:
+        if a[1][:2] == (-_INF, _INF) and len(a[1][2]) == 1:
+            point, = a[1][2]
+            ints = _ints(point, point)
+    elif a[1][:2] == (-_INF, _INF):
+        ints = None
+    elif a[1][0] == -_INF:
+        ints = _ints(a[1][1] + 1, _INF)
+    elif a[1][1] == _INF:
+        ints = _ints(-_INF, a[1][0] - 1)
+    elif a[1][0] == a[1][1]:
+        ints = _ints(-_INF, _INF, {a[1][0]})
+
+    floats = (_ALL_FLOATS, frozenset(), True)
+    if a[2] is not None:
+        interval, excluded, nan = a[2]
+        if interval is None:
+            floats = _floats(_ALL_FLOATS, (), not nan)
+        elif excluded:
+            if interval == _ALL_FLOATS and len(excluded) == 1:
+                point, = excluded
+                floats = _floats((point, True, point, True), (), not nan)
+        elif interval == _ALL_FLOATS:
+            floats = _floats(None, (), not nan)
+        elif interval[:2] == (-_INF, True):
+            floats = _floats((interval[2], not interval[3], _INF, True), (), not nan)
+        elif interval[2:] == (_INF, True):
+            floats = _floats((-_INF, True, interval[0], not interval[1]), (), not nan)
+        elif interval[0] == interval[2]:
+            floats = _floats(_ALL_FLOATS, {interval[0]}, not nan)
+    return (strings, ints, floats, not a[3])
+
+def _is_empty(a):
+    return a == _NONE
+
+def _decide(known, clause):
+    """Return the value a clause must have for a field whose value is in known, or None if it can be either."""
+    both = _intersect(known, clause)
+    if _is_empty(both):
+        return False
+    if both == known:
+        return True
+    return None
+
+def _operand_for(field, accepted):
+    """Return an operand value accepting exactly the given set, or None if no single operand does."""
+    strings, ints, floats, other = accepted
+    candidates = []
+    if strings is not None and ints is None and floats is None:
+        kind, values = strings
+        ordered = sorted(values)
+        if len(ordered) == 1:
+            candidates.append(('=' if kind == 'in' else '!=', ordered[0]))
+        candidates.append((kind, ordered))
+    elif strings is None and ints is not None and floats is None:
+        low, high, excluded = ints
+        candidates += [('>', low - 1), ('<', high + 1), ('=', low), ('between', [low - 1, high + 1])]
+        candidates += [('!=', point) for point in excluded]
+    elif strings is None and floats is not None and floats[0] is not None:
+        (low, _, high, _), excluded, _ = floats
+        candidates += [('>', low), ('<', high), ('=', low), ('between', [low, high])]
+        candidates += [('!=', point) for point in excluded]
+    for op, val in candidates:
+        if any(isinstance(bound, float) and not math.isfinite(bound) for bound in (val if op == 'between' else [val])):
+            continue
+        value = {'field': field, 'operator': op, 'value': val}
+        if _clause(value)[1] == accepted:
+            return value
+    return None
+
+def _key(ast):
+    try:
+        return json.dumps(ast.to_dict(), sort_keys=True) if ast else None
+    except (TypeError, ValueError):
+        return None
+
+def optimize_rule(ast):
+    """Return a simplified version of ast that evaluates exactly like it.
+
+    Within each AND/OR chain, a condition whose value is already settled by
+    the conditions on the same field before it is dropped (or, if it ends
+    the chain, replaced by a constant and the rest of the chain with it),
+    repeated subtrees are dropped, and neighbouring conditions on one field
+    are merged into a single one: numeric ranges into `>`, `<`, `=` or
+    'between' [low, high] (exclusive) and string equalities into 'in' lists.
+    What's known about a field carries into nested chains. Results and
+    missing-field errors are identical to the original's for every record:
+    a field's first condition is always kept, since it raises when the field
+    is missing. ast is left unchanged.
+    """
+    if not ast:
+        return ast
+    try:
+        return _optimize(ast, {})
+    except RecursionError:
+        return ast
+
+def _optimize(ast, known):
+    if ast is None or ast.node_type == 'operand':
+        return ast
+    if ast.node_type == 'operator' and ast.value in ('AND', 'OR'):
+        return _optimize_chain(ast, known)
+    return Node('constant', ast.node_type == 'constant' and ast.value is True)
+
+def _optimize_chain(ast, known):
+    op = ast.value
+    children = operator_children(ast)
+    if None in children:
+        return ast  # An empty child raises wherever it sits; leave the chain alone
+
+    known = dict(known)  # field -> the values it can have when the next child is reached
+    seen = set()
+    kept = []  # (node, field, accepted values) for each remaining child; field is None if not an understood operand
+    for child in children:
+        key = _key(child)
+        if key is not None:
+            if key in seen:
+                continue  # Evaluated already with the same data, and it didn't end the chain
+            seen.add(key)
+
+        field = accepted = None
+        if child.node_type == 'operand':
+            field, accepted = _clause(child.value)
+            if accepted is not None and field in known:
+                settled = _decide(known[field], accepted)
+                if settled is not None:
+                    child = Node('constant', settled)
+        else:
+            child = _optimize(child, known)
+
+        if child.node_type == 'constant':
+            if child.value == (op == 'OR'):
+                kept.append((child, None, None))
+                break
+            continue
+        if accepted is not None:
+            # Reaching the next child means this one was True (AND) or False (OR), without error.
+            known[field] = _intersect(known.get(field, _ANY), accepted if op == 'AND' else _complement(accepted))
+        kept.append((child, field, accepted))
+
+    merged = []
+    for node, field, accepted in kept:
+        if merged and accepted is not None and merged[-1][2] is not None and merged[-1][1] == field:
+            combined = (_intersect if op == 'AND' else _union)(merged[-1][2], accepted)
+            value = _operand_for(merged[-1][1], combined) if combined is not None else None
+            if value is not None:
+                merged[-1] = (Node('operand', value), merged[-1][1], combined)
+                continue
+        merged.append((node, field, accepted))
+
+    if not merged:
+        return Node('constant', op == 'AND')
+    return _balanced_tree(op, [node for node, _, _ in merged])
+
+def constant_value(ast):
+    """Return True or False if ast has that value for every record it doesn't raise an error on, else None.
+
+    Meant for optimize_rule's output, where contradictions and tautologies
+    within a chain show up as constants.
+    """
+    can_be_true, can_be_false = _outcomes(ast)
+    if can_be_true and can_be_false:
+        return None
+    if can_be_true:
+        return True
+    if can_be_false:
+        return False
+    return None  # Always raises
+
+def _outcomes(ast):
+    """Return (can be True, can be False) for ast, erring on the side of True."""
+    if ast is None:
+        return False, False
+    if ast.node_type == 'operand':
+        field, accepted = _clause(ast.value)
+        return accepted is None or not _is_empty(accepted), True
+    if ast.node_type != 'operator' or ast.value not in ('AND', 'OR'):
+        value = ast.node_type == 'constant' and ast.value is True
+        return value, not value
+
+    outcomes = [_outcomes(child) for child in operator_children(ast)]
+    if ast.value == 'AND':
+        return all(true for true, _ in outcomes), any(false for _, false in outcomes)
+    return any(true for true, _ in outcomes), all(false for _, false in outcomes)
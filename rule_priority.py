@@ -0,0 +1,120 @@
+import math
+
+from rule_index import RuleIndex, required_operands
+
+MODES = ('first', 'top_k', 'all')
+
+class PriorityRuleSet:
+    """Rules with priorities, evaluated from the highest priority down.
+
+    evaluate() returns the matching rule IDs in priority order (ties in the
+    order the rules were added) and stops as soon as the answer is settled:
+    after the first match in 'first' mode, after k matches in 'top_k' mode.
+    Rules are only evaluated if they could match the record: a RuleIndex
+    filters them on one required condition each, and rules needing a field
+    the record doesn't have are skipped. Skipped rules report no errors.
+
+    With compile=False, rules are not compiled into the index's RuleSet:
+    each is added with its own evaluate function (e.g. a cached compiled
+    rule) and entries of `rules` are (rule_id, ast, priority, evaluate).
+    """
+
+    def __init__(self, rules=None, compile=True):
+        self.index = RuleIndex(evaluate=compile)
+        self._evaluators = None if compile else {}  # rule_id -> evaluate function
+        self._priorities = {}  # rule_id -> priority
+        self._rank = {}  # rule_id -> sort key: higher priority first, then insertion order
+        self._required_fields = {}  # rule_id -> fields the rule can't match without
+        self._ordered = []  # rule IDs by rank, rebuilt after changes
+        self._sequence = 0
+        for rule in rules or ():
+            self.add(*rule)
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._priorities
+
+    def priority(self, rule_id):
+        return self._priorities[rule_id]
+
+    def add(self, rule_id, ast, priority=0, evaluate=None):
+        """Add (or replace) a rule with the given priority; larger numbers are evaluated first.
+
+        evaluate is required, and only allowed, with compile=False.
+        """
+        if isinstance(priority, bool) or not isinstance(priority, (int, float)) or math.isnan(priority):
+            raise ValueError("Priority must be a number.")
+        if (evaluate is None) != (self._evaluators is None):
+            raise ValueError("Rules need an evaluate function exactly when the set is built with compile=False.")
+        self.index.add(rule_id, ast)
+        if evaluate is not None:
+            self._evaluators[rule_id] = evaluate
+        self._priorities[rule_id] = priority
+        self._rank[rule_id] = (-priority, self._sequence)
+        self._sequence += 1
+        self._required_fields[rule_id] = tuple({value['field'] for value in required_operands(ast).values()})
+        self._ordered = None
+
+    def remove(self, rule_id):
+        self.index.remove(rule_id)
+        del self._priorities[rule_id]
+        del self._rank[rule_id]
+        del self._required_fields[rule_id]
+        if self._evaluators is not None:
+            del self._evaluators[rule_id]
+        self._ordered = None
+
+    def evaluate(self, data, mode='first', k=1, errors=None):
+        """Return the IDs of the matching rules, highest priority first.
+
+        mode is 'first' (at most one rule), 'top_k' (at most k rules) or
+        'all'. If an errors dict is given, it receives rule_id -> message for
+        evaluated rules that reached a missing field.
+        """
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+        if mode == 'first':
+            limit = 1
+        elif mode == 'top_k':
+            if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+                raise ValueError("k must be a positive integer.")
+            limit = k
+        elif mode == 'all':
+            limit = None
+        else:
+            raise ValueError(f"Unsupported mode: {mode}")
+
+        if self._ordered is None:
+            self._ordered = sorted(self._priorities, key=self._rank.__getitem__)
+        # Walked lazily, so 'first' and 'top_k' stop looking once enough rules matched.
+        rule_ids = self._possible(data, self.index.candidates(data))
+        if self._evaluators is None:
+            return self.index.rule_set.evaluate(data, errors, rule_ids=rule_ids, limit=limit)
+
+        matches = []
+        for rule_id in rule_ids:
+            try:
+                if self._evaluators[rule_id](data):
+                    matches.append(rule_id)
+                    if len(matches) == limit:
+                        break
+            except ValueError as e:
+                if errors is not None:
+                    errors[rule_id] = str(e)
+        return matches
+
+    def _possible(self, data, candidates):
+        """Yield, in priority order, the candidate rules whose required fields are all in data."""
+        required = self._required_fields
+        for rule_id in self._ordered:
+            if rule_id in candidates:
+                fields = required[rule_id]
+                if not fields or all(data.get(field) is not None for field in fields):
+                    yield rule_id
+
+    def first(self, data):
+        """Return the ID of the highest-priority rule that matches data, or None."""
+        matches = self.evaluate(data, 'first')
+        return matches[0] if matches else None
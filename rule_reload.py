@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from rule_engine import Node, create_rule, reconstruct_ast
+from rule_set import RuleSet
+
+def build_rule(rule_id, source):
+    """Return the AST for a rule given as a rule string, a serialized AST dict or a Node."""
+    try:
+        if isinstance(source, Node):
+            return source
+        if isinstance(source, str):
+            return create_rule(source)
+        if isinstance(source, dict):
+            return reconstruct_ast(source)
+    except ValueError as e:
+        raise ValueError(f"Rule '{rule_id}': {e}") from e
+    raise ValueError(f"Rule '{rule_id}' must be a rule string or an AST.")
+
+def diff_update(sources, add=None, replace=None, remove=None):
+    """Check an update against the current sources; return (rule ID -> source to (re)build, IDs to remove)."""
+    add = dict(add or {})
+    replace = dict(replace or {})
+    remove = list(remove or ())
+
+    for rule_id in add:
+        if rule_id in sources:
+            raise ValueError(f"Rule '{rule_id}' already exists.")
+    for rule_id in list(replace) + remove:
+        if rule_id not in sources:
+            raise ValueError(f"Unknown rule ID '{rule_id}'.")
+    seen = set()
+    for rule_id in list(add) + list(replace) + remove:
+        if rule_id in seen:
+            raise ValueError(f"Rule '{rule_id}' appears more than once in the update.")
+        seen.add(rule_id)
+    return {**add, **replace}, remove
+
+def diff_load(sources, rules):
+    """Return (rule ID -> source to (re)build, IDs to remove) to turn sources into rules."""
+    changed = {rule_id: source for rule_id, source in rules.items()
+               if rule_id not in sources or sources[rule_id] != source}
+    removed = [rule_id for rule_id in sources if rule_id not in rules]
+    return changed, removed
+
+class RuleSetVersion:
+    """One immutable version of the rules served by a RuleSetHolder.
+
+    Its RuleSet is never modified once the version is published, so anything
+    holding a version can keep evaluating against it while newer ones are
+    built and swapped in.
+    """
+
+    __slots__ = ('version', 'rule_set', 'sources')
+
+    def __init__(self, version, rule_set, sources):
+        self.version = version
+        self.rule_set = rule_set
+        self.sources = MappingProxyType(sources)  # rule_id -> source the rule was built from
+
+    def __len__(self):
+        return len(self.rule_set)
+
+    def __contains__(self, rule_id):
+        return rule_id in self.rule_set
+
+    def evaluate(self, data, errors=None, rule_ids=None):
+        """Return the IDs of the matching rules, as RuleSet.evaluate does."""
+        return self.rule_set.evaluate(data, errors, rule_ids)
+
+class RuleSetHolder:
+    """A named rule set that can be changed while it is being evaluated.
+
+    Every change builds a new RuleSetVersion from a copy of the current one
+    and then publishes it with a single reference assignment. Evaluations
+    never take a lock: each one reads `current` once and runs to the end on
+    that version, even if a newer version is published meanwhile.
+
+    Changes are diffs of added, replaced and removed rules. Only those rules
+    are parsed and compiled; the rest are carried over from the previous
+    version, sharing their operands and compiled code. Changes are applied
+    one at a time, in the order they were made, and a change that fails
+    (unknown rule ID, parse error) leaves the current version as it was.
+    """
+
+    def __init__(self, rules=None):
+        self._current = RuleSetVersion(0, RuleSet(), {})
+        self._lock = threading.Lock()  # Serializes updates; evaluations don't take it
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        if rules:
+            self.load(rules)
+
+    @property
+    def current(self):
+        """The latest published RuleSetVersion."""
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def evaluate(self, data, errors=None, rule_ids=None):
+        """Evaluate the current version against data and return the IDs of the matching rules."""
+        return self._current.evaluate(data, errors, rule_ids)
+
+    def update(self, add=None, replace=None, remove=None):
+        """Apply a diff and publish the result. Returns the new version (or the current one if nothing changed).
+
+        add and replace map rule IDs to rule strings, serialized ASTs or
+        Nodes; remove lists rule IDs. Added rules must be new, replaced and
+        removed ones must exist.
+        """
+        with self._lock:
+            base = self._current
+            return self._publish(base, *diff_update(base.sources, add, replace, remove))
+
+    def load(self, rules):
+        """Make rules (a dict of rule ID -> source) the whole set. Returns the new version.
+
+        Rules whose source is unchanged from the current version are not
+        rebuilt.
+        """
+        rules = dict(rules)
+        with self._lock:
+            base = self._current
+            return self._publish(base, *diff_load(base.sources, rules))
+
+    def update_async(self, add=None, replace=None, remove=None):
+        """Like update, but build the new version on the background thread. Returns a Future of the version."""
+        return self._background().submit(self.update, add, replace, remove)
+
+    def load_async(self, rules):
+        """Like load, but build the new version on the background thread. Returns a Future of the version."""
+        return self._background().submit(self.load, dict(rules))
+
+    def close(self):
+        """Wait for pending background updates and stop the background thread."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _background(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rule-reload')
+            return self._executor
+
+    def _publish(self, base, changed, removed):
+        """Build the version after base with changed rules (re)built and removed ones dropped, and publish it."""
+        if not changed and not removed:
+            return base.version
+        # Parse everything first so a bad rule fails before anything is copied.
+        asts = {rule_id: build_rule(rule_id, source) for rule_id, source in changed.items()}
+
+        rule_set = base.rule_set.copy()
+        sources = dict(base.sources)
+        for rule_id in removed:
+            rule_set.remove(rule_id)
+            del sources[rule_id]
+        for rule_id, ast in asts.items():
+            rule_set.add(rule_id, ast)
+            sources.pop(rule_id, None)  # Replaced rules move to the end, as in the RuleSet
+            sources[rule_id] = changed[rule_id]
+
+        version = RuleSetVersion(base.version + 1, rule_set, sources)
+        self._current = version
+        return version.version
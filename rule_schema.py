@@ -0,0 +1,233 @@
+from rule_engine import Node, compile_rule, create_rule
+
+# Field type -> operators its rules may use ('in', 'not in' and 'between' come from optimize_rule)
+OPERATORS = {
+    'int': ('>', '<', '=', '!=', 'between'),
+    'float': ('>', '<', '=', '!=', 'between'),
+    'string': ('=', '!=', 'in', 'not in'),
+    'enum': ('=', '!=', 'in', 'not in'),
+}
+
+class SchemaError(ValueError):
+    """A rule or record that doesn't fit the schema; field is the field concerned (if any)."""
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.field = field
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    if isinstance(value, int):
+        return int(value)
+    raise ValueError(value)
+
+def _to_float(value):
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return float(value)
+    raise ValueError(value)
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(value)
+
+class Schema:
+    """Declared record fields and their types, for validating rules and coercing records.
+
+    Fields map to 'int', 'float', 'string' or a list of allowed strings (an
+    enum). With a schema, rules are checked when they are created (unknown
+    fields, operators the type doesn't support, constants of the wrong type)
+    and records are converted once, by coerce(), so the functions from
+    compile() can compare values directly instead of checking their types on
+    every call.
+    """
+
+    def __init__(self, fields):
+        if not fields:
+            raise SchemaError("Schema must declare at least one field.")
+        self.types = {}  # field -> 'int' / 'float' / 'string' / 'enum'
+        self.enums = {}  # enum field -> frozenset of allowed values
+        for field, spec in dict(fields).items():
+            if isinstance(spec, (list, tuple, set, frozenset)):
+                if not spec or not all(isinstance(value, str) for value in spec):
+                    raise SchemaError(f"Enum field '{field}' needs a non-empty list of strings.", field)
+                self.types[field] = 'enum'
+                self.enums[field] = frozenset(spec)
+            elif spec in ('int', 'float', 'string'):
+                self.types[field] = spec
+            else:
+                raise SchemaError(f"Unknown type {spec!r} for field '{field}' "
+                                  "(expected int, float, string or a list of enum values).", field)
+        # Converters are chosen once per field, not per value.
+        self._converters = [(field, self._converter(field)) for field in self.types]
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a schema from {"fields": {...}} or a plain field -> type dict (e.g. loaded from JSON)."""
+        if isinstance(data, dict) and isinstance(data.get('fields'), dict):
+            data = data['fields']
+        if not isinstance(data, dict):
+            raise SchemaError("Schema must be an object mapping field names to types.")
+        return cls(data)
+
+    def to_dict(self):
+        return {field: sorted(self.enums[field]) if kind == 'enum' else kind for field, kind in self.types.items()}
+
+    def create_rule(self, rule_string):
+        """Parse rule_string and check it against the schema."""
+        return create_rule(rule_string, schema=self)
+
+    def validate(self, ast):
+        """Check every operand of ast against the schema; raise SchemaError if one doesn't fit.
+
+        Returns the rule with integer constants of float fields turned into
+        floats, so evaluate_rule and optimize_rule compare them with int and
+        float values as compile() does; rules optimized after this (e.g.
+        created with create_rule(..., schema=schema)) can be compiled as they
+        are. ast itself is never modified: it is returned as is if nothing
+        needed converting, and otherwise only the changed nodes and their
+        ancestors are new.
+        """
+        # Children are checked (and rebuilt if needed) before their parent, with an explicit stack.
+        results = []
+        stack = [(ast, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not node:
+                results.append(node)
+            elif node.node_type == 'operand':
+                self._validate_operand(node.value)
+                value = node.value
+                if self.types[value['field']] == 'float':
+                    value = self._float_operand(value)
+                results.append(node if value is node.value else Node('operand', value))
+            elif not children_done:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+            else:
+                right = results.pop()
+                left = results.pop()
+                if left is not node.left or right is not node.right:
+                    node = Node(node.node_type, node.value, left, right)
+                results.append(node)
+        return results[0]
+
+    def coerce(self, record):
+        """Return the declared fields of record, converted to their types.
+
+        Fields that are missing or None are left out, so evaluation reports
+        them as missing; undeclared fields are dropped. A value that can't be
+        converted raises SchemaError.
+        """
+        coerced = {}
+        for field, convert in self._converters:
+            value = record.get(field)
+            if value is None:
+                continue
+            try:
+                coerced[field] = convert(value)
+            except (ValueError, TypeError, OverflowError):
+                raise SchemaError(self._type_error(field, value), field) from None
+        return coerced
+
+    def compile(self, ast):
+        """Validate ast and compile it into a function over records returned by coerce().
+
+        Each operand's comparison is chosen for its field type when the rule
+        is compiled, so evaluation does a dict lookup and one comparison per
+        operand. Results match evaluate_rule on the coerced record (and on the
+        validated ast). Rules from optimize_rule, with 'in', 'not in',
+        'between' and constant nodes, compile too.
+        """
+        return compile_rule(self.validate(ast), self._compile_operand)
+
+    def _validate_operand(self, value):
+        if not isinstance(value, dict) or value.keys() != {'field', 'operator', 'value'}:
+            raise SchemaError(f"Invalid operand {value!r}.")
+        field, op, val = value['field'], value['operator'], value['value']
+        kind = self.types.get(field)
+        if kind is None:
+            raise SchemaError(f"Unknown field '{field}'.", field)
+        if op not in OPERATORS[kind]:
+            raise SchemaError(f"Operator '{op}' is not supported for {kind} field '{field}'.", field)
+        # 'in' / 'not in' take a list of strings and 'between' a [low, high] pair; each item is checked as a constant
+        if op in ('in', 'not in', 'between'):
+            if not isinstance(val, (list, tuple)) or (op == 'between' and len(val) != 2):
+                raise SchemaError(f"Field '{field}' is {kind}; cannot compare it with {val!r}.", field)
+            constants = val
+        else:
+            constants = [val]
+        for constant in constants:
+            if kind == 'int':
+                valid = isinstance(constant, int) and not isinstance(constant, bool)
+            elif kind == 'float':
+                valid = isinstance(constant, (int, float)) and not isinstance(constant, bool)
+            else:
+                valid = isinstance(constant, str)
+            if not valid:
+                raise SchemaError(f"Field '{field}' is {kind}; cannot compare it with {val!r}.", field)
+            if kind == 'enum' and constant not in self.enums[field]:
+                raise SchemaError(f"{constant!r} is not one of the values of field '{field}'.", field)
+
+    @staticmethod
+    def _float_operand(value):
+        val = value['value']
+        if value['operator'] == 'between':
+            if all(isinstance(bound, float) for bound in val):
+                return value
+            return dict(value, value=[float(bound) for bound in val])
+        return value if isinstance(val, float) else dict(value, value=float(val))
+
+    def _converter(self, field):
+        kind = self.types[field]
+        if kind == 'int':
+            return _to_int
+        if kind == 'float':
+            return _to_float
+        if kind == 'string':
+            return _to_string
+        allowed = self.enums[field]
+
+        def to_enum(value):
+            if value not in allowed:
+                raise ValueError(value)
+            return value
+        return to_enum
+
+    def _type_error(self, field, value):
+        kind = self.types[field]
+        if kind == 'enum':
+            return f"Field '{field}' must be one of {sorted(self.enums[field])}, got {value!r}."
+        return f"Field '{field}' expects {kind}, got {value!r}."
+
+    def _compile_operand(self, value, namespace):
+        """Return a comparison for one operand with no type checks (records are already coerced)."""
+        field, op, val = value['field'], value['operator'], value['value']
+        if self.types[field] == 'float':
+            val = [float(bound) for bound in val] if op == 'between' else float(val)
+
+        index = len(namespace)
+        field_name = f"_f{index}"
+        value_name = f"_c{index}"
+        namespace[field_name] = field
+        missing = f"_missing({field_name}) if (_v := _get({field_name})) is None else "
+        if op == 'between':
+            high_name = f"_d{index}"
+            namespace[value_name], namespace[high_name] = val
+            return f"({missing}{value_name} < _v < {high_name})"
+        if op in ('in', 'not in'):
+            namespace[value_name] = frozenset(val)
+            return f"({missing}_v {op} {value_name})"
+        namespace[value_name] = val
+        compare = '==' if op == '=' else op
+        return f"({missing}_v {compare} {value_name})"
@@ -0,0 +1,236 @@
+import threading
+from collections import OrderedDict
+
+from rule_engine import compile_rule, evaluate_rule
+
+_UNKNOWN = object()  # subtree value not computed (or invalidated) for this entity
+
+_AND, _OR, _LEAF = range(3)
+
+class _Entity:
+    __slots__ = ('record', 'values', 'matches')
+
+    def __init__(self, node_count, rule_count):
+        self.record = {}
+        self.values = [_UNKNOWN] * node_count  # node index -> True, False or the ValueError it raised
+        self.matches = bytearray(rule_count)  # rule index -> 1 if the rule matched
+
+class RuleSession:
+    """Re-evaluates a fixed set of rules for tracked entities as their fields change.
+
+    For every entity the session keeps its record and the last value of each
+    subtree of each rule. An update only invalidates the subtrees that contain
+    a changed field and recomputes the rules above them, reusing everything
+    else, and reports the rules whose result flipped.
+
+    Rule results follow RuleSet: a rule that reaches a missing field does not
+    match, and its error is available from errors(). At most `max_entities`
+    entities are tracked; the least recently updated one is forgotten when a
+    new one arrives, and its next update starts from an empty record.
+    """
+
+    def __init__(self, rules, max_entities=10000):
+        if max_entities < 1:
+            raise ValueError("max_entities must be at least 1.")
+        self.max_entities = max_entities
+        self.evictions = 0
+        self._rule_ids = []
+        self._roots = []  # rule index -> root node index
+        self._nodes = []  # node index -> (kind, left index or leaf check, right index)
+        self._dependents = {}  # field -> node indexes whose subtree uses the field
+        self._field_rules = {}  # field -> indexes of rules that use the field
+        self._entities = OrderedDict()  # entity ID -> _Entity, least recently updated first
+        self._lock = threading.Lock()
+        for rule_id, ast in (rules.items() if isinstance(rules, dict) else rules):
+            self._add_rule(rule_id, ast)
+        self._dependents = {field: tuple(nodes) for field, nodes in self._dependents.items()}
+        self._all_rules = range(len(self._rule_ids))
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, entity_id):
+        return entity_id in self._entities
+
+    def update(self, entity_id, changes):
+        """Apply field changes to an entity and return {rule_id: new result} for the rules that flipped.
+
+        A value of None removes the field. On an entity's first update every
+        rule is reported.
+        """
+        with self._lock:
+            entity = self._entities.get(entity_id)
+            if entity is None:
+                entity = self._track(entity_id)
+                was_empty = True
+                affected = self._all_rules
+                first = True
+            else:
+                self._entities.move_to_end(entity_id)
+                was_empty = not entity.record
+                affected = set()
+                first = False
+
+            record = entity.record
+            values = entity.values
+            changed = []
+            for field, value in changes.items():
+                old = record.get(field)
+                if old is value or (type(old) is type(value) and old == value):
+                    continue
+                if value is None:
+                    del record[field]
+                else:
+                    record[field] = value
+                changed.append(field)
+
+            if not first:
+                if was_empty != (not record):
+                    # Every operand raises on an empty record, whatever its field.
+                    values[:] = [_UNKNOWN] * len(values)
+                    affected = self._all_rules
+                else:
+                    for field in changed:
+                        for node in self._dependents.get(field, ()):
+                            values[node] = _UNKNOWN
+                        affected.update(self._field_rules.get(field, ()))
+
+            flips = {}
+            matches = entity.matches
+            for rule in affected:
+                match = self._value(entity, self._roots[rule]) is True
+                if first or match != matches[rule]:
+                    matches[rule] = match
+                    flips[self._rule_ids[rule]] = match
+            return flips
+
+    def results(self, entity_id):
+        """Return {rule_id: True/False} for a tracked entity."""
+        with self._lock:
+            entity = self._entities[entity_id]
+            return {rule_id: bool(match) for rule_id, match in zip(self._rule_ids, entity.matches)}
+
+    def errors(self, entity_id):
+        """Return {rule_id: error message} for the rules that hit a missing field for this entity."""
+        with self._lock:
+            entity = self._entities[entity_id]
+            errors = {}
+            for rule_id, root in zip(self._rule_ids, self._roots):
+                value = self._value(entity, root)
+                if value is not True and value is not False:
+                    errors[rule_id] = str(value)
+            return errors
+
+    def record(self, entity_id):
+        """Return a copy of the entity's current record."""
+        with self._lock:
+            return dict(self._entities[entity_id].record)
+
+    def forget(self, entity_id):
+        """Stop tracking an entity."""
+        with self._lock:
+            self._entities.pop(entity_id, None)
+
+    def _track(self, entity_id):
+        entity = self._entities[entity_id] = _Entity(len(self._nodes), len(self._rule_ids))
+        while len(self._entities) > self.max_entities:
+            self._entities.popitem(last=False)
+            self.evictions += 1
+        return entity
+
+    def _value(self, entity, index):
+        """Return the value of node index for entity, computing only what isn't cached."""
+        values = entity.values
+        value = values[index]
+        if value is not _UNKNOWN:
+            return value
+
+        nodes = self._nodes
+        record = entity.record
+        stack = [index]
+        while stack:
+            node = stack[-1]
+            if values[node] is not _UNKNOWN:
+                stack.pop()
+                continue
+            kind, left, right = nodes[node]
+            if kind == _LEAF:
+                try:
+                    values[node] = bool(left(record))
+                except ValueError as e:
+                    values[node] = e
+                stack.pop()
+                continue
+
+            value = values[left]
+            if value is _UNKNOWN:
+                stack.append(left)
+                continue
+            # The left side decides the node if it raised, or is False under
+            # AND / True under OR; otherwise the right side does.
+            if (value is not True and value is not False) or value is (kind == _OR):
+                values[node] = value
+                stack.pop()
+                continue
+            value = values[right]
+            if value is _UNKNOWN:
+                stack.append(right)
+                continue
+            values[node] = value
+            stack.pop()
+        return values[index]
+
+    def _add_rule(self, rule_id, ast):
+        if ast is None:
+            raise ValueError("AST cannot be empty.")
+        rule = len(self._rule_ids)
+        self._rule_ids.append(rule_id)
+
+        # Number the nodes in preorder, then collect each subtree's fields bottom-up.
+        fields = {}  # node index -> fields used in its subtree
+        order = []
+        stack = [(ast, None, None)]
+        while stack:
+            node, parent, side = stack.pop()
+            index = len(self._nodes)
+            if node.node_type == 'operator' and node.value in ('AND', 'OR') and node.left and node.right:
+                self._nodes.append([_AND if node.value == 'AND' else _OR, None, None])
+                stack.append((node.right, index, 2))
+                stack.append((node.left, index, 1))
+                fields[index] = set()
+            else:
+                # Operands and anything unusual are evaluated whole, like evaluate_rule would.
+                check = compile_rule(node) if node.node_type == 'operand' else _whole(node)
+                self._nodes.append([_LEAF, check, None])
+                fields[index] = _fields(node)
+            if parent is None:
+                self._roots.append(index)
+            else:
+                self._nodes[parent][side] = index
+            order.append((index, parent))
+
+        for index, parent in reversed(order):
+            if parent is not None:
+                fields[parent] |= fields[index]
+            for field in fields[index]:
+                self._dependents.setdefault(field, []).append(index)
+        for field in fields[self._roots[rule]]:
+            self._field_rules.setdefault(field, []).append(rule)
+        for index, _ in order:
+            self._nodes[index] = tuple(self._nodes[index])
+
+def _whole(node):
+    return lambda record: evaluate_rule(node, record)
+
+def _fields(ast):
+    fields = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node.node_type == 'operand' and isinstance(node.value, dict):
+            fields.add(node.value.get('field'))
+        stack.append(node.left)
+        stack.append(node.right)
+    return fields
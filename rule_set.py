@@ -0,0 +1,226 @@
+from collections import OrderedDict
+
+from rule_engine import Node, _COMPILE_GLOBALS, _balanced_tree, _compile_node, compile_rule, operator_children
+
+def predicate_key(value):
+    """Return a hashable key identifying an operand's (field, operator, value) triple."""
+    field = value['field']
+    op = value['operator']
+    val = value['value']
+    kind = type(val)
+    try:
+        hash(val)
+    except TypeError:
+        val = repr(val)
+    # Keep 1, 1.0 and True apart even though they compare equal.
+    return (field, op, kind, val)
+
+def _check(memo, checks, data, index):
+    """Evaluate predicate index against data and remember the result."""
+    result = memo[index] = checks[index](data)
+    return result
+
+class RuleSet:
+    """A collection of named rules evaluated together against one record.
+
+    Identical operand conditions across rules are interned: every distinct
+    (field, operator, value) triple is stored as a single shared operand Node
+    and evaluated at most once per record, and only if some rule reaches it.
+    The ASTs held by the set share those operand nodes, so they must not be
+    modified in place. Compiled functions are shared by rules of the same
+    shape; the most recently used `max_shapes` of them are kept for rules
+    added later.
+    """
+
+    def __init__(self, rules=None, max_shapes=1024):
+        self._rules = {}  # rule_id -> (ast, compiled shape, predicate indexes)
+        self._operands = []  # predicate index -> shared operand Node (None if free)
+        self._checks = []  # predicate index -> compiled single-operand check
+        self._refcounts = []  # predicate index -> number of rule operands using it
+        self._index = {}  # predicate key -> predicate index
+        self._free = []  # released predicate indexes, reused before growing
+        self._shapes = OrderedDict()  # generated source -> compiled function, least recently used first
+        self.max_shapes = max_shapes
+        for rule_id, ast in (rules.items() if isinstance(rules, dict) else rules or ()):
+            self.add(rule_id, ast)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._rules
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    @property
+    def predicate_count(self):
+        """Number of distinct predicates currently shared by the rules."""
+        return len(self._index)
+
+    def get(self, rule_id):
+        """Return the (interned) AST of a rule, or None if it is not in the set."""
+        entry = self._rules.get(rule_id)
+        return entry[0] if entry else None
+
+    def copy(self):
+        """Return an independent copy that shares operand nodes and compiled code with this set.
+
+        Adding or removing rules in the copy leaves this set untouched, and
+        only the changed rules are compiled.
+        """
+        other = RuleSet.__new__(RuleSet)
+        other._rules = dict(self._rules)
+        other._operands = list(self._operands)
+        other._checks = list(self._checks)
+        other._refcounts = list(self._refcounts)
+        other._index = dict(self._index)
+        other._free = list(self._free)
+        other._shapes = self._shapes
+        other.max_shapes = self.max_shapes
+        return other
+
+    def add(self, rule_id, ast):
+        """Add a rule, replacing any existing rule with the same ID.
+
+        If the new rule can't be compiled, the set is left as it was.
+        """
+        if ast is None:
+            raise ValueError("AST cannot be empty.")
+        # The replacement is built before the old rule lets go of its predicates,
+        # so the ones they share are never released and compiled again.
+        interned = []
+        try:
+            ast = self._intern(ast, interned)
+            entry = (ast,) + self._compile(ast)
+        except Exception:
+            self._release(interned)
+            raise
+        if rule_id in self._rules:
+            self.remove(rule_id)
+        self._rules[rule_id] = entry
+
+    def remove(self, rule_id):
+        """Remove a rule and release predicates no other rule uses."""
+        ast = self._rules.pop(rule_id)[0]
+        self._release([self._index[predicate_key(node.value)] for node in self._operand_nodes(ast)])
+
+    def evaluate(self, data, errors=None, rule_ids=None, limit=None):
+        """Return the IDs of the rules that match data, in insertion order.
+
+        A rule whose evaluation reaches a field missing from data does not
+        match; if an errors dict is given, it receives rule_id -> message for
+        each of those rules. If rule_ids is given, only those rules are
+        evaluated, in that order. With limit, evaluation stops once that many
+        rules have matched.
+        """
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+
+        if rule_ids is None:
+            entries = self._rules.items()
+        else:
+            entries = ((rule_id, self._rules[rule_id]) for rule_id in rule_ids)
+
+        checks = self._checks
+        memo = {}  # predicate index -> result, only for the predicates this record reaches
+        matches = []
+        for rule_id, (_, rule, indexes) in entries:
+            try:
+                if rule(memo, checks, data, indexes):
+                    matches.append(rule_id)
+                    if len(matches) == limit:
+                        break
+            except ValueError as e:
+                if errors is not None:
+                    errors[rule_id] = str(e)
+        return matches
+
+    def evaluate_rule(self, rule_id, data):
+        """Evaluate a single rule of the set, with evaluate_rule semantics."""
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+        _, rule, indexes = self._rules[rule_id]
+        return rule({}, self._checks, data, indexes)
+
+    def _release(self, indexes):
+        """Drop one use of each predicate in indexes, freeing those left unused."""
+        for index in indexes:
+            self._refcounts[index] -= 1
+            if not self._refcounts[index]:
+                del self._index[predicate_key(self._operands[index].value)]
+                self._operands[index] = None
+                self._checks[index] = None
+                self._free.append(index)
+
+    def _intern(self, ast, interned):
+        """Return a copy of ast whose operand nodes are the set's shared nodes.
+
+        The index of every predicate used is appended to interned, so the
+        uses can be released if a later step fails.
+        """
+        if ast is None:
+            return None
+        if ast.node_type == 'operand':
+            key = predicate_key(ast.value)
+            index = self._index.get(key)
+            if index is None:
+                operand = Node('operand', value=dict(ast.value))
+                check = compile_rule(operand)
+                index = self._free.pop() if self._free else len(self._operands)
+                if index == len(self._operands):
+                    self._operands.append(None)
+                    self._checks.append(None)
+                    self._refcounts.append(0)
+                self._operands[index] = operand
+                self._checks[index] = check
+                self._index[key] = index
+            self._refcounts[index] += 1
+            interned.append(index)
+            return self._operands[index]
+        if ast.node_type == 'operator' and ast.value in ('AND', 'OR'):
+            return _balanced_tree(ast.value, [self._intern(child, interned) for child in operator_children(ast)])
+        return Node(ast.node_type, ast.value, self._intern(ast.left, interned), self._intern(ast.right, interned))
+
+    def _compile(self, ast):
+        """Compile an interned AST into (function, predicate indexes).
+
+        The generated function takes (memo, checks, data, indexes) and refers
+        to its predicates by position, so every rule with the same shape (in
+        this set or any copy of it) shares one function and only keeps its own
+        tuple of predicate indexes.
+        """
+        indexes = []
+
+        def compile_operand(value, namespace):
+            indexes.append(self._index[predicate_key(value)])
+            position = len(indexes) - 1
+            return f"(_p if (_p := memo.get(indexes[{position}])) is not None " \
+                   f"else _check(memo, checks, data, indexes[{position}]))"
+
+        namespace = dict(_COMPILE_GLOBALS, _check=_check)
+        source = "def _compiled_rule(memo, checks, data, indexes):\n" \
+                 f"    return {_compile_node(ast, namespace, compile_operand)}\n"
+        function = self._shapes.get(source)
+        if function is None:
+            exec(compile(source, '<rule set>', 'exec'), namespace)
+            function = self._shapes[source] = namespace['_compiled_rule']
+            # Rules already compiled keep their function; an evicted shape is only compiled again for new rules.
+            while len(self._shapes) > self.max_shapes:
+                self._shapes.popitem(last=False)
+        else:
+            self._shapes.move_to_end(source)
+        return function, tuple(indexes)
+
+    @staticmethod
+    def _operand_nodes(ast):
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.node_type == 'operand':
+                yield node
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
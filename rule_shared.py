@@ -0,0 +1,367 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishers in different processes are then not serialized
+    fcntl = None
+
+from rule_bytecode import JUMP_IF_FALSE, JUMP_IF_TRUE, NODE, PREDICATE, ConstantPool, compile_bytecode, run_bytecode
+from rule_engine import Node, reconstruct_ast
+from rule_reload import build_rule, diff_load, diff_update
+
+# Control file: magic, then the published generation (0 while nothing has been published).
+CONTROL_MAGIC = b'RULECTL1'
+_CONTROL = struct.Struct('<8sq')
+
+# Layout file, one per generation, at "<path>.<generation>":
+#   header      magic, generation, the rule, predicate and constant counts, and the offsets of the sections below
+#   rules       per rule: constant index of its ID, start and end of its program in code,
+#               offset and length of its JSON source in blob (5 int64s)
+#   predicates  per distinct comparison: its rule_bytecode opcode, constant indexes of field and value (3 int64s)
+#   constants   per constant: kind, offset and length of its encoding in blob (3 int64s)
+#   code        every program's bytecode as in rule_bytecode (int32s, jump targets relative to the
+#               program), except that comparisons are PREDICATE instructions naming a predicate
+#   blob        the constants' and sources' bytes
+LAYOUT_MAGIC = b'RULESET2'
+_HEADER = struct.Struct('<8sqqqqqqqqq')
+_STR, _INT, _JSON, _NODE = range(4)
+
+def _encode_constant(value):
+    if type(value) is str:
+        return _STR, value.encode('utf-8')
+    if type(value) is int:
+        return _INT, str(value).encode('ascii')
+    if isinstance(value, Node):
+        return _NODE, json.dumps(value.to_dict()).encode('utf-8')
+    return _JSON, json.dumps(value).encode('utf-8')
+
+def _decode_constant(kind, data):
+    if kind == _STR:
+        return data.decode('utf-8')
+    if kind == _INT:
+        return int(data)
+    if kind == _NODE:
+        return reconstruct_ast(json.loads(data))
+    return json.loads(data)
+
+def build_layout(generation, rules):
+    """Return the layout file bytes for rules: (rule_id, JSON-serializable source, program code, constants).
+
+    Programs are rule_bytecode code indexing their own constants. The
+    constants of all of them are pooled, and so are their comparisons: each
+    distinct one becomes a predicate, evaluated at most once per record.
+    """
+    pool = ConstantPool()
+    predicates = {}  # (opcode, field index, value index) -> predicate index
+    table = array('q')
+    code = array('i')
+    sources = bytearray()
+    for rule_id, source, program, constants in rules:
+        if not isinstance(rule_id, str):
+            raise ValueError("Rule IDs must be strings.")
+        start = len(code)
+        for pc in range(0, len(program), 3):
+            opcode, a, b = program[pc], program[pc + 1], program[pc + 2]
+            if opcode == NODE:
+                a = pool.intern(constants[a])
+            elif opcode != JUMP_IF_FALSE and opcode != JUMP_IF_TRUE:
+                key = (opcode, pool.intern(constants[a]), pool.intern(constants[b]))
+                opcode, a, b = PREDICATE, predicates.setdefault(key, len(predicates)), 0
+            code.extend((opcode, a, b))
+        encoded = json.dumps(source).encode('utf-8')
+        table.extend((pool.intern(rule_id), start, len(code), len(sources), len(encoded)))
+        sources += encoded
+
+    predicate_table = array('q')
+    for key in predicates:
+        predicate_table.extend(key)
+    constant_table = array('q')
+    blob = bytearray(sources)
+    for value in pool.constants:
+        kind, encoded = _encode_constant(value)
+        constant_table.extend((kind, len(blob), len(encoded)))
+        blob += encoded
+
+    sections = [table, predicate_table, constant_table, code]
+    offsets = [_HEADER.size]
+    for section in sections:
+        offsets.append(offsets[-1] + len(section) * section.itemsize)
+    header = _HEADER.pack(LAYOUT_MAGIC, generation, len(table) // 5, len(predicates), len(pool), *offsets)
+    return b''.join([header] + [section.tobytes() for section in sections] + [blob])
+
+class _Sources(Mapping):
+    """rule_id -> source of a SharedRuleSetVersion, decoded from the mapping on access."""
+
+    def __init__(self, version):
+        self._version = version
+
+    def __getitem__(self, rule_id):
+        version = self._version
+        base = 5 * version._position(rule_id)
+        start = version._blob + version._table[base + 3]
+        return json.loads(version._map[start:start + version._table[base + 4]])
+
+    def __iter__(self):
+        return iter(self._version.rule_ids)
+
+    def __len__(self):
+        return len(self._version.rule_ids)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._version
+
+class SharedRuleSetVersion:
+    """One published generation of a SharedRuleSet, evaluated straight from its memory-mapped layout.
+
+    Only the constant pool (the distinct fields, values and rule IDs) and
+    the predicate list are decoded into this process; rule code and sources
+    stay in the mapping, whose pages every process attached to the
+    generation shares.
+    """
+
+    __slots__ = ('version', 'rule_ids', '_map', '_table', '_predicate_table', '_predicates', '_code',
+                 '_constants', '_blob', '_positions')
+
+    def __init__(self, mapped=None):
+        if mapped is None:
+            self.version, self.rule_ids, self._map = 0, (), None
+            self._table = self._predicate_table = self._predicates = self._code = self._constants = ()
+            self._blob = 0
+            self._positions = {}
+            return
+
+        magic, generation, rule_count, predicate_count, constant_count, table_offset, predicates_offset, \
+            constants_offset, code_offset, blob_offset = _HEADER.unpack_from(mapped)
+        if magic != LAYOUT_MAGIC:
+            raise ValueError("Not a rule set layout file.")
+        view = memoryview(mapped)
+        self.version = generation
+        self._map = mapped
+        self._table = view[table_offset:predicates_offset].cast('q')
+        self._predicate_table = view[predicates_offset:constants_offset].cast('q')
+        self._code = view[code_offset:blob_offset].cast('i')
+        self._blob = blob_offset
+
+        constant_table = view[constants_offset:code_offset].cast('q')
+        constants = []
+        for index in range(0, 3 * constant_count, 3):
+            start = blob_offset + constant_table[index + 1]
+            constants.append(_decode_constant(constant_table[index], mapped[start:start + constant_table[index + 2]]))
+        constant_table.release()
+        self._constants = constants
+        predicate_table = self._predicate_table
+        self._predicates = [(predicate_table[index], constants[predicate_table[index + 1]],
+                             constants[predicate_table[index + 2]]) for index in range(0, 3 * predicate_count, 3)]
+        self.rule_ids = tuple(constants[self._table[index]] for index in range(0, 5 * rule_count, 5))
+        self._positions = {rule_id: position for position, rule_id in enumerate(self.rule_ids)}
+
+    @property
+    def sources(self):
+        # Made on access rather than kept, so a version is in no reference cycle
+        # and is unmapped as soon as nothing uses it any more.
+        return _Sources(self)
+
+    def __len__(self):
+        return len(self.rule_ids)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._positions
+
+    def _position(self, rule_id):
+        return self._positions[rule_id]
+
+    def close(self):
+        """Unmap the layout. The version must not be used afterwards."""
+        if self._map is not None:
+            for view in (self._table, self._predicate_table, self._code):
+                view.release()
+            self._map.close()
+            self._map = None
+
+    def program(self, rule_id):
+        """Return rule_id's program as rule_bytecode (code, constants), e.g. for decode_bytecode."""
+        base = 5 * self._position(rule_id)
+        code = array('i')
+        shared, predicate_table = self._code, self._predicate_table
+        for pc in range(self._table[base + 1], self._table[base + 2], 3):
+            if shared[pc] == PREDICATE:
+                index = 3 * shared[pc + 1]
+                code.extend(predicate_table[index:index + 3])
+            else:
+                code.extend(shared[pc:pc + 3])
+        return code, self._constants
+
+    def evaluate(self, data, errors=None, rule_ids=None, limit=None):
+        """Return the IDs of the matching rules, as RuleSet.evaluate does."""
+        if not data:
+            raise ValueError("AST or data cannot be empty.")
+
+        table, code, constants, predicates = self._table, self._code, self._constants, self._predicates
+        positions = range(len(self.rule_ids)) if rule_ids is None else map(self._position, rule_ids)
+        memo = {}  # predicate index -> result for this record
+        matches = []
+        for position in positions:
+            base = 5 * position
+            try:
+                result = run_bytecode(code, constants, data, table[base + 1], table[base + 2], predicates, memo)
+            except ValueError as e:
+                if errors is not None:
+                    errors[self.rule_ids[position]] = str(e)
+                continue
+            if result:
+                matches.append(self.rule_ids[position])
+                if len(matches) == limit:
+                    break
+        return matches
+
+class SharedRuleSet:
+    """A rule set published through memory-mapped files, so many processes can evaluate one copy of it.
+
+    Any process can publish a version with update() or load(), which take
+    the same arguments as RuleSetHolder's. The rules are compiled to
+    bytecode and written as one read-only layout file per generation; the
+    generation number in the control file at `path` then moves on to it.
+    Every process maps the layout of the generation it last saw and checks
+    the control file (a read from a mapped page, no system call) whenever
+    `current` is read, attaching to a newer generation when there is one.
+    Processes still evaluating the previous generation keep their mapping
+    until they move on; a superseded generation is unmapped once the last
+    evaluation using it returns. Publishers are serialized by a lock on
+    the control file (on Windows, which has no such lock, only within one
+    process). Sources must be rule strings or serialized ASTs and rule IDs
+    strings, so they can be stored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        self._fd = fd
+        self._publish_lock = threading.Lock()
+        with self._locked():
+            if os.fstat(fd).st_size < _CONTROL.size:
+                self._write_control(_CONTROL.pack(CONTROL_MAGIC, 0), 0)
+        self._control = mmap.mmap(fd, _CONTROL.size, access=mmap.ACCESS_READ)
+        if self._control[:8] != CONTROL_MAGIC:
+            raise ValueError(f"{path} is not a rule set control file.")
+        self._attach_lock = threading.Lock()
+        self._current = SharedRuleSetVersion()
+        self._current = self._attach()
+
+    def published(self):
+        """The generation currently published in the control file."""
+        return _CONTROL.unpack_from(self._control)[1]
+
+    @property
+    def current(self):
+        """The latest published SharedRuleSetVersion, attached to on first use."""
+        version = self._current
+        if version.version != self.published():
+            with self._attach_lock:
+                version = self._current = self._attach()
+        return version
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def evaluate(self, data, errors=None, rule_ids=None):
+        """Evaluate the current version against data and return the IDs of the matching rules."""
+        return self.current.evaluate(data, errors, rule_ids)
+
+    def update(self, add=None, replace=None, remove=None):
+        """Apply a diff and publish the result. Returns the new generation (or the current one if nothing changed)."""
+        with self._locked():
+            base = self.current
+            return self._publish(base, *diff_update(base.sources, add, replace, remove))
+
+    def load(self, rules):
+        """Make rules (a dict of rule ID -> source) the whole set. Returns the new generation."""
+        rules = dict(rules)
+        with self._locked():
+            base = self.current
+            return self._publish(base, *diff_load(base.sources, rules))
+
+    def close(self):
+        version, self._current = self._current, SharedRuleSetVersion()
+        version.close()
+        self._control.close()
+        os.close(self._fd)
+
+    def _attach(self):
+        """Map the layout of the published generation (or keep the current one if it's already that)."""
+        for _ in range(10):
+            generation = self.published()
+            if generation == self._current.version:
+                return self._current
+            if generation == 0:
+                return SharedRuleSetVersion()
+            try:
+                with open(f"{self.path}.{generation}", 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                continue  # Superseded and removed meanwhile; read the generation again
+            return SharedRuleSetVersion(mapped)
+        raise ValueError(f"Could not attach to the rule set at {self.path}.")
+
+    @contextmanager
+    def _locked(self):
+        # flock only excludes other processes (threads share the lock through the
+        # file descriptor), so publishing threads are serialized by a lock of their own.
+        with self._publish_lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _write_control(self, data, offset):
+        """Write data at offset in the control file. Call with the lock held, as it moves the file position."""
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        os.write(self._fd, data)
+
+    def _publish(self, base, changed, removed):
+        """Write the generation after base with changed rules (re)built and removed ones dropped, and publish it."""
+        if not changed and not removed:
+            return base.version
+        for rule_id, source in changed.items():
+            if isinstance(source, Node):
+                changed[rule_id] = source = source.to_dict()
+            if not isinstance(source, (str, dict)):
+                raise ValueError(f"Rule '{rule_id}' must be a rule string or an AST.")
+        programs = {rule_id: compile_bytecode(build_rule(rule_id, source)) for rule_id, source in changed.items()}
+
+        # Unchanged rules keep their compiled code, re-pooled; changed ones move to the end, as in RuleSetHolder.
+        removed = set(removed)
+        rules = []
+        for rule_id in base.rule_ids:
+            if rule_id not in changed and rule_id not in removed:
+                code, constants = base.program(rule_id)
+                rules.append((rule_id, base.sources[rule_id], code, constants))
+        for rule_id, program in programs.items():
+            rules.append((rule_id, changed[rule_id], program.code, program.pool.constants))
+
+        generation = base.version + 1
+        layout = f"{self.path}.{generation}"
+        with open(layout + '.tmp', 'wb') as f:
+            f.write(build_layout(generation, rules))
+        os.replace(layout + '.tmp', layout)
+        self._write_control(_CONTROL.pack(CONTROL_MAGIC, generation)[8:], 8)
+
+        # The generation before stays a moment longer for processes about to attach to it.
+        try:
+            os.remove(f"{self.path}.{generation - 2}")
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            pass  # Windows: still mapped by a process that hasn't moved on
+        return generation
@@ -0,0 +1,171 @@
+import gc
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+
+from rule_engine import Node, create_rule, reconstruct_ast
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    rule_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    rule_text TEXT NOT NULL,
+    ast TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (rule_id, version)
+)
+"""
+
+# Latest version of every rule
+LATEST = """
+SELECT r.rule_id, r.ast FROM rules r
+JOIN (SELECT rule_id, MAX(version) AS version FROM rules GROUP BY rule_id) latest
+  ON r.rule_id = latest.rule_id AND r.version = latest.version
+"""
+
+def encode_ast(ast):
+    """Encode an AST as nested lists: [field, operator, value] for operands and
+    [operator, left, right] for AND/OR nodes. Anything else falls back to Node.to_dict.
+    """
+    if ast.node_type == 'operand' and isinstance(ast.value, dict):
+        return [ast.value['field'], ast.value['operator'], ast.value['value']]
+    if ast.node_type == 'operator' and ast.left and ast.right:
+        return [ast.value, encode_ast(ast.left), encode_ast(ast.right)]
+    return ast.to_dict()
+
+def decode_ast(data):
+    """Rebuild an AST from the output of encode_ast."""
+    if isinstance(data, dict):
+        return reconstruct_ast(data)
+    first, second, third = data
+    if isinstance(second, (list, dict)):
+        return Node('operator', first, decode_ast(second), decode_ast(third))
+    return Node('operand', {'field': first, 'operator': second, 'value': third})
+
+class RuleStore:
+    """SQLite-backed registry of rules, keyed by rule ID and version.
+
+    Each version keeps the original rule text and its parsed AST in a compact
+    JSON form (see encode_ast), so loading rules never has to tokenize or
+    parse again.
+    """
+
+    def __init__(self, path='rules.db'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def save(self, rule_id, rule_string):
+        """Parse and store a new version of a rule. Returns the new version number."""
+        return self.import_rules([(rule_id, rule_string)])[rule_id]
+
+    def import_rules(self, rules):
+        """Parse and store many (rule_id, rule_string) pairs in one transaction.
+
+        Returns a dict of rule_id -> new version. If any rule fails to parse,
+        nothing is stored and a ValueError naming the rule is raised.
+        """
+        rows = []
+        for rule_id, rule_string in rules:
+            try:
+                ast = create_rule(rule_string)
+            except ValueError as e:
+                raise ValueError(f"Rule '{rule_id}': {e}") from e
+            rows.append((rule_id, rule_string, json.dumps(encode_ast(ast), separators=(',', ':'))))
+
+        versions = {}
+        now = time.time()
+        with self._lock, self._conn:
+            current = dict(self._conn.execute("SELECT rule_id, MAX(version) FROM rules GROUP BY rule_id"))
+            records = []
+            for rule_id, rule_string, ast_json in rows:
+                version = versions.get(rule_id, current.get(rule_id, 0)) + 1
+                versions[rule_id] = version
+                records.append((rule_id, version, rule_string, ast_json, now))
+            self._conn.executemany(
+                "INSERT INTO rules (rule_id, version, rule_text, ast, created_at) VALUES (?, ?, ?, ?, ?)",
+                records)
+        return versions
+
+    def get(self, rule_id, version=None):
+        """Return the AST of a rule (latest version by default), or None if unknown."""
+        row = self._fetch_one("ast", rule_id, version)
+        return decode_ast(json.loads(row[0])) if row else None
+
+    def get_text(self, rule_id, version=None):
+        """Return the original rule text of a rule, or None if unknown."""
+        row = self._fetch_one("rule_text", rule_id, version)
+        return row[0] if row else None
+
+    def versions(self, rule_id):
+        """Return the stored version numbers of a rule, oldest first."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT version FROM rules WHERE rule_id = ? ORDER BY version", (rule_id,))
+            return [version for (version,) in cursor]
+
+    def delete(self, rule_id):
+        """Remove every version of a rule."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rules WHERE rule_id = ?", (rule_id,))
+
+    def load_all(self, lazy=True):
+        """Return the latest version of every rule as a mapping of rule_id -> AST.
+
+        With lazy=True only the serialized ASTs are read up front and each one
+        is rebuilt on first access; otherwise every AST is rebuilt immediately.
+        """
+        with self._lock:
+            serialized = dict(self._conn.execute(LATEST))
+        rules = StoredRules(serialized)
+        if not lazy:
+            # Building tens of thousands of small objects triggers the cyclic
+            # GC over and over; none of them can be garbage yet.
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                for rule_id in serialized:
+                    rules[rule_id]
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+        return rules
+
+    def _fetch_one(self, column, rule_id, version):
+        with self._lock:
+            if version is None:
+                cursor = self._conn.execute(
+                    f"SELECT {column} FROM rules WHERE rule_id = ? ORDER BY version DESC LIMIT 1",
+                    (rule_id,))
+            else:
+                cursor = self._conn.execute(
+                    f"SELECT {column} FROM rules WHERE rule_id = ? AND version = ?",
+                    (rule_id, version))
+            return cursor.fetchone()
+
+class StoredRules(Mapping):
+    """Read-only mapping of rule_id -> AST that rebuilds each AST on first access."""
+
+    def __init__(self, serialized):
+        self._serialized = serialized
+        self._asts = {}
+
+    def __getitem__(self, rule_id):
+        ast = self._asts.get(rule_id)
+        if ast is None:
+            ast = decode_ast(json.loads(self._serialized[rule_id]))
+            self._asts[rule_id] = ast
+        return ast
+
+    def __iter__(self):
+        return iter(self._serialized)
+
+    def __len__(self):
+        return len(self._serialized)
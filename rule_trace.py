@@ -0,0 +1,138 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+from rule_engine import _evaluate_operand
+
+def trace_rule(ast, data, clock=time.perf_counter_ns):
+    """Evaluate ast against data like evaluate_rule, recording every node visited.
+
+    Returns a dict with the 'result' (or the 'error' message evaluate_rule
+    would raise), the total 'elapsed_us' and 'nodes': one entry per visited
+    node, in visiting order. Each entry has the node's 'path' from the root
+    ('' for the root, then 'L'/'R' per step), its 'node_type', 'result' or
+    'error' and 'elapsed_us' for its subtree. Operands also record their
+    'field', 'operator', 'constant' and the 'value' seen in data; AND/OR
+    nodes record whether the right side was 'short_circuited'.
+    """
+    if not ast or not data:
+        raise ValueError("AST or data cannot be empty.")
+
+    nodes = []
+    frames = []  # (node, path, entry, start) of the AND/OR nodes above the current one
+    started = clock()
+    node, path = ast, ''
+    while True:
+        entry = {'path': path, 'node_type': node.node_type if node else None}
+        nodes.append(entry)
+        start = clock()
+        if node and node.node_type == 'operator' and node.value in ('AND', 'OR'):
+            entry['operator'] = node.value
+            frames.append((node, path, entry, start))
+            node, path = node.left, path + 'L'
+            continue
+
+        result = error = None
+        try:
+            if not node:
+                raise ValueError("AST or data cannot be empty.")
+            if node.node_type == 'operand':
+                value = node.value
+                entry['field'] = value['field']
+                entry['operator'] = value['operator']
+                entry['constant'] = value['value']
+                entry['value'] = data.get(value['field'])
+                result = _evaluate_operand(value, data)
+            else:
+                result = node.node_type == 'constant' and node.value is True
+            entry['result'] = result
+        except ValueError as e:
+            error = entry['error'] = str(e)
+        entry['elapsed_us'] = (clock() - start) / 1000
+
+        # Climb until a node still needs its right side evaluated.
+        while frames:
+            parent, parent_path, parent_entry, parent_start = frames[-1]
+            if error is None and 'short_circuited' not in parent_entry \
+                    and (parent.value == 'AND') == bool(result):
+                parent_entry['short_circuited'] = False
+                node, path = parent.right, parent_path + 'R'
+                break
+            frames.pop()
+            parent_entry.setdefault('short_circuited', error is None)
+            if error is None:
+                parent_entry['result'] = result
+            else:
+                parent_entry['error'] = error
+            parent_entry['elapsed_us'] = (clock() - parent_start) / 1000
+        else:
+            return {'result': result, 'error': error, 'elapsed_us': (clock() - started) / 1000, 'nodes': nodes}
+
+class Tracer:
+    """Picks evaluations to trace and keeps the latest traces in a ring buffer.
+
+    An evaluation is traced if its rule ID is in `rule_ids`, or as one in
+    every `sample_every` evaluations (0 turns sampling off). While neither is
+    set, `enabled` is False and evaluate() only checks that flag before
+    calling the rule's usual evaluator.
+    """
+
+    def __init__(self, sample_every=0, rule_ids=(), capacity=1000):
+        if capacity < 1:
+            raise ValueError("Trace buffer capacity must be at least 1.")
+        self._traces = deque(maxlen=capacity)  # newest last; the oldest drop out when full
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.sample_every = 0
+        self.rule_ids = frozenset()
+        self.enabled = False
+        self.configure(sample_every, rule_ids)
+
+    def configure(self, sample_every=None, rule_ids=None):
+        """Change the sampling rate and/or the always-traced rule IDs."""
+        if sample_every is not None:
+            if isinstance(sample_every, bool) or not isinstance(sample_every, int) or sample_every < 0:
+                raise ValueError("sample_every must be a non-negative integer.")
+            self.sample_every = sample_every
+        if rule_ids is not None:
+            self.rule_ids = frozenset(rule_ids)
+        self.enabled = bool(self.sample_every or self.rule_ids)
+
+    def sampled(self, rule_id):
+        """Decide whether this evaluation of rule_id is traced."""
+        if rule_id in self.rule_ids:
+            return True
+        return bool(self.sample_every) and next(self._counter) % self.sample_every == 0
+
+    def evaluate(self, rule_id, ast, evaluate, data):
+        """Return evaluate(data), tracing the evaluation through ast instead if it is sampled."""
+        if not self.enabled or not self.sampled(rule_id):
+            return evaluate(data)
+        trace = trace_rule(ast, data)
+        trace['rule_id'] = rule_id
+        trace['timestamp'] = time.time()
+        with self._lock:
+            self._traces.append(trace)
+        if trace['error'] is not None:
+            raise ValueError(trace['error'])
+        return trace['result']
+
+    def tracing(self, rule_id, ast, evaluate):
+        """Wrap an evaluate function so its evaluations are sampled (or return it as is while disabled)."""
+        if not self.enabled:
+            return evaluate
+        return lambda data: self.evaluate(rule_id, ast, evaluate, data)
+
+    def traces(self, rule_id=None, limit=None):
+        """Return the buffered traces, newest first, optionally only those of rule_id."""
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        if rule_id is not None:
+            traces = [trace for trace in traces if trace['rule_id'] == rule_id]
+        return traces[:limit] if limit is not None else traces
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
@@ -0,0 +1,170 @@
+"""Compact binary serialization of rule ASTs.
+
+A frame is:
+
+    version byte (WIRE_VERSION)
+    string table: varint count, then each string as varint length + UTF-8 bytes
+    nodes in preorder, each starting with a tag byte:
+        AND, OR          followed by the left and right nodes
+        OPERAND_STR      varint field, operator and value string indexes
+        OPERAND_INT      varint field and operator string indexes, zigzag varint value
+        NODE             anything else: varint indexes of the JSON-encoded node type and
+                         value, a byte of flags (1: has left, 2: has right),
+                         then the children that are present
+
+A frame is self-delimiting, so other data may follow it (see decode_wire).
+Encoding and decoding use explicit stacks, not recursion.
+"""
+import json
+
+from rule_engine import Node
+
+WIRE_VERSION = 1
+WIRE_MIMETYPE = 'application/x-rule-ast'
+
+AND, OR, OPERAND_STR, OPERAND_INT, NODE = range(5)
+
+_HAS_LEFT = 1
+_HAS_RIGHT = 2
+
+def _write_varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def encode_wire(ast):
+    """Serialize an AST to a binary frame."""
+    if ast is None:
+        raise ValueError("AST cannot be empty.")
+
+    strings = {}
+    nodes = bytearray()
+
+    def string(s):
+        index = strings.get(s)
+        if index is None:
+            index = strings[s] = len(strings)
+        return index
+
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        value = node.value
+        if node.node_type == 'operator' and value in ('AND', 'OR') and node.left and node.right:
+            nodes.append(AND if value == 'AND' else OR)
+            stack.append(node.right)
+            stack.append(node.left)
+            continue
+
+        if node.node_type == 'operand' and type(value) is dict and len(value) == 3:
+            val = value.get('value')
+            if type(val) is str and type(value.get('field')) is str and type(value.get('operator')) is str:
+                nodes.append(OPERAND_STR)
+                _write_varint(nodes, string(value['field']))
+                _write_varint(nodes, string(value['operator']))
+                _write_varint(nodes, string(val))
+                continue
+            if type(val) is int and type(value.get('field')) is str and type(value.get('operator')) is str:
+                nodes.append(OPERAND_INT)
+                _write_varint(nodes, string(value['field']))
+                _write_varint(nodes, string(value['operator']))
+                _write_varint(nodes, val << 1 if val >= 0 else (-val << 1) - 1)
+                continue
+
+        nodes.append(NODE)
+        _write_varint(nodes, string(json.dumps(node.node_type)))
+        _write_varint(nodes, string(json.dumps(value, separators=(',', ':'))))
+        nodes.append((_HAS_LEFT if node.left else 0) | (_HAS_RIGHT if node.right else 0))
+        if node.right:
+            stack.append(node.right)
+        if node.left:
+            stack.append(node.left)
+
+    out = bytearray((WIRE_VERSION,))
+    _write_varint(out, len(strings))
+    for s in strings:
+        encoded = s.encode('utf-8')
+        _write_varint(out, len(encoded))
+        out += encoded
+    out += nodes
+    return bytes(out)
+
+def decode_wire(data, offset=0):
+    """Read a frame from data starting at offset. Returns (ast, offset just past the frame)."""
+    try:
+        return _decode(data, offset)
+    except (IndexError, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Truncated or corrupt rule AST frame.") from None
+
+def _read_varint(data, position):
+    """Return (value, next position) for the varint at position."""
+    n = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, position
+        shift += 7
+
+def _decode(data, offset):
+    if data[offset] != WIRE_VERSION:
+        raise ValueError(f"Unsupported rule AST frame version {data[offset]}.")
+    count, position = _read_varint(data, offset + 1)
+    strings = []
+    for _ in range(count):
+        length, position = _read_varint(data, position)
+        strings.append(str(data[position:position + length], 'utf-8'))
+        position += length
+    one_byte_indexes = count <= 0x80
+
+    root = None
+    pending = []  # (node, 'left' or 'right') still to be filled, next one last
+    while True:
+        tag = data[position]
+        position += 1
+        if tag == AND or tag == OR:
+            node = Node('operator', 'AND' if tag == AND else 'OR')
+            children = _HAS_LEFT | _HAS_RIGHT
+        elif tag == OPERAND_STR or tag == OPERAND_INT:
+            if one_byte_indexes:
+                field, op = strings[data[position]], strings[data[position + 1]]
+                position += 2
+            else:
+                index, position = _read_varint(data, position)
+                field = strings[index]
+                index, position = _read_varint(data, position)
+                op = strings[index]
+            n, position = _read_varint(data, position)
+            if tag == OPERAND_STR:
+                val = strings[n]
+            else:
+                val = n >> 1 if not n & 1 else -((n + 1) >> 1)
+            node = Node('operand', {'field': field, 'operator': op, 'value': val})
+            children = 0
+        elif tag == NODE:
+            index, position = _read_varint(data, position)
+            node_type = json.loads(strings[index])
+            index, position = _read_varint(data, position)
+            node = Node(node_type, json.loads(strings[index]))
+            children = data[position]
+            position += 1
+        else:
+            raise ValueError(f"Invalid node tag {tag} in rule AST frame.")
+
+        if pending:
+            parent, slot = pending.pop()
+            if slot == 'left':
+                parent.left = node
+            else:
+                parent.right = node
+        else:
+            root = node
+        if children & _HAS_RIGHT:
+            pending.append((node, 'right'))
+        if children & _HAS_LEFT:
+            pending.append((node, 'left'))
+        if not pending:
+            return root, position
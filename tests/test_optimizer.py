@@ -0,0 +1,100 @@
+"""Property tests: optimize_rule never changes a rule's results, and constant_value is right.
+
+Random rules and records are generated from fixed seeds, with missing
+fields and values of every type. Run from the repository root with
+`python -m pytest tests` or `python -m unittest discover tests`.
+"""
+import math
+import random
+import unittest
+
+from rule_engine import Node, combine_rules, compile_rule, create_rule, evaluate_rule
+from rule_optimizer import constant_value, optimize_rule
+
+FIELDS = ['a', 'b', 'c']
+CONSTANTS = [0, 1, 2, 3, 5, True, 0.5, 2.5, 3.0, 'x', 'y', 'z', None]
+VALUES = [-1, 0, 1, 2, 3, 4, 5, 6, True, False, 0.5, 2.5, 3.0, math.nan, math.inf, -math.inf,
+          'x', 'y', 'z', 'w', [1], None]
+
+def random_operand(rng):
+    field = rng.choice(FIELDS)
+    kind = rng.random()
+    if kind < 0.85:
+        op, val = rng.choice(['>', '<', '=', '!=', '=', '!=']), rng.choice(CONSTANTS)
+    elif kind < 0.92:
+        op, val = rng.choice(['in', 'not in']), rng.sample(['x', 'y', 'z', 1], rng.randint(0, 3))
+    else:
+        op, val = 'between', [rng.choice([0, 1, 2, 1.5, 2.0]), rng.choice([3, 4, 5, 3.5, 4.0])]
+    return Node('operand', {'field': field, 'operator': op, 'value': val})
+
+def random_rule(rng, depth=3):
+    """A random tree of AND/OR chains, with repeated subtrees and the odd constant."""
+    if depth == 0 or rng.random() < 0.25:
+        return Node('constant', rng.random() < 0.5) if rng.random() < 0.03 else random_operand(rng)
+    children = [random_rule(rng, depth - 1) for _ in range(rng.randint(2, 6))]
+    if rng.random() < 0.2:
+        children.append(rng.choice(children))
+    return combine_rules(children, rng.choice(['AND', 'OR']))
+
+def random_record(rng):
+    record = {field: rng.choice(VALUES) for field in FIELDS if rng.random() < 0.9}
+    record['id'] = 1
+    return record
+
+def outcome(evaluate, ast, record):
+    """(result, None), or (None, error message) if evaluation raises."""
+    try:
+        return evaluate(ast, record), None
+    except ValueError as e:
+        return None, str(e)
+
+class OptimizerEquivalenceTest(unittest.TestCase):
+    RULES = 500
+    RECORDS = 40
+
+    def test_optimized_rules_give_the_same_results_and_errors(self):
+        rng = random.Random(0)
+        for _ in range(self.RULES):
+            ast = random_rule(rng)
+            original = ast.to_dict()
+            optimized = optimize_rule(ast)
+            self.assertEqual(ast.to_dict(), original, "optimize_rule modified its input")
+            compiled = compile_rule(optimized)
+            for _ in range(self.RECORDS):
+                record = random_record(rng)
+                expected = outcome(evaluate_rule, ast, record)
+                self.assertEqual(outcome(evaluate_rule, optimized, record), expected,
+                                 f"{original} -> {optimized.to_dict()} on {record}")
+                self.assertEqual(outcome(lambda _, data: compiled(data), None, record), expected,
+                                 f"compiled {optimized.to_dict()} on {record}")
+
+    def test_constant_value_holds_for_every_record_with_the_fields(self):
+        rng = random.Random(1)
+        constants = 0
+        for _ in range(self.RULES):
+            ast = random_rule(rng)
+            constant = constant_value(optimize_rule(ast))
+            if constant is None:
+                continue
+            constants += 1
+            for _ in range(self.RECORDS):
+                record = random_record(rng)
+                result, error = outcome(evaluate_rule, ast, record)
+                if error is None:
+                    self.assertEqual(result, constant, f"{ast.to_dict()} reported as always {constant} on {record}")
+        self.assertGreater(constants, 0, "no constant rules generated")
+
+    def test_contradictions(self):
+        cases = [
+            ("age > 30 AND age < 20", False),
+            ("age > 30 AND age > 25 AND age < 20", False),
+            ("dept = 'a' AND dept = 'b'", False),
+            ("dept = 'a' OR dept != 'a'", None),  # both False when dept is not a string
+            ("age > 30 AND age < 50", None),
+        ]
+        for rule, constant in cases:
+            with self.subTest(rule=rule):
+                self.assertIs(constant_value(optimize_rule(create_rule(rule))), constant)
+
+if __name__ == '__main__':
+    unittest.main()